@@ -1,33 +1,95 @@
 import argparse
 import glob
 import logging
+import os
 import subprocess
-from collections import defaultdict
-from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple, Type
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 import pkg_resources
 
-from imhotep import http_client
+from imhotep import http_client, metrics, python_tools
 from imhotep.diff_parser import Entry
 from imhotep.http_client import BasicAuthRequester
 from imhotep.repomanagers import RepoManager, ShallowRepoManager
 from imhotep.repositories import Repository
 from imhotep.shas import CommitInfo
 
+from .budget import ReportBudget, Violation, get_severity
+from .configs import ConfigIndex
 from .diff_parser import DiffContextParser
 from .errors import NoCommitInfo, UnknownTools
+from .files import FileIndex, get_extension
+from .filters import (
+    DEFAULT_MAX_FILE_SIZE,
+    DEFAULT_MAX_LINE_LENGTH,
+    FileFilter,
+    PathFilter,
+    parse_tool_globs,
+    split_tool_glob,
+)
+from .graphql import get_pull_request
+from .history import RuntimeHistory, get_sizes
+from .profiling import DEFAULT_PROFILE_DIR, Profiler
+from .remote_tree import RemoteTreeManager, can_lint_without_clone
+from .reporters.comment_store import open_comment_store
 from .reporters.github import CommitReporter, PRReporter, Reporter
 from .reporters.printing import PrintingReporter
+from .reporters.streaming import (
+    REPORT_FORMATS,
+    SarifReporter,
+    get_streaming_reporter,
+)
+from .scheduler import (
+    ResourceScheduler,
+    current_limits,
+    get_tool_key,
+    parse_size,
+    run_limited,
+)
+from .servers import servers
 from .shas import CommitInfo, get_pr_info
 
 log = logging.getLogger(__name__)
 
+# Linter invocations run in parallel by default.
+DEFAULT_JOBS = os.cpu_count() or 1
 
-def run(cmd: str, cwd: str = ".") -> bytes:
+# The directory of the linter invocation running on the current thread, read
+# by `run`.
+job_dirs = threading.local()
+
+
+def run(cmd: str, cwd: Optional[str] = None) -> bytes:
+    """
+    Runs `cmd` in a shell from `cwd`, which defaults to the directory of the
+    linter invocation running on this thread, if there is one.
+    """
+    if cwd is None:
+        cwd = getattr(job_dirs, "cwd", None) or "."
     log.debug("Running: %s", cmd)
-    return subprocess.Popen(
-        [cmd], stdout=subprocess.PIPE, shell=True, cwd=cwd
-    ).communicate()[0]
+    cost = current_limits()
+    with metrics.subprocess_seconds.time():
+        if cost is not None:
+            return run_limited(cmd, cwd, cost)
+        return subprocess.Popen(
+            [cmd], stdout=subprocess.PIPE, shell=True, cwd=cwd
+        ).communicate()[0]
 
 
 def find_config(dirname: str, config_filenames: Set[str]) -> Set[str]:
@@ -37,30 +99,274 @@ def find_config(dirname: str, config_filenames: Set[str]) -> Set[str]:
     return set(configs)
 
 
-def run_analysis(
-    repo: Repository, filenames: List[str] = []
-) -> DefaultDict[str, DefaultDict[str, List[str]]]:
-    results: DefaultDict = defaultdict(lambda: defaultdict(list))
+AnalysisJob = namedtuple("AnalysisJob", ("tool", "root", "filenames", "configs"))
+
+
+def get_tool_extensions(tool) -> Optional[List[str]]:
+    """
+    Returns the extensions `tool` runs against, or None if it can't say, in
+    which case it should be left to find its own files.
+    """
+    try:
+        extensions = list(tool.get_file_extensions())
+    except (AttributeError, NotImplementedError, TypeError):
+        return None
+    return extensions or None
+
+
+def get_tool_configs(tool) -> Set[str]:
+    try:
+        return set(tool.get_configs())
+    except AttributeError:
+        return set()
+
+
+def plan_analysis(
+    repo: Repository,
+    filenames: List[str],
+    file_index: Optional[FileIndex],
+    config_index: Optional[ConfigIndex],
+    path_filter: Optional[PathFilter] = None,
+) -> List[AnalysisJob]:
+    """
+    Works out which linter invocations to make. Each tool gets one
+    invocation per config root its files fall under, so that subprojects
+    with their own configs are linted with them. The path filter decides
+    which of its files each tool sees.
+    """
+    jobs = []
     for tool in repo.tools:
-        log.debug("running %s" % tool.__class__.__name__)
-        configs: Set[str] = set()
-        try:
-            configs = tool.get_configs()
-        except AttributeError:
-            pass
-        configs_found: Set[str] = find_config(repo.dirname, configs)
-        log.debug("Tool configs %s, found configs %s", configs, configs_found)
-        run_results = tool.invoke(
-            repo.dirname, filenames=filenames, linter_configs=configs_found
+        name = tool.__class__.__name__
+        configs = get_tool_configs(tool)
+        tool_filenames = filenames
+        extensions = get_tool_extensions(tool)
+        if extensions is not None:
+            if filenames:
+                wanted = {e.lstrip(".") for e in extensions}
+                tool_filenames = [f for f in filenames if get_extension(f) in wanted]
+            elif file_index is not None:
+                tool_filenames = file_index.matching(extensions)
+            if (filenames or file_index is not None) and not tool_filenames:
+                log.debug("No files for %s", name)
+                continue
+        if path_filter and tool_filenames:
+            tool_filenames = path_filter.filter(tool_filenames, get_tool_key(tool))
+            if not tool_filenames:
+                log.debug("Path filters leave no files for %s", name)
+                continue
+
+        if config_index is None:
+            # Absolute, since the tool runs from the root, not from here.
+            configs_found = {
+                os.path.abspath(c) for c in find_config(repo.dirname, configs)
+            }
+            log.debug("Tool configs %s, found configs %s", configs, configs_found)
+            jobs.append(AnalysisJob(tool, "", tool_filenames, configs_found))
+            continue
+
+        if tool_filenames and configs:
+            partitions = config_index.partition(tool_filenames, configs)
+        else:
+            partitions = {"": tool_filenames}
+        for root, root_filenames in sorted(partitions.items()):
+            _, root_configs = config_index.find(root, configs)
+            configs_found = {
+                os.path.abspath(os.path.join(repo.dirname, c)) for c in root_configs
+            }
+            log.debug(
+                "%s: %d files under '%s', found configs %s",
+                name,
+                len(root_filenames),
+                root,
+                configs_found,
+            )
+            jobs.append(AnalysisJob(tool, root, root_filenames, configs_found))
+    return jobs
+
+
+def run_job(repo: Repository, job: AnalysisJob) -> Dict:
+    """
+    Runs a single linter invocation from the job's config root, returning
+    results keyed by paths relative to the repo root.
+    """
+    log.debug("running %s in '%s'", job.tool.__class__.__name__, job.root)
+    # Linters find some configs relative to where they're run from, so the
+    # commands run from the root too. That makes a relative dirname unsafe.
+    root = os.path.abspath(os.path.join(repo.dirname, job.root))
+    job_dirs.cwd = root
+    try:
+        if not job.root:
+            return job.tool.invoke(
+                root, filenames=job.filenames, linter_configs=job.configs
+            )
+        prefix = len(job.root) + 1
+        run_results = job.tool.invoke(
+            root,
+            filenames=[f[prefix:] for f in job.filenames],
+            linter_configs=job.configs,
         )
+    finally:
+        job_dirs.cwd = None
+    return {f"{job.root}/{fname}": fresults for fname, fresults in run_results.items()}
 
-        for fname, fresults in run_results.items():
-            for lineno, violations in fresults.items():
-                results[fname][lineno].extend(violations)
 
+def run_scheduled(
+    repo: Repository, job: AnalysisJob, scheduler: ResourceScheduler
+) -> Tuple[Dict, float]:
+    """
+    Runs `job` once the scheduler admits it, returning its results and how
+    many seconds it took to run.
+    """
+    with scheduler.admit(job.tool):
+        start = time.monotonic()
+        results = run_job(repo, job)
+        return results, time.monotonic() - start
+
+
+def log_runtimes(
+    planned: List[AnalysisJob], predicted: List[float], actual: List[float]
+) -> None:
+    log.info("Linter runtimes (predicted / actual):")
+    for job, expected, took in zip(planned, predicted, actual):
+        log.info(
+            "  %s '%s' (%d files): %.2fs / %.2fs",
+            get_tool_key(job.tool),
+            job.root,
+            len(job.filenames),
+            expected,
+            took,
+        )
+    log.info("  total: %.2fs / %.2fs", sum(predicted), sum(actual))
+
+
+def run_analysis(
+    repo: Repository,
+    filenames: List[str] = [],
+    cache_directory: Optional[str] = None,
+    jobs: Optional[int] = None,
+    scheduler: Optional[ResourceScheduler] = None,
+    on_results: Optional[Callable[[Dict, List[List[str]]], bool]] = None,
+    path_filter: Optional[PathFilter] = None,
+) -> DefaultDict[str, DefaultDict[str, List[str]]]:
+    """
+    Runs the repo's tools, returning their merged results. If given,
+    `on_results` is called with each invocation's results as it finishes,
+    along with the files of each invocation which hasn't started yet, and
+    can return True to cancel those.
+    """
+    results: DefaultDict = defaultdict(lambda: defaultdict(list))
+    config_index: Optional[ConfigIndex] = None
+    python_tools.warm_up(repo.tools)
+    # Enumerate the checkout once, rather than each tool walking it.
+    file_index = repo.get_file_index()
+    if file_index is not None:
+        all_configs: Set[str] = set()
+        for tool in repo.tools:
+            all_configs.update(get_tool_configs(tool))
+        config_index = ConfigIndex(file_index, all_configs, cache_directory)
+
+    planned = plan_analysis(repo, filenames, file_index, config_index, path_filter)
+    if config_index is not None:
+        config_index.save()
+    if not planned:
+        return results
+
+    if scheduler is None:
+        scheduler = ResourceScheduler()
+    history = RuntimeHistory(cache_directory, repo.name)
+    scheduler.expect(history.get_peak_memory())
+    sizes = [get_sizes(repo.dirname, job.filenames) for job in planned]
+    predicted = [
+        history.predict(get_tool_key(job.tool), job.filenames, job_sizes)
+        for job, job_sizes in zip(planned, sizes)
+    ]
+    # Start the longest jobs first, so a slow one isn't left running alone
+    # at the end.
+    order = sorted(range(len(planned)), key=lambda i: predicted[i], reverse=True)
+
+    with ThreadPoolExecutor(
+        max_workers=min(jobs or DEFAULT_JOBS, len(planned))
+    ) as pool:
+        futures = {
+            i: pool.submit(run_scheduled, repo, planned[i], scheduler) for i in order
+        }
+        if on_results is not None:
+            for future in as_completed(futures.values()):
+                pending = [
+                    planned[i].filenames
+                    for i, f in futures.items()
+                    if not f.running() and not f.done()
+                ]
+                if on_results(future.result()[0], pending):
+                    cancelled = sum(f.cancel() for f in futures.values())
+                    log.info("Stopping early; cancelled %d linter runs.", cancelled)
+                    break
+        ran, predicted_ran, actual = [], [], []
+        # Merge in plan order, so results don't depend on scheduling.
+        for i, job in enumerate(planned):
+            if futures[i].cancelled():
+                continue
+            run_results, seconds = futures[i].result()
+            ran.append(job)
+            predicted_ran.append(predicted[i])
+            actual.append(seconds)
+            history.record(get_tool_key(job.tool), job.filenames, sizes[i], seconds)
+            found = 0
+            for fname, fresults in run_results.items():
+                for lineno, violations in fresults.items():
+                    results[fname][lineno].extend(violations)
+                    found += len(violations)
+            metrics.tool_violations.inc(found, tool=get_tool_key(job.tool))
+
+    for key, peak in scheduler.observed.items():
+        history.record_memory(key, peak)
+    history.save()
+    log_runtimes(ran, predicted_ran, actual)
     return results
 
 
+def parse_line_range(lineno: str) -> Tuple[int, int]:
+    """
+    Parses a result's line number, which may be a span like "10-14".
+    """
+    start, _, end = str(lineno).partition("-")
+    return int(start), int(end or start)
+
+
+def find_violations(
+    entries: Dict[str, Entry], results: Dict, file_violations: bool = False
+) -> Iterator[Violation]:
+    """
+    Yields the violations in `results` which touch lines the diff added.
+    Spans are placed at the first added line they overlap, merging with any
+    other results there. With `file_violations`, those on the "magic" line
+    0, which represents file-level results, are placed at the file's first
+    added line.
+    """
+    for fname, fresults in results.items():
+        entry = entries.get(fname)
+        if entry is None:
+            continue
+        found: Dict[int, List[str]] = {}
+        for lineno, messages in fresults.items():
+            start, end = parse_line_range(lineno)
+            if start == 0 and file_violations:
+                line: Optional[int] = 0
+            else:
+                line = entry.first_added_in(start, end)
+            if line is None:
+                continue
+            if isinstance(messages, str):
+                messages = [messages]
+            found.setdefault(line, []).extend(messages)
+        for line, messages in sorted(found.items()):
+            if line == 0:
+                position = entry.first_added_position()
+            else:
+                position = entry.position_for(line)
+            yield Violation(get_severity(messages), fname, line, position, messages)
+
+
 def load_plugins() -> List:
     tools = []
     for ep in pkg_resources.iter_entry_points(group="imhotep_linters"):
@@ -86,6 +392,24 @@ class Imhotep:
         github_domain: Optional[str] = None,
         report_file_violations: bool = False,
         dir_override: Optional[str] = None,
+        cache_directory: Optional[str] = None,
+        jobs: Optional[int] = None,
+        cpu_budget: Optional[int] = None,
+        memory_budget: Optional[int] = None,
+        review_comments: Optional[List[Dict[str, Any]]] = None,
+        line_comments: bool = False,
+        report_format: str = "text",
+        report_file: Optional[str] = None,
+        metrics_file: Optional[str] = None,
+        profile_cpu: bool = False,
+        profile_memory: bool = False,
+        profile_dir: str = DEFAULT_PROFILE_DIR,
+        max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+        max_line_length: int = DEFAULT_MAX_LINE_LENGTH,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        tool_include: Union[None, Dict[str, List[str]], List[str]] = None,
+        tool_exclude: Union[None, Dict[str, List[str]], List[str]] = None,
         **kwargs,
     ) -> None:
         # TODO(justinabrahms): kwargs exist until we handle cli params better
@@ -107,12 +431,34 @@ class Imhotep:
         self.github_domain = github_domain
         self.report_file_violations = report_file_violations
         self.dir_override = dir_override
+        self.cache_directory = cache_directory
+        self.jobs = jobs
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.review_comments = review_comments
+        self.line_comments = line_comments
+        self.report_format = report_format
+        self.report_file = report_file
+        self.metrics_file = metrics_file
+        self.profile_cpu = profile_cpu
+        self.profile_memory = profile_memory
+        self.profile_dir = profile_dir
+        self.max_file_size = max_file_size
+        self.max_line_length = max_line_length
+        self.path_filter = PathFilter(
+            include or [],
+            exclude or [],
+            parse_tool_globs(tool_include),
+            parse_tool_globs(tool_exclude),
+        )
 
         if self.commit is None and self.pr_number is None:
             raise NoCommitInfo()
 
     def get_reporter(self) -> Reporter:
         if self.no_post:
+            if self.report_format in ("jsonl", "sarif"):
+                return get_streaming_reporter(self.report_format, self.report_file)
             return PrintingReporter()
         if self.pr_number:
             if self.requester is None:
@@ -130,9 +476,20 @@ class Imhotep:
                     "PR number specified, but repo_name is missing. Default to printing reporter."
                 )
                 return PrintingReporter()
-            return PRReporter(
-                self.requester, self.github_domain, self.repo_name, self.pr_number
+            store = None
+            if self.cache_directory:
+                store = open_comment_store(self.cache_directory)
+            reporter = PRReporter(
+                self.requester,
+                self.github_domain,
+                self.repo_name,
+                self.pr_number,
+                store=store,
+                line_comments=self.line_comments,
             )
+            if self.review_comments is not None:
+                reporter.set_comments(self.review_comments)
+            return reporter
         elif self.commit is not None:
             return CommitReporter(self.requester, self.github_domain, self.repo_name)
         log.warn("Default to printing reporter.")
@@ -164,69 +521,124 @@ class Imhotep:
             log.error("Commit info is missing.")
             return
 
+        profiler = Profiler(self.profile_dir, self.profile_cpu, self.profile_memory)
         try:
-            repo = self.manager.clone_repo(
-                self.repo_name,
-                remote_repo=cinfo.remote_repo,
-                ref=cinfo.ref,
-            )
-            diff = repo.diff_commit(cinfo.commit, compare_point=cinfo.origin)
+            with profiler.phase("clone"):
+                repo = self.manager.clone_repo(
+                    self.repo_name,
+                    remote_repo=cinfo.remote_repo,
+                    ref=cinfo.ref,
+                    commits=[cinfo.origin, cinfo.commit],
+                    pr_number=self.pr_number,
+                )
+            if isinstance(reporter, PRReporter):
+                reporter.is_ancestor = repo.is_ancestor
+                reporter.dirname = repo.dirname
+            elif isinstance(reporter, SarifReporter):
+                reporter.dirname = repo.dirname
+                reporter.repository_uri = f"https://{repo.domain}/{repo.name}"
+                reporter.revision = cinfo.origin
+            with profiler.phase("diff"):
+                diff = repo.diff_commit(cinfo.commit, compare_point=cinfo.origin)
 
             # Move out to its own thing
-            parser = DiffContextParser(diff)
-            parse_results = parser.parse()
-            filenames = self.get_filenames(parse_results, self.requested_filenames)
-            results = run_analysis(repo, filenames=filenames)
-
-            error_count = 0
-            for entry in parse_results:
-                added_lines: List[int] = [l.number for l in entry.added_lines]
-                if not entry.added_lines:
-                    continue
-                pos_map: Dict[int, int] = {
-                    0: min(l.position for l in entry.added_lines)
+            with profiler.phase("parse"):
+                parser = DiffContextParser(diff)
+                parse_results = parser.parse()
+                metrics.diff_files.inc(len(parse_results))
+                metrics.diff_bytes.inc(len(diff))
+                lintable = FileFilter(
+                    repo.dirname, self.max_file_size, self.max_line_length
+                ).filter(parse_results)
+                filenames = self.get_filenames(lintable, self.requested_filenames)
+                entries = {
+                    entry.result_filename: entry
+                    for entry in lintable
+                    if entry.added_lines
                 }
-                for x in entry.added_lines:
-                    pos_map[x.number] = x.position
-
-                if self.report_file_violations:
-                    # "magic" value of line 0 represents file-level results.
-                    added_lines.append(0)
-
-                violations: Dict[str, List[str]] = results.get(
-                    entry.result_filename, {}
+            budget = ReportBudget(max_errors)
+            stopped = False
+
+            def on_results(job_results: Dict, pending: List[List[str]]) -> bool:
+                nonlocal stopped
+                stopped = budget.watch(
+                    list(
+                        find_violations(
+                            entries, job_results, self.report_file_violations
+                        )
+                    ),
+                    pending,
                 )
-                violating_lines: List[int] = [int(l) for l in violations.keys()]
+                return stopped
+
+            with profiler.phase("analysis"):
+                if parse_results and not lintable:
+                    # No filenames would mean linting the whole tree.
+                    log.info("Skipped every changed file; nothing to lint.")
+                    results: Dict = {}
+                else:
+                    results = run_analysis(
+                        repo,
+                        filenames=filenames,
+                        cache_directory=self.cache_directory,
+                        jobs=self.jobs,
+                        scheduler=ResourceScheduler(
+                            self.cpu_budget, self.memory_budget
+                        ),
+                        on_results=on_results if max_errors < float("inf") else None,
+                        path_filter=self.path_filter,
+                    )
 
-                matching_numbers = set(added_lines).intersection(violating_lines)
-                for i in matching_numbers:
-                    error_count += 1
-                    if error_count > max_errors:
-                        continue
+            with profiler.phase("report"):
+                for violation in budget.select(
+                    find_violations(entries, results, self.report_file_violations)
+                ):
                     reporter.report_line(
                         cinfo.origin,
-                        entry.result_filename,
-                        x,
-                        pos_map[i],
-                        violations[f"{i}"],
+                        violation.filename,
+                        violation.line,
+                        violation.position,
+                        violation.messages,
                     )
-                if error_count > max_errors and hasattr(reporter, "post_comment"):
+                if budget.exceeded and hasattr(reporter, "post_comment"):
                     reporter.post_comment(  # type: ignore
-                        "There were too many ({error_count}) linting errors to"
-                        " continue.".format(error_count=error_count)
+                        "There were too many ({error_count}{more}) linting errors"
+                        " to continue.".format(
+                            error_count=budget.count, more="+" if stopped else ""
+                        )
                     )
-                log.info("%d violations.", error_count)
+            metrics.matched_violations.inc(budget.count)
+            log.info("%d violations.", budget.count)
         finally:
+            reporter.close()
+            servers.shutdown()
             self.manager.cleanup()
+            http_cache = getattr(self.requester, "cache", None)
+            if isinstance(http_cache, http_client.ResponseCache):
+                http_cache.save()
+            if self.metrics_file:
+                metrics.registry.write(self.metrics_file)
+            profiler.close()
 
 
 def gen_imhotep(**kwargs) -> Imhotep:
     # TODO(justinabrahms): Interface should have a "are creds valid?" method
+    http_cache = None
+    if kwargs["cache_directory"]:
+        http_cache = http_client.ResponseCache(kwargs["cache_directory"])
     req = http_client.BasicAuthRequester(
-        kwargs["github_username"], kwargs["github_password"]
+        kwargs["github_username"], kwargs["github_password"], cache=http_cache
     )
 
-    plugins = load_plugins()
+    if kwargs.get("metrics_file"):
+        # Measurements which cost something are only taken when wanted.
+        metrics.registry.enabled = True
+
+    if kwargs.get("zygote_socket"):
+        python_tools.use_zygote(kwargs["zygote_socket"])
+
+    # Callers embedding imhotep, like the benchmark, can supply their own.
+    plugins = kwargs.get("plugins") or load_plugins()
     tools = get_tools(kwargs["linter"], plugins)
 
     Manager: Optional[Type[RepoManager]] = None
@@ -236,16 +648,30 @@ def gen_imhotep(**kwargs) -> Imhotep:
         Manager = RepoManager
     assert Manager is not None
     domain = kwargs["github_domain"]
-    manager = Manager(
+    manager_kwargs = dict(
         authenticated=kwargs["authenticated"],
         cache_directory=kwargs["cache_directory"],
         tools=tools,
         executor=run,
         domain=domain,
         dir_override=kwargs.get("dir_override"),
+        cache_max_size=kwargs.get("cache_max_size"),
     )
+    if kwargs.get("clone_free") and use_clone_free(kwargs["pr_number"], tools):
+        manager: RepoManager = RemoteTreeManager(req, **manager_kwargs)
+    else:
+        manager = Manager(**manager_kwargs)
 
-    if kwargs["pr_number"]:
+    review_comments = None
+    if kwargs["pr_number"] and kwargs.get("graphql"):
+        pr_data = get_pull_request(
+            req, kwargs["repo_name"], kwargs["pr_number"], domain
+        )
+        commit_info = pr_data.pr_info.to_commit_info()
+        review_comments = pr_data.comments
+        if isinstance(manager, RemoteTreeManager):
+            manager.changed_files = pr_data.pr_info.changed_files
+    elif kwargs["pr_number"]:
         pr_info = get_pr_info(req, kwargs["repo_name"], kwargs["pr_number"], domain)
         commit_info = pr_info.to_commit_info()
     else:
@@ -261,10 +687,29 @@ def gen_imhotep(**kwargs) -> Imhotep:
         commit_info=commit_info,
         shallow_clone=shallow_clone,
         domain=domain,
+        review_comments=review_comments,
         **kwargs,
     )
 
 
+def use_clone_free(pr_number: Optional[str], tools: List) -> bool:
+    """
+    Returns whether this run can skip cloning, logging why if it can't.
+    """
+    if not pr_number:
+        log.warning("--clone-free only works on pull requests; cloning instead.")
+        return False
+    if not can_lint_without_clone(tools):
+        needy = [
+            t.__class__.__name__
+            for t in tools
+            if getattr(t, "requires_full_tree", True)
+        ]
+        log.info("Cloning, since %s need the whole tree.", ", ".join(needy))
+        return False
+    return True
+
+
 def get_tools(whitelist: List[str], known_plugins: List) -> List:
     """
     Filter all known plugins by a whitelist specified. If the whitelist is
@@ -283,6 +728,14 @@ def get_tools(whitelist: List[str], known_plugins: List) -> List:
     return tools
 
 
+def tool_glob(value: str) -> str:
+    try:
+        split_tool_glob(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
 def parse_args(args: List[str]) -> argparse.Namespace:
     arg_parser = argparse.ArgumentParser(
         description="Posts static analysis results to github."
@@ -340,6 +793,12 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         type=str,
         required=False,
     )
+    arg_parser.add_argument(
+        "--cache-max-size",
+        help="Disk space the cache directory may use, e.g. '20G'. Least recently used repos are removed first.",
+        type=parse_size,
+        required=False,
+    )
     arg_parser.add_argument(
         "--linter",
         help="Path to linters to run, e.g. 'imhotep.tools:PyLint'",
@@ -365,5 +824,104 @@ def parse_args(args: List[str]) -> argparse.Namespace:
         "--dir-override",
         help="Override the full path to the local repository.",
     )
+    arg_parser.add_argument(
+        "--jobs",
+        help="Number of linter invocations to run in parallel. Defaults to the number of CPUs.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--cpu-budget",
+        help="CPUs linters may keep busy at once. Defaults to the number of CPUs.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--memory-budget",
+        help="Memory linters may use at once, e.g. '8G'. Defaults to the available memory.",
+        type=parse_size,
+    )
+    arg_parser.add_argument(
+        "--zygote-socket",
+        help="Unix socket of a running `python -m imhotep.zygote` to run Python API linters in.",
+    )
+    arg_parser.add_argument(
+        "--graphql",
+        help="Fetch the pull request and our existing comments on it with one paginated GraphQL query.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--clone-free",
+        help="Lint a pull request by fetching only the files it changes, without cloning. Used only when every linter can run on single files.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--line-comments",
+        help="Place PR comments by file line and side rather than by diff position.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--report-format",
+        help="With --no-post, how to write violations: 'text' to print them, or one record per violation as 'jsonl' or 'sarif'.",
+        choices=REPORT_FORMATS,
+        default="text",
+    )
+    arg_parser.add_argument(
+        "--report-file",
+        help="File or pipe to write jsonl or sarif reports to. Defaults to stdout.",
+    )
+    arg_parser.add_argument(
+        "--metrics-file",
+        help="Write counters and timings for the run to this file, in the OpenMetrics text format.",
+    )
+    arg_parser.add_argument(
+        "--include",
+        nargs="+",
+        help="Only lint paths matching these globs, e.g. 'src/**'.",
+    )
+    arg_parser.add_argument(
+        "--exclude",
+        nargs="+",
+        help="Don't lint paths matching these globs, e.g. '**/migrations/**'.",
+    )
+    arg_parser.add_argument(
+        "--tool-include",
+        nargs="+",
+        metavar="TOOL=GLOB",
+        type=tool_glob,
+        help="Only lint paths matching GLOB with TOOL, named as for --linter.",
+    )
+    arg_parser.add_argument(
+        "--tool-exclude",
+        nargs="+",
+        metavar="TOOL=GLOB",
+        type=tool_glob,
+        help="Don't lint paths matching GLOB with TOOL, named as for --linter.",
+    )
+    arg_parser.add_argument(
+        "--max-file-size",
+        help="Don't lint changed files bigger than this, e.g. '2M'.",
+        type=parse_size,
+        default=DEFAULT_MAX_FILE_SIZE,
+    )
+    arg_parser.add_argument(
+        "--max-line-length",
+        help="Don't lint changed files adding a line longer than this, which are likely generated or minified.",
+        type=int,
+        default=DEFAULT_MAX_LINE_LENGTH,
+    )
+    arg_parser.add_argument(
+        "--profile-cpu",
+        action="store_true",
+        help="Profile each phase of the run with cProfile, writing <phase>.pstats files to --profile-dir.",
+    )
+    arg_parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Trace each phase's memory use with tracemalloc, writing <phase>-memory.txt reports to --profile-dir.",
+    )
+    arg_parser.add_argument(
+        "--profile-dir",
+        help="Directory to write profiles to.",
+        default=DEFAULT_PROFILE_DIR,
+    )
     # parse out repo name
     return arg_parser.parse_args(args)
@@ -1,27 +1,37 @@
 import json
+import os
+import threading
 from collections import namedtuple
 from unittest import mock
 
 from imhotep.main import load_config
 from imhotep.testing_utils import Requester, fixture_path
 
+from . import metrics
 from .app import (
+    AnalysisJob,
     Imhotep,
     NoCommitInfo,
     UnknownTools,
     find_config,
+    find_violations,
     gen_imhotep,
     get_tools,
     load_plugins,
     run,
     run_analysis,
+    run_job,
 )
-from .diff_parser import Entry
+from .budget import ReportBudget
+from .diff_parser import DiffContextParser, Entry
+from .filters import PathFilter
+from .history import RuntimeHistory
 from .repomanagers import RepoManager
 from .reporters.github import CommitReporter, PRReporter
 from .reporters.printing import PrintingReporter
 from .repositories import Repository, ToolsNotFound
-from .tools import Tool
+from .scheduler import ResourceScheduler
+from .tools import Tool, ToolCost
 
 repo_name = "justinabrahms/imhotep"
 
@@ -302,6 +312,85 @@ def test_invoke__reports_errors():
     assert not reporter.post_comment.called
 
 
+def test_invoke__writes_metrics(tmp_path):
+    with open("imhotep/fixtures/two-block.diff") as f:
+        two_block = bytes(f.read(), "utf-8")
+    reporter = mock.create_autospec(PRReporter)
+    manager = mock.create_autospec(RepoManager)
+    tool = mock.create_autospec(Tool)
+    tool.get_configs.side_effect = AttributeError
+    tool.invoke.return_value = {"imhotep/diff_parser_test.py": {"13": ["an error"]}}
+    manager.clone_repo.return_value.diff_commit.return_value = two_block
+    manager.clone_repo.return_value.tools = [tool]
+    metrics_file = tmp_path / "metrics.txt"
+    diff_bytes = metrics.diff_bytes.get()
+
+    imhotep = Imhotep(
+        pr_number=1,
+        repo_manager=manager,
+        commit_info=mock.Mock(),
+        repo_name="repo_name",
+        metrics_file=str(metrics_file),
+    )
+    imhotep.invoke(reporter=reporter)
+
+    assert len(two_block) == metrics.diff_bytes.get() - diff_bytes
+    written = metrics_file.read_text()
+    assert "imhotep_matched_violations_total" in written
+    assert written.endswith("# EOF\n")
+
+
+def test_invoke__profiles_phases(tmp_path):
+    with open("imhotep/fixtures/two-block.diff") as f:
+        two_block = bytes(f.read(), "utf-8")
+    reporter = mock.create_autospec(PRReporter)
+    manager = mock.create_autospec(RepoManager)
+    tool = mock.create_autospec(Tool)
+    tool.get_configs.side_effect = AttributeError
+    tool.invoke.return_value = {"imhotep/diff_parser_test.py": {"13": ["an error"]}}
+    manager.clone_repo.return_value.diff_commit.return_value = two_block
+    manager.clone_repo.return_value.tools = [tool]
+
+    imhotep = Imhotep(
+        pr_number=1,
+        repo_manager=manager,
+        commit_info=mock.Mock(),
+        repo_name="repo_name",
+        profile_cpu=True,
+        profile_dir=str(tmp_path),
+    )
+    imhotep.invoke(reporter=reporter)
+
+    assert {
+        "clone.pstats",
+        "diff.pstats",
+        "parse.pstats",
+        "analysis.pstats",
+        "report.pstats",
+    } == {p.name for p in tmp_path.iterdir()}
+
+
+def test_invoke__skips_filtered_files():
+    diff = b"diff --git a/a.png b/a.png\nBinary files a/a.png and b/a.png differ\n"
+    reporter = mock.create_autospec(PRReporter)
+    manager = mock.create_autospec(RepoManager)
+    tool = mock.create_autospec(Tool)
+    manager.clone_repo.return_value.diff_commit.return_value = diff
+    manager.clone_repo.return_value.tools = [tool]
+
+    imhotep = Imhotep(
+        pr_number=1,
+        repo_manager=manager,
+        commit_info=mock.Mock(),
+        repo_name="repo_name",
+    )
+    imhotep.invoke(reporter=reporter)
+
+    # Rather than linting the whole tree for want of filenames.
+    assert not tool.invoke.called
+    assert not reporter.report_line.called
+
+
 def test_invoke__skips_empty_files():
     with open("imhotep/fixtures/deleted_file.diff") as f:
         deleted_file = bytes(f.read(), "utf-8")
@@ -356,7 +445,9 @@ def test_invoke__triggers_max_errors():
     imhotep.invoke(reporter=reporter, max_errors=2)
 
     assert reporter.report_line.call_count == 2
-    assert reporter.post_comment.called
+    assert reporter.post_comment.call_count == 1
+    reported = [c[0][1:3] for c in reporter.report_line.call_args_list]
+    assert [("f1.txt", 1), ("f1.txt", 2)] == reported
 
 
 def test_invoke__reports_file_errors():
@@ -397,3 +488,307 @@ def test_invoke__reports_file_errors():
 
     assert not reporter.report_line.called
     assert not reporter.post_comment.called
+
+
+def test_run_analysis__uses_git_file_index():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\ta.py\0" b"0 b 0\tb.js\0" b"0 c 0\tc.py\0"
+    tool = mock.Mock()
+    tool.get_file_extensions.return_value = [".py"]
+    tool.get_configs.return_value = set()
+    tool.invoke.return_value = {}
+    repo = Repository("name", "/loc", [tool], executor)
+    run_analysis(repo)
+
+    tool.invoke.assert_called_with(
+        "/loc", filenames=["a.py", "c.py"], linter_configs=set()
+    )
+
+
+def test_run_analysis__skips_tools_without_indexed_files():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\ta.py\0"
+    tool = mock.Mock()
+    tool.get_file_extensions.return_value = [".js"]
+    tool.get_configs.return_value = set()
+    repo = Repository("name", "/loc", [tool], executor)
+    run_analysis(repo)
+
+    assert not tool.invoke.called
+
+
+def test_run_analysis__filenames_override_index():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\ta.py\0" b"0 b 0\tb.py\0"
+    tool = mock.Mock()
+    tool.get_configs.return_value = set()
+    tool.invoke.return_value = {}
+    repo = Repository("name", "/loc", [tool], executor)
+    run_analysis(repo, filenames=["a.py"])
+
+    tool.invoke.assert_called_with("/loc", filenames=["a.py"], linter_configs=set())
+
+
+def test_run_analysis__path_filters():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\ta.py\0" b"0 b 0\tmigrations/b.py\0"
+    tool = mock.Mock()
+    tool.get_file_extensions.return_value = [".py"]
+    tool.get_configs.return_value = set()
+    tool.invoke.return_value = {}
+    repo = Repository("name", "/loc", [tool], executor)
+    run_analysis(repo, path_filter=PathFilter(exclude=["**/migrations/**"]))
+
+    tool.invoke.assert_called_with("/loc", filenames=["a.py"], linter_configs=set())
+
+
+def test_run_analysis__path_filters_leave_nothing():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\ta.py\0"
+    tool = mock.Mock()
+    tool.get_file_extensions.side_effect = NotImplementedError
+    tool.get_configs.return_value = set()
+    repo = Repository("name", "/loc", [tool], executor)
+    path_filter = PathFilter(tool_exclude={"unittest.mock:Mock": ["*.py"]})
+    run_analysis(repo, filenames=["a.py"], path_filter=path_filter)
+
+    assert not tool.invoke.called
+
+
+def test_run_analysis__finds_root_configs_in_index():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\tsetup.cfg\0" b"0 b 0\tsub/setup.cfg\0"
+    tool = mock.Mock()
+    tool.get_configs.return_value = {"setup.cfg"}
+    tool.invoke.return_value = {}
+    repo = Repository("name", "/loc", [tool], executor)
+    run_analysis(repo, filenames=["a.py"])
+
+    tool.invoke.assert_called_with(
+        "/loc", filenames=["a.py"], linter_configs={"/loc/setup.cfg"}
+    )
+
+
+def test_run_analysis__one_invocation_per_config_root():
+    executor = mock.Mock()
+    executor.return_value = (
+        b"0 a 0\tsetup.cfg\0"
+        b"0 b 0\tapp.py\0"
+        b"0 c 0\tapi/setup.cfg\0"
+        b"0 d 0\tapi/views.py\0"
+    )
+    tool = mock.Mock()
+    tool.get_file_extensions.return_value = [".py"]
+    tool.get_configs.return_value = {"setup.cfg"}
+    tool.invoke.side_effect = lambda dirname, filenames, linter_configs: {
+        filenames[0]: {"1": [dirname]}
+    }
+    repo = Repository("name", "/loc", [tool], executor)
+    results = run_analysis(repo)
+
+    assert tool.invoke.call_count == 2
+    tool.invoke.assert_any_call(
+        "/loc", filenames=["app.py"], linter_configs={"/loc/setup.cfg"}
+    )
+    tool.invoke.assert_any_call(
+        "/loc/api", filenames=["views.py"], linter_configs={"/loc/api/setup.cfg"}
+    )
+    assert results["app.py"]["1"] == ["/loc"]
+    assert results["api/views.py"]["1"] == ["/loc/api"]
+
+
+def test_run_analysis__no_partitions_without_configs():
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\tapi/setup.cfg\0" b"0 b 0\tapi/views.py\0"
+    tool = mock.Mock()
+    tool.get_file_extensions.return_value = [".py"]
+    tool.get_configs.return_value = set()
+    tool.invoke.return_value = {}
+    repo = Repository("name", "/loc", [tool], executor)
+    run_analysis(repo)
+
+    tool.invoke.assert_called_once_with(
+        "/loc", filenames=["api/views.py"], linter_configs=set()
+    )
+
+
+def test_run_analysis__config_paths_absolute_for_relative_dirname(tmpdir):
+    executor = mock.Mock()
+    executor.return_value = b"0 a 0\tapi/setup.cfg\0" b"0 b 0\tapi/views.py\0"
+    tool = mock.Mock()
+    tool.get_file_extensions.return_value = [".py"]
+    tool.get_configs.return_value = {"setup.cfg"}
+    tool.invoke.return_value = {}
+    repo = Repository("name", "relt", [tool], executor)
+    with tmpdir.as_cwd():
+        run_analysis(repo)
+
+    tool.invoke.assert_called_once_with(
+        str(tmpdir.join("relt", "api")),
+        filenames=["views.py"],
+        linter_configs={str(tmpdir.join("relt", "api", "setup.cfg"))},
+    )
+
+
+def test_run_job__runs_from_config_root(tmpdir):
+    tmpdir.mkdir("api")
+    tool = mock.Mock()
+    tool.invoke.side_effect = lambda dirname, filenames, linter_configs: {
+        filenames[0]: {"1": [run("pwd").decode().strip()]}
+    }
+    repo = Repository("name", str(tmpdir), [tool], None)
+    results = run_job(repo, AnalysisJob(tool, "api", ["api/views.py"], set()))
+
+    (cwd,) = results["api/views.py"]["1"]
+    assert os.path.realpath(str(tmpdir.join("api"))) == os.path.realpath(cwd)
+    assert os.path.realpath(".") == os.path.realpath(run("pwd").decode().strip())
+
+
+def test_run__applies_scheduler_limits():
+    scheduler = ResourceScheduler(cpus=1, memory=1024)
+    with scheduler.admit(mock.Mock()):
+        with mock.patch("imhotep.app.run_limited") as limited:
+            run("test")
+    limited.assert_called_with("test", ".", ToolCost())
+
+
+class SlowTool(Tool):
+    pass
+
+
+class FastTool(Tool):
+    pass
+
+
+def test_run_analysis__longest_job_first(tmpdir):
+    history = RuntimeHistory(str(tmpdir), "name")
+    history.record("imhotep.app_test:SlowTool", ["a.py"], [10], 60.0)
+    history.record("imhotep.app_test:FastTool", ["a.py"], [10], 1.0)
+    history.save()
+
+    order = []
+    fast = FastTool(None)
+    slow = SlowTool(None)
+    for tool in (fast, slow):
+        tool.invoke = mock.Mock(
+            side_effect=lambda *a, tool=tool, **k: order.append(tool) or {}
+        )
+    repo = Repository("name", str(tmpdir), [fast, slow], None)
+    run_analysis(repo, filenames=["a.py"], cache_directory=str(tmpdir), jobs=1)
+
+    assert order == [slow, fast]
+    recorded = RuntimeHistory(str(tmpdir), "name").tools["imhotep.app_test:FastTool"]
+    assert recorded["files"]["a.py"] < 1.0
+
+
+def test_run_analysis__remembers_peak_memory(tmpdir):
+    tool = FastTool(None)
+    allocate = "python3 -c 'x = bytearray(30 * 1024 * 1024)'"
+    tool.invoke = mock.Mock(side_effect=lambda *a, **k: (run(allocate), {})[1])
+    repo = Repository("name", str(tmpdir), [tool], None)
+    run_analysis(repo, filenames=["a.py"], cache_directory=str(tmpdir))
+
+    peak = RuntimeHistory(str(tmpdir), "name").get_peak_memory()[
+        "imhotep.app_test:FastTool"
+    ]
+    assert peak > 30 * 1024 * 1024
+    scheduler = ResourceScheduler(cpus=1, memory=1024**4)
+    tool.invoke.side_effect = lambda *a, **k: {}
+    run_analysis(
+        repo, filenames=["a.py"], cache_directory=str(tmpdir), scheduler=scheduler
+    )
+    assert scheduler.get_cost(tool).memory == peak
+
+
+def test_run_analysis__stops_early():
+    stopped = threading.Event()
+
+    def make_tool(line, wait=False):
+        tool = mock.Mock()
+        tool.get_file_extensions.return_value = [".py"]
+        tool.get_configs.return_value = set()
+
+        def invoke(*args, **kwargs):
+            if wait:
+                stopped.wait(5)
+            return {"a.py": {line: ["error"]}}
+
+        tool.invoke.side_effect = invoke
+        return tool
+
+    tools = [make_tool("1"), make_tool("2", wait=True), make_tool("3")]
+    repo = Repository("name", "/loc", tools, None)
+    with mock.patch("imhotep.app.log") as log:
+        # The second tool holds the only worker until we've stopped.
+        log.info.side_effect = lambda *args: stopped.set()
+        results = run_analysis(repo, ["a.py"], jobs=1, on_results=lambda r, p: True)
+
+    assert tools[0].invoke.called
+    assert sum(t.invoke.call_count for t in tools) < 3
+    assert len(results["a.py"]) < 3
+
+
+def test_run_analysis__runs_pending_job_which_could_outrank():
+    diff = "".join(
+        "diff --git a/{0} b/{0}\n--- a/{0}\n+++ b/{0}\n@@ -0,0 +1,2 @@\n+x\n+y\n".format(
+            name
+        )
+        for name in ("a.pyi", "b.py")
+    )
+    entries = {e.result_filename: e for e in DiffContextParser(diff).parse()}
+    decided = threading.Event()
+
+    def make_tool(extension, results, wait=False):
+        tool = mock.Mock()
+        tool.get_file_extensions.return_value = [extension]
+        tool.get_configs.return_value = set()
+
+        def invoke(*args, **kwargs):
+            if wait:
+                decided.wait(5)
+            return results
+
+        tool.invoke.side_effect = invoke
+        return tool
+
+    errors = {"b.py": {"1": ["E101 error"], "2": ["E101 error"]}}
+    tools = [
+        make_tool(".py", errors),
+        # Holds the only worker until the first results are judged, so the
+        # last job is still waiting to start then.
+        make_tool(".py", {}, wait=True),
+        make_tool(".pyi", {"a.pyi": {"1": ["E101 error"]}}),
+    ]
+    budget = ReportBudget(1)
+
+    def on_results(results, pending):
+        settled = budget.watch(list(find_violations(entries, results)), pending)
+        decided.set()
+        return settled
+
+    repo = Repository("name", "/loc", tools, None)
+    results = run_analysis(repo, ["a.pyi", "b.py"], jobs=1, on_results=on_results)
+
+    assert tools[2].invoke.called
+    for violation in find_violations(entries, results):
+        budget.offer(violation)
+    assert [("a.pyi", 1)] == [(v.filename, v.line) for v in budget.top()]
+
+
+def test_find_violations__spans_and_merging():
+    with open("imhotep/fixtures/two-block.diff") as f:
+        (entry,) = DiffContextParser(f.read()).parse()
+    # The second run of added lines.
+    first = sorted(x.number for x in entry.added_lines)[1]
+    results = {
+        entry.result_filename: {
+            f"{first - 3}-{first + 1}": ["too complex"],
+            str(first): "line too long",
+            f"3-{first - 1}": ["untouched"],
+        }
+    }
+
+    (violation,) = find_violations({entry.result_filename: entry}, results)
+    assert first == violation.line
+    assert entry.position_for(first) == violation.position
+    assert ["too complex", "line too long"] == violation.messages
@@ -0,0 +1,474 @@
+"""
+End-to-end load benchmark. Generates a git repository and pull request
+locally, serves a fake GitHub API for it, and runs imhotep against them
+through `gen_imhotep` and `invoke`, reporting wall time, API calls and peak
+RSS. Nothing touches the real GitHub.
+
+GitHub URLs are redirected without changing imhotep: git is pointed at the
+local repositories with `url.<base>.insteadOf`, and API requests go through
+an HTTPS proxy which answers them itself, with a throwaway self-signed
+certificate.
+
+  python -m imhotep.benchmark --files 2000 --changed-files 200 --latency 0.05
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import resource
+import shutil
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import mkdtemp
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import app
+from .metrics import get_endpoint
+from .tools import Tool
+
+log = logging.getLogger(__name__)
+
+DOMAIN = "github.bench"
+OWNER = "bench"
+FORK_OWNER = "forker"
+REPO = "synthetic"
+PR_NUMBER = "1"
+MARKER = "synthetic-violation"
+
+Scenario = namedtuple(
+    "Scenario",
+    (
+        "files",
+        "lines_per_file",
+        "changed_files",
+        "added_lines",
+        "violation_every",
+        "fork",
+        "latency",
+        "rate_limit",
+    ),
+    defaults=(100, 50, 10, 20, 5, False, 0.0, None),
+)
+
+SyntheticPR = namedtuple("SyntheticPR", ("remote_dir", "base_sha", "head_sha"))
+
+
+class MarkerLinter(Tool):
+    """
+    Reports every line containing `MARKER`, which the generator plants in
+    the lines it adds. It runs grep, so linting still costs a subprocess.
+    """
+
+    file_extensions = [".py"]
+    requires_full_tree = False
+    response_format = re.compile(r"^(?P<filename>[^:]+):(?P<line>\d+):(?P<message>.*)$")
+
+    def get_command(self, dirname, linter_configs=set()):
+        return f"grep -Hn {MARKER}"
+
+
+def git(cwd: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def write_lines(path: str, lines: List[str], mode: str = "w") -> None:
+    with open(path, mode) as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def make_pull_request(work_dir: str, scenario: Scenario) -> SyntheticPR:
+    """
+    Creates bare repositories under `<work_dir>/remote/<owner>/<repo>.git`
+    laid out as GitHub would have them: the base branch in the upstream
+    repository, the head branch in it or in a fork, and the PR's head at
+    `refs/pull/<n>/head` upstream.
+    """
+    remote_dir = os.path.join(work_dir, "remote")
+    upstream = os.path.join(remote_dir, OWNER, f"{REPO}.git")
+    fork = os.path.join(remote_dir, FORK_OWNER, f"{REPO}.git")
+    bare = [upstream, fork] if scenario.fork else [upstream]
+    for path in bare:
+        os.makedirs(path)
+        git(path, "init", "--bare", "-q")
+        git(path, "symbolic-ref", "HEAD", "refs/heads/main")
+        # imhotep fetches the base and head commits by sha.
+        git(path, "config", "uploadpack.allowAnySHA1InWant", "true")
+
+    checkout = os.path.join(work_dir, "checkout")
+    os.makedirs(checkout)
+    git(checkout, "init", "-q", "-b", "main")
+    git(checkout, "config", "user.name", "Benchmark")
+    git(checkout, "config", "user.email", "bench@example.com")
+    for i in range(scenario.files):
+        directory = os.path.join(checkout, f"pkg{i % 10}")
+        os.makedirs(directory, exist_ok=True)
+        write_lines(
+            os.path.join(directory, f"module{i}.py"),
+            [f"value_{n} = {n}" for n in range(scenario.lines_per_file)],
+        )
+    git(checkout, "add", "-A")
+    git(checkout, "commit", "-q", "-m", "Base")
+    base_sha = git(checkout, "rev-parse", "HEAD")
+
+    git(checkout, "switch", "-q", "-c", "feature")
+    for i in range(min(scenario.changed_files, scenario.files)):
+        write_lines(
+            os.path.join(checkout, f"pkg{i % 10}", f"module{i}.py"),
+            [
+                f"added_{n} = {n}"
+                + (f"  # {MARKER}" if n % scenario.violation_every == 0 else "")
+                for n in range(scenario.added_lines)
+            ],
+            mode="a",
+        )
+    git(checkout, "commit", "-q", "-am", "Feature")
+    head_sha = git(checkout, "rev-parse", "HEAD")
+
+    git(checkout, "push", "-q", upstream, "main", f"feature:refs/pull/{PR_NUMBER}/head")
+    git(checkout, "push", "-q", bare[-1], "feature")
+    shutil.rmtree(checkout)
+    return SyntheticPR(remote_dir, base_sha, head_sha)
+
+
+def pull_request_json(pr: SyntheticPR, fork: bool) -> Dict[str, Any]:
+    def repo(owner: str) -> Dict[str, Any]:
+        return {
+            "owner": {"login": owner},
+            "clone_url": f"https://{DOMAIN}/{owner}/{REPO}.git",
+        }
+
+    return {
+        "number": int(PR_NUMBER),
+        "base": {"sha": pr.base_sha, "ref": "main", "repo": repo(OWNER)},
+        "head": {
+            "sha": pr.head_sha,
+            "ref": "feature",
+            "repo": repo(FORK_OWNER if fork else OWNER),
+        },
+    }
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """
+    Answers the REST calls imhotep makes, for both github.com's and GitHub
+    Enterprise's URL layouts. Requests arrive through CONNECT tunnels.
+    """
+
+    server: "FakeGitHub"
+
+    def do_CONNECT(self):
+        self.send_response(200, "Connection established")
+        self.end_headers()
+        self.connection = self.server.tls.wrap_socket(self.connection, server_side=True)
+        self.rfile = self.connection.makefile("rb", self.rbufsize)
+        self.wfile = self.connection.makefile("wb")
+        self.close_connection = False
+
+    def do_GET(self):
+        self.answer("GET")
+
+    def do_POST(self):
+        self.answer("POST")
+
+    def do_DELETE(self):
+        self.answer("DELETE")
+
+    def answer(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, payload, remaining = self.server.route(method, self.path, body)
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if remaining is not None:
+            self.send_header("X-RateLimit-Remaining", str(remaining))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    """
+    A local stand-in for GitHub's API which records the calls made to it,
+    optionally delaying each one by `latency` seconds and refusing all but
+    the first `rate_limit` as rate limited.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        pull_request: Dict[str, Any],
+        tls: ssl.SSLContext,
+        latency: float = 0.0,
+        rate_limit: Optional[int] = None,
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), FakeGitHubHandler)
+        self.pull_request = pull_request
+        self.tls = tls
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.calls: List[Tuple[str, str, int]] = []
+        self.comments: List[Dict[str, Any]] = []
+
+    @property
+    def proxy_url(self) -> str:
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def route(
+        self, method: str, path: str, body: bytes
+    ) -> Tuple[int, Any, Optional[int]]:
+        if self.latency:
+            time.sleep(self.latency)
+        endpoint = get_endpoint(path)
+        with self.lock:
+            remaining = None
+            if self.rate_limit is not None:
+                remaining = max(0, self.rate_limit - len(self.calls) - 1)
+                if len(self.calls) >= self.rate_limit:
+                    self.calls.append((method, endpoint, 403))
+                    return 403, {"message": "API rate limit exceeded"}, 0
+            status, payload = self.respond(method, endpoint, body)
+            self.calls.append((method, endpoint, status))
+            return status, payload, remaining
+
+    def respond(self, method: str, endpoint: str, body: bytes) -> Tuple[int, Any]:
+        if endpoint == "/repos/{owner}/{repo}/pulls/{number}" and method == "GET":
+            return 200, self.pull_request
+        if endpoint.endswith("/comments"):
+            if method == "GET":
+                return 200, self.comments
+            if method == "POST":
+                comment = json.loads(body or b"{}")
+                comment["user"] = {"login": OWNER}
+                comment.setdefault("position", None)
+                comment.setdefault("path", None)
+                self.comments.append(comment)
+                return 201, comment
+        return 404, {"message": "Not Found"}
+
+    def __enter__(self) -> "FakeGitHub":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def make_certificate(work_dir: str) -> Tuple[str, ssl.SSLContext]:
+    """
+    Creates a self-signed certificate for the fake GitHub's hostnames,
+    returning its path (for clients to trust) and a server context using it.
+    """
+    cert = os.path.join(work_dir, "cert.pem")
+    key = os.path.join(work_dir, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            f"/CN={DOMAIN}",
+            "-addext",
+            f"subjectAltName=DNS:{DOMAIN},DNS:api.{DOMAIN}",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return cert, context
+
+
+@contextmanager
+def environment(values: Dict[str, str]) -> Iterator[None]:
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def redirect_github(remote_dir: str, proxy_url: str, cert: str) -> Dict[str, str]:
+    """
+    The environment sending imhotep's git remotes to `remote_dir` and its
+    API requests to the fake GitHub.
+    """
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": f"url.file://{remote_dir}/.insteadOf",
+        "GIT_CONFIG_VALUE_0": f"https://{DOMAIN}/",
+        "GIT_TERMINAL_PROMPT": "0",
+        "HTTPS_PROXY": proxy_url,
+        "https_proxy": proxy_url,
+        "NO_PROXY": "",
+        "no_proxy": "",
+        "REQUESTS_CA_BUNDLE": cert,
+    }
+
+
+def peak_rss() -> Dict[str, int]:
+    """
+    Peak resident set sizes in KiB, of this process and of the largest
+    subprocess it waited for. Both are peaks over the process's lifetime.
+    """
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS reports bytes
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    }
+
+
+def run_scenario(
+    scenario: Scenario, imhotep_args: List[str] = [], keep: bool = False
+) -> Dict[str, Any]:
+    """
+    Runs imhotep once against a freshly generated pull request, returning
+    what it cost.
+    """
+    work_dir = mkdtemp(prefix="imhotep-benchmark-")
+    try:
+        setup_start = time.monotonic()
+        pr = make_pull_request(work_dir, scenario)
+        cert, tls = make_certificate(work_dir)
+        setup_seconds = time.monotonic() - setup_start
+
+        github = FakeGitHub(
+            pull_request_json(pr, scenario.fork),
+            tls,
+            latency=scenario.latency,
+            rate_limit=scenario.rate_limit,
+        )
+        with github, environment(
+            redirect_github(pr.remote_dir, github.proxy_url, cert)
+        ):
+            args = app.parse_args(
+                [
+                    "--repo_name",
+                    f"{OWNER}/{REPO}",
+                    "--pr-number",
+                    PR_NUMBER,
+                    "--github-domain",
+                    DOMAIN,
+                    "--github-username",
+                    OWNER,
+                    "--github-password",
+                    "password",
+                ]
+                + imhotep_args
+            )
+            start = time.monotonic()
+            imhotep = app.gen_imhotep(plugins=[MarkerLinter(app.run)], **vars(args))
+            imhotep.invoke()
+            wall_seconds = time.monotonic() - start
+
+        calls = Counter(f"{method} {endpoint}" for method, endpoint, _ in github.calls)
+        return {
+            "scenario": scenario._asdict(),
+            "setup_seconds": round(setup_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "api_calls": len(github.calls),
+            "api_calls_by_endpoint": dict(sorted(calls.items())),
+            "rate_limited_calls": sum(1 for c in github.calls if c[2] == 403),
+            "comments_posted": len(github.comments),
+            "peak_rss_kib": peak_rss(),
+        }
+    finally:
+        if keep:
+            log.info("Kept %s", work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks imhotep against a synthetic pull request and a fake GitHub.",
+        epilog="Arguments after '--' are passed on to imhotep, e.g. -- --shallow.",
+    )
+    defaults = Scenario()
+    parser.add_argument("--files", type=int, default=defaults.files)
+    parser.add_argument("--lines-per-file", type=int, default=defaults.lines_per_file)
+    parser.add_argument("--changed-files", type=int, default=defaults.changed_files)
+    parser.add_argument(
+        "--added-lines",
+        type=int,
+        default=defaults.added_lines,
+        help="Lines added to each changed file.",
+    )
+    parser.add_argument(
+        "--violation-every",
+        type=int,
+        default=defaults.violation_every,
+        help="Make every Nth added line a violation.",
+    )
+    parser.add_argument("--fork", action="store_true", help="Open the PR from a fork.")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=defaults.latency,
+        help="Seconds the fake GitHub waits before answering each request.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=defaults.rate_limit,
+        help="Requests the fake GitHub answers before rate limiting the rest.",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the generated repositories."
+    )
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument("imhotep_args", nargs=argparse.REMAINDER)
+    return parser.parse_args(args)
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    scenario = Scenario(
+        args.files,
+        args.lines_per_file,
+        args.changed_files,
+        args.added_lines,
+        args.violation_every,
+        args.fork,
+        args.latency,
+        args.rate_limit,
+    )
+    imhotep_args = [a for a in args.imhotep_args if a != "--"]
+    for _ in range(args.repeat):
+        print(json.dumps(run_scenario(scenario, imhotep_args, args.keep)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import shutil
+
+import pytest
+
+from .benchmark import Scenario, run_scenario
+
+requires_tools = pytest.mark.skipif(
+    not shutil.which("openssl") or not shutil.which("git"),
+    reason="the benchmark needs git and openssl",
+)
+
+
+@requires_tools
+def test_run_scenario():
+    result = run_scenario(
+        Scenario(files=12, changed_files=3, added_lines=4, violation_every=3)
+    )
+
+    # Lines 0 and 3 of those added to each changed file are violations.
+    assert 6 == result["comments_posted"]
+    assert {
+        "GET /repos/{owner}/{repo}/pulls/{number}": 1,
+        "GET /repos/{owner}/{repo}/pulls/{number}/comments": 1,
+        "POST /repos/{owner}/{repo}/pulls/{number}/comments": 6,
+    } == result["api_calls_by_endpoint"]
+    assert result["peak_rss_kib"]["self"] > 0
+
+
+@requires_tools
+def test_run_scenario__fork_and_rate_limit():
+    result = run_scenario(
+        Scenario(
+            files=4,
+            changed_files=2,
+            added_lines=4,
+            violation_every=3,
+            fork=True,
+            rate_limit=3,
+        ),
+        ["--shallow"],
+    )
+
+    # The PR, its comments, then one of the four violations gets posted.
+    assert 6 == result["api_calls"]
+    assert 3 == result["rate_limited_calls"]
+    assert 1 == result["comments_posted"]
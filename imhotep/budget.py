@@ -0,0 +1,136 @@
+"""
+Picks which violations to report when there are more than we're allowed to
+post, keeping the most important ones.
+"""
+
+import heapq
+import re
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+Violation = namedtuple(
+    "Violation", ("severity", "filename", "line", "position", "messages")
+)
+
+# Linters don't report severities in a common form, so they're guessed from
+# the messages: errors (including pycodestyle/pyflakes-style E and F codes)
+# outrank warnings, which outrank everything else.
+SEVERITY_PATTERNS = [
+    (2, re.compile(r"\berror\b|\b[EF]\d{3}\b", re.IGNORECASE)),
+    (1, re.compile(r"\bwarning\b|\bW\d{3}\b", re.IGNORECASE)),
+]
+MAX_SEVERITY = 2
+
+
+def get_severity(messages: Union[str, Sequence[str]]) -> int:
+    if isinstance(messages, str):
+        messages = [messages]
+    severity = 0
+    for message in messages:
+        for level, pattern in SEVERITY_PATTERNS:
+            if level > severity and pattern.search(message):
+                severity = level
+    return severity
+
+
+def importance(violation: Violation) -> Tuple[int, str, int]:
+    """
+    Sort key putting the most important violations first: by severity, then
+    file, then line.
+    """
+    return (-violation.severity, violation.filename, violation.line)
+
+
+class Ranked:
+    """
+    Heap entry which sorts the least important violation first, so it's the
+    one dropped when a more important one turns up.
+    """
+
+    def __init__(self, violation: Violation) -> None:
+        self.violation = violation
+        self.key = importance(violation)
+
+    def __lt__(self, other: "Ranked") -> bool:
+        return self.key > other.key
+
+
+class ReportBudget:
+    """
+    Keeps the `limit` most important violations offered to it, and counts
+    the rest.
+
+    While linters are still running, `watch` is fed the violations each one
+    finds and the files the linters yet to start will look at, and says when
+    the budget is settled. Violations rank by severity, then file, then
+    line, so it's settled once more than `limit` violations of the highest
+    severity are in, and the `limit` first of them all come before any file
+    still to be linted. Nothing still to come could then make the cut, so
+    the remaining linters needn't run.
+    """
+
+    def __init__(self, limit: float = float("inf")) -> None:
+        self.limit = limit
+        self.count = 0
+        self.heap: List[Ranked] = []
+        self.severest: Dict[Tuple[str, int], int] = {}
+        # (filename, line) of each violation of the highest severity.
+        self.severe: List[Tuple[str, int]] = []
+
+    @property
+    def exceeded(self) -> bool:
+        return self.count > self.limit
+
+    def offer(self, violation: Violation) -> None:
+        self.count += 1
+        ranked = Ranked(violation)
+        if len(self.heap) < self.limit:
+            heapq.heappush(self.heap, ranked)
+        elif self.heap and self.heap[0] < ranked:
+            heapq.heapreplace(self.heap, ranked)
+
+    def top(self) -> List[Violation]:
+        return sorted((r.violation for r in self.heap), key=importance)
+
+    def select(self, violations: Iterable[Violation]) -> Iterator[Violation]:
+        """
+        Yields the violations to report, counting them all. Without a limit
+        there's nothing to rank, so each is passed on as soon as it's found
+        rather than all being held until the end.
+        """
+        if self.limit == float("inf"):
+            for violation in violations:
+                self.count += 1
+                yield violation
+            return
+        for violation in violations:
+            self.offer(violation)
+        yield from self.top()
+
+    def watch(
+        self,
+        violations: Sequence[Violation],
+        pending: Iterable[Sequence[str]] = (),
+    ) -> bool:
+        """
+        Notes violations found so far, returning whether the budget is
+        settled. `pending` has the files of each linter run yet to start,
+        where an empty list means it finds its own, so could report on any.
+        """
+        for v in violations:
+            key = (v.filename, v.line)
+            previous = self.severest.get(key, 0)
+            if v.severity > previous:
+                self.severest[key] = v.severity
+                if v.severity == MAX_SEVERITY:
+                    self.severe.append(key)
+        if len(self.severe) <= self.limit:
+            return False
+        if self.limit < 1:
+            return True
+        last_filename, _ = heapq.nsmallest(int(self.limit), self.severe)[-1]
+        for filenames in pending:
+            # One of its violations might sort before the cut, at any line.
+            if not filenames or min(filenames) <= last_filename:
+                return False
+        return True
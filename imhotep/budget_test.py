@@ -0,0 +1,81 @@
+from .budget import ReportBudget, Violation, get_severity
+
+
+def violation(filename, line, severity=0):
+    return Violation(severity, filename, line, line, ["message"])
+
+
+def test_get_severity():
+    assert 2 == get_severity(["E501 line too long", "W291 trailing whitespace"])
+    assert 1 == get_severity("warning: unused variable")
+    assert 0 == get_severity(["line too long"])
+
+
+def test_keeps_most_important():
+    budget = ReportBudget(2)
+    for v in [
+        violation("b.py", 1),
+        violation("a.py", 9, severity=1),
+        violation("a.py", 3),
+        violation("c.py", 1, severity=2),
+    ]:
+        budget.offer(v)
+
+    assert [("c.py", 1), ("a.py", 9)] == [(v.filename, v.line) for v in budget.top()]
+    assert 4 == budget.count
+    assert budget.exceeded
+
+
+def test_unlimited_keeps_everything_in_order():
+    budget = ReportBudget()
+    for v in [violation("b.py", 1), violation("a.py", 3), violation("a.py", 2)]:
+        budget.offer(v)
+
+    assert [("a.py", 2), ("a.py", 3), ("b.py", 1)] == [
+        (v.filename, v.line) for v in budget.top()
+    ]
+    assert not budget.exceeded
+
+
+def test_select_streams_without_a_limit():
+    budget = ReportBudget()
+    found = []
+
+    def violations():
+        for v in [violation("b.py", 1), violation("a.py", 3)]:
+            found.append(v)
+            yield v
+
+    selected = budget.select(violations())
+    assert ("b.py", 1) == next(selected)[1:3]
+    # Passed on before the next one was even found.
+    assert 1 == len(found)
+    assert [("a.py", 3)] == [v[1:3] for v in selected]
+    assert 2 == budget.count
+    assert [] == budget.heap
+
+
+def test_select_ranks_with_a_limit():
+    budget = ReportBudget(1)
+    selected = budget.select([violation("b.py", 1), violation("a.py", 3)])
+    assert [("a.py", 3)] == [v[1:3] for v in selected]
+    assert budget.exceeded
+
+
+def test_settled_once_enough_severe_violations():
+    budget = ReportBudget(1)
+    assert not budget.watch([violation("a.py", 1, severity=2), violation("a.py", 2)])
+    # The same line again doesn't count twice.
+    assert not budget.watch([violation("a.py", 1, severity=2)])
+    assert budget.watch([violation("b.py", 1, severity=2)])
+
+
+def test_not_settled_while_pending_files_could_outrank():
+    budget = ReportBudget(1)
+    severe = [violation("b.py", 1, severity=2), violation("b.py", 2, severity=2)]
+    # A linter yet to run on a.py could find a more important error there.
+    assert not budget.watch(severe, pending=[["c.py", "a.py"]])
+    assert not budget.watch([], pending=[["b.py"]])
+    # Nor can we tell with a linter which finds its own files.
+    assert not budget.watch([], pending=[[]])
+    assert budget.watch([], pending=[["c.py"], ["d.py"]])
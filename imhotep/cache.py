@@ -0,0 +1,326 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+METADATA_FILENAME = "imhotep-repos.json"
+LOCK_FILENAME = "imhotep-repos.lock"
+TRASH_MARKER = ".imhotep-deleting-"
+LEASE_SUFFIX = ".imhotep-lease"
+
+# Bare mirrors live in this subdirectory of the cache directory.
+MIRRORS_DIRNAME = "mirrors"
+
+
+def remove_in_background(path: str) -> None:
+    """
+    Moves `path` out of the way and deletes it in a detached process, so the
+    caller doesn't wait on a large checkout being removed.
+    """
+    path = path.rstrip("/")
+    trash = f"{path}{TRASH_MARKER}{uuid.uuid4().hex}"
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        log.warning("Couldn't move %s aside (%s); removing it in place", path, e)
+        trash = path
+    delete_detached(trash)
+
+
+def delete_detached(path: str) -> None:
+    log.debug("Removing %s in the background", path)
+    subprocess.Popen(
+        ["rm", "-rf", path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def load_json(path: str, description: str) -> Any:
+    """
+    Returns what's stored in the JSON file at `path`, or None if there's
+    nothing there we can read.
+    """
+    try:
+        with open(path) as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        log.warning("Could not read %s %s", description, path)
+        return None
+
+
+def save_json(path: str, data: Any, description: str) -> bool:
+    """
+    Stores `data` as JSON at `path`, returning whether it could. The file is
+    written beside `path` and renamed over it, so concurrent runs never read
+    half of one.
+    """
+    text = json.dumps(data)
+    tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        log.warning("Could not write %s %s", description, path)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def get_size(path: str) -> int:
+    """
+    Returns the disk space used under `path`, in bytes.
+    """
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_blocks * 512
+                except OSError:
+                    continue
+    return total
+
+
+class RepoCache:
+    """
+    Keeps the repos in a cache directory within a disk budget, evicting the
+    least recently used ones first.
+
+    Access times and sizes are recorded in a metadata file in the cache
+    directory, guarded by a lock file so that concurrent runs sharing the
+    cache don't trample each other. Each run only measures the repos it
+    used, so eviction doesn't need to walk every checkout.
+
+    A run holds a lease on each repo it uses, from before it clones or
+    updates it until `release`, so that other runs sharing the cache don't
+    evict it from under it. Measuring and evicting happen after the run, in
+    a detached process.
+
+    A repo's checkout and the bare mirror it borrows objects from count as
+    one entry: they're measured together and evicted together, since the
+    checkout can't outlive the mirror.
+    """
+
+    def __init__(self, directory: str, max_size: Optional[int] = None) -> None:
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.leases: Dict[str, IO] = {}
+
+    @property
+    def metadata_path(self) -> str:
+        return os.path.join(self.directory, METADATA_FILENAME)
+
+    @contextmanager
+    def locked(self) -> Iterator[Dict[str, Dict]]:
+        """
+        Yields the repo metadata, writing back any changes on exit. Failing
+        to keep the books shouldn't fail a run, so errors are only logged.
+        """
+        try:
+            lock = open(os.path.join(self.directory, LOCK_FILENAME), "w")
+        except OSError as e:
+            log.warning("Could not lock repo cache metadata: %s", e)
+            yield {}
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            repos = self.read()
+            yield repos
+            save_json(self.metadata_path, repos, "repo cache metadata")
+
+    def read(self) -> Dict[str, Dict]:
+        return load_json(self.metadata_path, "repo cache metadata") or {}
+
+    def paths(self, name: str) -> List[str]:
+        """
+        Returns the checkout and mirror directories of the repo `name`.
+        """
+        return [
+            os.path.join(self.directory, name),
+            os.path.join(self.directory, MIRRORS_DIRNAME, name + ".git"),
+        ]
+
+    def measure(self, name: str) -> int:
+        return sum(get_size(path) for path in self.paths(name))
+
+    def lease_path(self, name: str) -> str:
+        return os.path.join(self.directory, name + LEASE_SUFFIX)
+
+    def lease(self, name: str) -> None:
+        """
+        Takes a shared lock marking `name` as in use. The lock goes when we
+        release it or our process dies, whichever comes first.
+        """
+        if name in self.leases:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            lease = open(self.lease_path(name), "w")
+        except OSError as e:
+            log.warning("Could not lease %s in the repo cache: %s", name, e)
+            return
+        fcntl.flock(lease, fcntl.LOCK_SH)
+        self.leases[name] = lease
+
+    def is_leased(self, name: str) -> bool:
+        try:
+            lease = open(self.lease_path(name))
+        except OSError:
+            return False
+        with lease:
+            try:
+                fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+        return False
+
+    def touch(self, dirname: str) -> None:
+        """
+        Records that the repo in `dirname` has just been used.
+        """
+        if not os.path.isdir(dirname):
+            return
+        name = os.path.basename(dirname.rstrip("/"))
+        with self.locked() as repos:
+            repos.setdefault(name, {"size": None})["accessed"] = time.time()
+
+    def release(self, dirname: str) -> None:
+        """
+        Gives up our lease on the repo in `dirname`, then settles the cache
+        in a detached process, so the run doesn't wait on walking the
+        checkout.
+        """
+        name = os.path.basename(dirname.rstrip("/"))
+        lease = self.leases.pop(name, None)
+        if lease is not None:
+            lease.close()
+        if not os.path.isdir(dirname):
+            return
+        args = [sys.executable, "-m", "imhotep.cache", self.directory, dirname]
+        if self.max_size is not None:
+            args += ["--max-size", str(self.max_size)]
+        log.debug("Settling the repo cache in the background")
+        subprocess.Popen(
+            args,
+            # Where the imhotep package can be imported from.
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def settle(self, dirname: str) -> None:
+        """
+        Measures the repo in `dirname` after a run, then evicts other repos
+        if the cache is over budget.
+        """
+        if not os.path.isdir(dirname):
+            return
+        name = os.path.basename(dirname.rstrip("/"))
+        size = self.measure(name)
+        with self.locked() as repos:
+            entry = repos.setdefault(name, {"accessed": time.time()})
+            entry["size"] = size
+            self.evict(repos, keep=name)
+
+    def evict(self, repos: Dict[str, Dict], keep: Optional[str] = None) -> None:
+        self.adopt_untracked(repos)
+        if self.max_size is None:
+            return
+        total = sum(r["size"] for r in repos.values())
+        by_age = sorted(repos.items(), key=lambda item: item[1]["accessed"])
+        for name, entry in by_age:
+            if total <= self.max_size:
+                break
+            if name == keep or self.is_leased(name):
+                continue
+            log.info("Evicting %s from the repo cache", name)
+            for path in self.paths(name):
+                if os.path.isdir(path):
+                    remove_in_background(path)
+            total -= entry["size"]
+            del repos[name]
+
+    def adopt_untracked(self, repos: Dict[str, Dict]) -> None:
+        """
+        Starts tracking repos and mirrors made before the cache was managed,
+        measures any we don't know the size of, and sweeps up deletions which
+        an earlier run didn't get to finish.
+        """
+        mirrors = os.path.join(self.directory, MIRRORS_DIRNAME)
+        for directory in (self.directory, mirrors):
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if TRASH_MARKER in entry.name:
+                    delete_detached(entry.path)
+                    continue
+                if directory == mirrors:
+                    if not entry.name.endswith(".git"):
+                        continue
+                    name = entry.name[: -len(".git")]
+                elif os.path.isdir(os.path.join(entry.path, ".git")):
+                    name = entry.name
+                else:
+                    continue
+                if name not in repos:
+                    repos[name] = {
+                        "accessed": entry.stat().st_mtime,
+                        "size": self.measure(name),
+                    }
+        for name in list(repos):
+            if not any(os.path.isdir(path) for path in self.paths(name)):
+                del repos[name]
+            elif repos[name].get("size") is None:
+                # Touched by a run which never got as far as measuring it.
+                repos[name]["size"] = self.measure(name)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Measures a repo after a run and evicts others to keep "
+        "the repo cache within its budget."
+    )
+    parser.add_argument("directory")
+    parser.add_argument("dirname")
+    parser.add_argument("--max-size", type=int)
+    args = parser.parse_args(argv)
+    RepoCache(args.directory, args.max_size).settle(args.dirname)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import time
+from unittest import mock
+
+from .cache import (
+    TRASH_MARKER,
+    RepoCache,
+    get_size,
+    load_json,
+    main,
+    remove_in_background,
+    save_json,
+)
+
+
+def make_repo(cache_dir, name, size):
+    repo = cache_dir.mkdir(name)
+    repo.mkdir(".git")
+    repo.join("data").write("x" * size)
+    return str(repo)
+
+
+def use_and_release(cache_dir, dirname):
+    """
+    Uses the repo in `dirname` as a run which has since finished would.
+    """
+    cache = RepoCache(str(cache_dir))
+    cache.lease(os.path.basename(dirname))
+    cache.touch(dirname)
+    with mock.patch("subprocess.Popen"):
+        cache.release(dirname)
+
+
+def test_remove_in_background(tmpdir):
+    target = tmpdir.mkdir("checkout")
+    target.join("file").write("contents")
+    with mock.patch("subprocess.Popen") as popen:
+        remove_in_background(str(target))
+
+    assert not target.exists()
+    trash = popen.call_args[0][0][2]
+    assert TRASH_MARKER in trash
+    assert os.path.exists(trash)
+
+
+def test_remove_in_background_deletes(tmpdir):
+    target = tmpdir.mkdir("checkout")
+    target.join("file").write("contents")
+    remove_in_background(str(target))
+
+    for _ in range(100):
+        if not tmpdir.listdir():
+            break
+        time.sleep(0.02)
+    assert tmpdir.listdir() == []
+
+
+def test_remove_in_background_missing(tmpdir):
+    with mock.patch("subprocess.Popen") as popen:
+        remove_in_background(str(tmpdir.join("missing")))
+    assert not popen.called
+
+
+def test_save_json_round_trip(tmpdir):
+    path = str(tmpdir.join("sub", "data.json"))
+    assert save_json(path, {"a": [1]}, "test data")
+    assert {"a": [1]} == load_json(path, "test data")
+    assert ["data.json"] == os.listdir(os.path.dirname(path))
+
+
+def test_save_json_leaves_old_file_on_failure(tmpdir):
+    path = str(tmpdir.join("data.json"))
+    save_json(path, {"a": 1}, "test data")
+    with mock.patch("os.replace", side_effect=OSError):
+        assert not save_json(path, {"a": 2}, "test data")
+    assert {"a": 1} == load_json(path, "test data")
+    assert ["data.json"] == os.listdir(str(tmpdir))
+
+
+def test_load_json_unreadable(tmpdir):
+    tmpdir.join("bad.json").write("{")
+    assert load_json(str(tmpdir.join("bad.json")), "test data") is None
+    assert load_json(str(tmpdir.join("missing.json")), "test data") is None
+
+
+def test_get_size(tmpdir):
+    tmpdir.join("a").write("x" * 10000)
+    assert get_size(str(tmpdir)) >= 10000
+
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = RepoCache(str(tmpdir), max_size=150 * 1024)
+    old = make_repo(tmpdir, "old", 100 * 1024)
+    new = make_repo(tmpdir, "new", 100 * 1024)
+    use_and_release(tmpdir, old)
+    time.sleep(0.01)
+    cache.touch(new)
+
+    with mock.patch("imhotep.cache.remove_in_background") as remove:
+        cache.settle(new)
+
+    remove.assert_called_once_with(old)
+    assert set(cache.read().keys()) == {"new"}
+
+
+def test_keeps_repo_in_use(tmpdir):
+    cache = RepoCache(str(tmpdir), max_size=1)
+    repo = make_repo(tmpdir, "only", 10 * 1024)
+    cache.touch(repo)
+
+    with mock.patch("imhotep.cache.remove_in_background") as remove:
+        cache.settle(repo)
+
+    assert not remove.called
+    assert cache.read()["only"]["size"] >= 10 * 1024
+
+
+def test_evicts_mirror_with_checkout(tmpdir):
+    cache = RepoCache(str(tmpdir), max_size=150 * 1024)
+    mirror = tmpdir.mkdir("mirrors").mkdir("old.git")
+    mirror.join("objects").write("x" * 100 * 1024)
+    old = make_repo(tmpdir, "old", 1024)
+    new = make_repo(tmpdir, "new", 100 * 1024)
+    use_and_release(tmpdir, old)
+    time.sleep(0.01)
+    cache.touch(new)
+
+    with mock.patch("imhotep.cache.remove_in_background") as remove:
+        cache.settle(new)
+
+    assert [mock.call(old), mock.call(str(mirror))] == remove.call_args_list
+
+
+def test_adopts_untracked_mirrors(tmpdir):
+    cache = RepoCache(str(tmpdir))
+    tmpdir.mkdir("mirrors").mkdir("gone.git").join("objects").write("x" * 10000)
+    repo = make_repo(tmpdir, "repo", 10)
+
+    cache.settle(repo)
+
+    repos = cache.read()
+    assert set(repos.keys()) == {"repo", "gone"}
+    assert repos["gone"]["size"] >= 10000
+
+
+def test_keeps_repo_leased_by_another_run(tmpdir):
+    cache = RepoCache(str(tmpdir), max_size=150 * 1024)
+    other_run = RepoCache(str(tmpdir), max_size=150 * 1024)
+    old = make_repo(tmpdir, "old", 100 * 1024)
+    new = make_repo(tmpdir, "new", 100 * 1024)
+    other_run.lease("old")
+    other_run.touch(old)
+    time.sleep(0.01)
+    cache.touch(new)
+
+    with mock.patch("imhotep.cache.remove_in_background") as remove:
+        cache.settle(new)
+    assert not remove.called
+
+    with mock.patch("subprocess.Popen"):
+        other_run.release(old)
+    with mock.patch("imhotep.cache.remove_in_background") as remove:
+        cache.settle(new)
+    remove.assert_called_once_with(old)
+
+
+def test_release_settles_in_background(tmpdir):
+    cache = RepoCache(str(tmpdir), max_size=100)
+    repo = make_repo(tmpdir, "repo", 10)
+    cache.lease("repo")
+    assert cache.is_leased("repo")
+
+    with mock.patch("subprocess.Popen") as popen:
+        cache.release(repo)
+
+    assert not cache.is_leased("repo")
+    args = popen.call_args[0][0]
+    assert args[1:] == ["-m", "imhotep.cache", str(tmpdir), repo, "--max-size", "100"]
+    assert popen.call_args[1]["start_new_session"]
+
+
+def test_main_settles(tmpdir):
+    repo = make_repo(tmpdir, "repo", 10 * 1024)
+    main([str(tmpdir), repo])
+    assert RepoCache(str(tmpdir)).read()["repo"]["size"] >= 10 * 1024
+
+
+def test_no_budget_never_evicts(tmpdir):
+    cache = RepoCache(str(tmpdir))
+    a = make_repo(tmpdir, "a", 10 * 1024)
+    make_repo(tmpdir, "b", 10 * 1024)
+
+    with mock.patch("imhotep.cache.remove_in_background") as remove:
+        cache.settle(a)
+
+    assert not remove.called
+    assert set(cache.read().keys()) == {"a", "b"}
+
+
+def test_lease_before_the_repo_exists(tmpdir):
+    cache = RepoCache(str(tmpdir.join("new")))
+    cache.lease("repo")
+    assert RepoCache(str(tmpdir.join("new"))).is_leased("repo")
+
+
+def test_missing_cache_directory(tmpdir):
+    cache = RepoCache(str(tmpdir.join("missing")))
+    cache.touch(str(tmpdir))
+    assert not tmpdir.join("missing").exists()
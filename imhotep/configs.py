@@ -0,0 +1,191 @@
+import fnmatch
+import hashlib
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import DefaultDict, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from .cache import load_json, save_json
+from .files import FileIndex
+
+log = logging.getLogger(__name__)
+
+CACHE_FILENAME = "imhotep-configs.json"
+
+# How many distinct config layouts to remember between runs.
+MAX_CACHED_LAYOUTS = 64
+
+
+def glob_chars(pattern: str) -> bool:
+    return any(c in pattern for c in "*?[")
+
+
+def parent_dir(dirname: str) -> str:
+    return dirname.rsplit("/", 1)[0] if "/" in dirname else ""
+
+
+def config_dir(filename: str, pattern: str) -> Optional[str]:
+    """
+    Returns the directory which `filename` configures if it matches
+    `pattern`, a path relative to that directory which may contain glob
+    characters. Returns None if it doesn't match.
+    """
+    parts = filename.split("/")
+    depth = pattern.count("/") + 1
+    if len(parts) < depth:
+        return None
+    if not fnmatch.fnmatchcase("/".join(parts[-depth:]), pattern):
+        return None
+    return "/".join(parts[:-depth])
+
+
+class ConfigIndex:
+    """
+    Finds the nearest linter configs for any directory of a checkout.
+
+    The checkout is scanned once for every config name of every tool. Looking
+    up a directory walks up towards the repo root until a directory holding
+    one of the tool's configs turns up, remembering the answer for every
+    directory along the way. Those answers are stored in `cache_directory`,
+    keyed by the blob hashes of the configs, so later runs over the same
+    layout don't have to resolve them again.
+    """
+
+    def __init__(
+        self,
+        file_index: FileIndex,
+        config_filenames: Iterable[str],
+        cache_directory: Optional[str] = None,
+    ) -> None:
+        self.cache_directory = cache_directory
+        self.blobs = file_index.blobs
+        # pattern -> directory -> configs matching the pattern in it
+        self.located: DefaultDict[str, DefaultDict[str, Set[str]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        # frozenset of patterns -> directory -> config root (or None)
+        self.nearest: Dict[FrozenSet[str], Dict[str, Optional[str]]] = {}
+        self.fingerprints: Dict[FrozenSet[str], str] = {}
+        self.cache: Dict[str, Dict] = {}
+        self.dirty = False
+
+        patterns = set(config_filenames)
+        plain = {p for p in patterns if "/" not in p and not glob_chars(p)}
+        globbed = patterns - plain
+        for filename in file_index.filenames:
+            basename = filename.rsplit("/", 1)[-1]
+            if basename in plain:
+                self.located[basename][parent_dir(filename)].add(filename)
+            for pattern in globbed:
+                dirname = config_dir(filename, pattern)
+                if dirname is not None:
+                    self.located[pattern][dirname].add(filename)
+        self.load()
+
+    def configs_in(self, dirname: str, patterns: FrozenSet[str]) -> Set[str]:
+        configs: Set[str] = set()
+        for pattern in patterns:
+            if pattern in self.located:
+                configs.update(self.located[pattern].get(dirname, ()))
+        return configs
+
+    def fingerprint(self, patterns: FrozenSet[str]) -> str:
+        if patterns not in self.fingerprints:
+            configs = set()
+            for pattern in patterns:
+                for found in self.located.get(pattern, {}).values():
+                    configs.update(found)
+            digest = hashlib.sha1()
+            for pattern in sorted(patterns):
+                digest.update(f"pattern {pattern}\0".encode())
+            for config in sorted(configs):
+                blob = self.blobs.get(config, "")
+                digest.update(f"config {config} {blob}\0".encode())
+            self.fingerprints[patterns] = digest.hexdigest()
+        return self.fingerprints[patterns]
+
+    def get_nearest(self, patterns: FrozenSet[str]) -> Dict[str, Optional[str]]:
+        if patterns not in self.nearest:
+            entry = self.cache.get(self.fingerprint(patterns))
+            self.nearest[patterns] = dict(entry["nearest"]) if entry else {}
+        return self.nearest[patterns]
+
+    def find(
+        self, dirname: str, config_filenames: Iterable[str]
+    ) -> Tuple[str, Set[str]]:
+        """
+        Returns a tuple of (config root, configs) for files in `dirname`,
+        both relative to the repo root. Directories without any config above
+        them have the repo root ("") as their config root.
+        """
+        patterns = frozenset(config_filenames)
+        nearest = self.get_nearest(patterns)
+        visited = []
+        current = dirname
+        while current not in nearest:
+            visited.append(current)
+            if self.configs_in(current, patterns):
+                root: Optional[str] = current
+                break
+            if current == "":
+                root = None
+                break
+            current = parent_dir(current)
+        else:
+            root = nearest[current]
+        if visited:
+            self.dirty = True
+            for seen in visited:
+                nearest[seen] = root
+        if root is None:
+            return "", set()
+        return root, self.configs_in(root, patterns)
+
+    def find_for_file(
+        self, filename: str, config_filenames: Iterable[str]
+    ) -> Tuple[str, Set[str]]:
+        return self.find(parent_dir(filename), config_filenames)
+
+    def partition(
+        self, filenames: Iterable[str], config_filenames: Iterable[str]
+    ) -> Dict[str, List[str]]:
+        """
+        Groups `filenames` by their config root, e.g.
+
+          {'services/api': ['services/api/views.py'], '': ['setup.py']}
+        """
+        by_dir: DefaultDict[str, List[str]] = defaultdict(list)
+        for filename in filenames:
+            by_dir[parent_dir(filename)].append(filename)
+        partitions: DefaultDict[str, List[str]] = defaultdict(list)
+        for dirname, dir_filenames in by_dir.items():
+            root, _ = self.find(dirname, config_filenames)
+            partitions[root].extend(dir_filenames)
+        return dict(partitions)
+
+    @property
+    def cache_path(self) -> Optional[str]:
+        if not self.cache_directory:
+            return None
+        return os.path.join(self.cache_directory, CACHE_FILENAME)
+
+    def load(self) -> None:
+        path = self.cache_path
+        if path is not None:
+            self.cache = load_json(path, "config cache") or {}
+
+    def save(self) -> None:
+        path = self.cache_path
+        if path is None or not self.dirty:
+            return
+        now = time.time()
+        for patterns, nearest in self.nearest.items():
+            self.cache[self.fingerprint(patterns)] = {
+                "used": now,
+                "nearest": nearest,
+            }
+        newest = sorted(self.cache.items(), key=lambda i: i[1]["used"], reverse=True)
+        self.cache = dict(newest[:MAX_CACHED_LAYOUTS])
+        save_json(path, self.cache, "config cache")
+        self.dirty = False
@@ -0,0 +1,89 @@
+import os
+
+from .configs import CACHE_FILENAME, ConfigIndex, config_dir
+from .files import FileIndex
+
+monorepo = FileIndex(
+    [
+        "setup.cfg",
+        "app.py",
+        "services/api/setup.cfg",
+        "services/api/src/api/views.py",
+        "services/web/.eslintrc",
+        "services/web/src/index.js",
+        "tools/script.py",
+    ],
+    {"setup.cfg": "aaa", "services/api/setup.cfg": "bbb"},
+)
+
+
+def test_config_dir():
+    assert config_dir("a/b/setup.cfg", "setup.cfg") == "a/b"
+    assert config_dir("setup.cfg", "setup.cfg") == ""
+    assert config_dir("a/.eslintrc.json", ".eslintrc*") == "a"
+    assert config_dir("a/conf/lint.cfg", "conf/lint.cfg") == "a"
+    assert config_dir("a/setup.py", "setup.cfg") is None
+
+
+def test_find__nearest_config():
+    index = ConfigIndex(monorepo, {"setup.cfg"})
+    root, configs = index.find_for_file("services/api/src/api/views.py", ["setup.cfg"])
+    assert root == "services/api"
+    assert configs == {"services/api/setup.cfg"}
+
+
+def test_find__falls_back_to_repo_root():
+    index = ConfigIndex(monorepo, {"setup.cfg"})
+    assert index.find("tools", ["setup.cfg"]) == ("", {"setup.cfg"})
+
+
+def test_find__no_config():
+    index = ConfigIndex(monorepo, {"setup.cfg", ".eslintrc"})
+    assert index.find("services/web/src", [".pylintrc"]) == ("", set())
+
+
+def test_find__per_tool_configs():
+    index = ConfigIndex(monorepo, {"setup.cfg", ".eslintrc"})
+    root, configs = index.find("services/web/src", [".eslintrc"])
+    assert root == "services/web"
+    assert configs == {"services/web/.eslintrc"}
+
+
+def test_find__glob_configs():
+    index = ConfigIndex(monorepo, {".eslint*"})
+    root, _ = index.find("services/web/src", [".eslint*"])
+    assert root == "services/web"
+
+
+def test_cache_round_trip(tmpdir):
+    index = ConfigIndex(monorepo, {"setup.cfg"}, str(tmpdir))
+    index.find("services/api/src/api", ["setup.cfg"])
+    index.save()
+    assert os.path.exists(os.path.join(str(tmpdir), CACHE_FILENAME))
+
+    reloaded = ConfigIndex(monorepo, {"setup.cfg"}, str(tmpdir))
+    nearest = reloaded.get_nearest(frozenset(["setup.cfg"]))
+    assert nearest["services/api/src/api"] == "services/api"
+
+
+def test_cache_keyed_by_blob(tmpdir):
+    index = ConfigIndex(monorepo, {"setup.cfg"}, str(tmpdir))
+    index.find("services/api/src/api", ["setup.cfg"])
+    index.save()
+
+    changed = FileIndex(
+        monorepo.filenames, {"setup.cfg": "aaa", "services/api/setup.cfg": "ccc"}
+    )
+    reloaded = ConfigIndex(changed, {"setup.cfg"}, str(tmpdir))
+    assert reloaded.get_nearest(frozenset(["setup.cfg"])) == {}
+
+
+def test_partition():
+    index = ConfigIndex(monorepo, {"setup.cfg"})
+    partitions = index.partition(
+        ["app.py", "services/api/src/api/views.py", "tools/script.py"], ["setup.cfg"]
+    )
+    assert partitions == {
+        "": ["app.py", "tools/script.py"],
+        "services/api": ["services/api/src/api/views.py"],
+    }
@@ -2,8 +2,10 @@
 Thanks to @fridgei & @scottjab for the initial version of this code.
 """
 import re
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import namedtuple
-from typing import List, Union
+from typing import List, Optional, Union
 
 Line = namedtuple("Line", ["number", "position", "contents"])
 
@@ -21,6 +23,19 @@ class Entry:
         self.result_lines: List[Line] = []
         self.added_lines: List[Line] = []
         self.removed_lines: List[Line] = []
+        # Runs of result-side lines which are consecutive in both line number
+        # and diff position, and are either all added or all context. Lines
+        # map to positions by bisecting these, in O(log runs).
+        self.run_lines = array("l")
+        self.run_positions = array("l")
+        self.run_lengths = array("l")
+        self.run_added = array("b")
+        # First and last line of each run of added lines, for finding the
+        # added lines a span overlaps.
+        self.added_starts = array("l")
+        self.added_ends = array("l")
+        # Set for "Binary files differ" entries, which have no lines.
+        self.binary = False
 
     def new_removed(self, line):
         self.removed_lines.append(line)
@@ -37,6 +52,75 @@ class Entry:
     def is_dirty(self):
         return self.result_lines or self.origin_lines
 
+    def new_run_line(self, line: Line, added: bool) -> None:
+        if self.run_lines:
+            last = len(self.run_lines) - 1
+            length = self.run_lengths[last]
+            if (
+                self.run_added[last] == added
+                and self.run_lines[last] + length == line.number
+                and self.run_positions[last] + length == line.position
+            ):
+                self.run_lengths[last] += 1
+                if added:
+                    self.added_ends[-1] += 1
+                return
+        self.run_lines.append(line.number)
+        self.run_positions.append(line.position)
+        self.run_lengths.append(1)
+        self.run_added.append(added)
+        if added:
+            self.added_starts.append(line.number)
+            self.added_ends.append(line.number)
+
+    def find_run(self, starts: array, value: int) -> int:
+        i = bisect_right(starts, value) - 1
+        if i >= 0 and value < starts[i] + self.run_lengths[i]:
+            return i
+        return -1
+
+    def position_for(self, line_number: int) -> Optional[int]:
+        """
+        Returns the diff position of a result-side line, added or context,
+        or None if the diff doesn't show it.
+        """
+        i = self.find_run(self.run_lines, line_number)
+        if i < 0:
+            return None
+        return self.run_positions[i] + line_number - self.run_lines[i]
+
+    def line_for(self, position: int) -> Optional[int]:
+        """
+        Returns the result-side line at a diff position, or None if the
+        position is a hunk header or a removed line.
+        """
+        i = self.find_run(self.run_positions, position)
+        if i < 0:
+            return None
+        return self.run_lines[i] + position - self.run_positions[i]
+
+    def is_added(self, line_number: int) -> bool:
+        i = self.find_run(self.run_lines, line_number)
+        return i >= 0 and bool(self.run_added[i])
+
+    def first_added_in(self, start: int, end: int) -> Optional[int]:
+        """
+        Returns the first added line between `start` and `end` inclusive, or
+        None if the span doesn't overlap any, in O(log runs).
+        """
+        # Runs are sorted and don't overlap, so the first one ending at or
+        # after `start` is the only candidate.
+        i = bisect_left(self.added_ends, start)
+        if i < len(self.added_starts) and self.added_starts[i] <= end:
+            return max(start, self.added_starts[i])
+        return None
+
+    def first_added_position(self) -> Optional[int]:
+        for i, added in enumerate(self.run_added):
+            if added:
+                return self.run_positions[i]
+        return None
+
 
 class DiffContextParser:
     def __init__(self, diff_text: Union[bytes, str]) -> None:
@@ -96,6 +180,15 @@ class DiffContextParser:
                 position = 0
                 continue
 
+            if z is not None and (
+                z.binary
+                or line.startswith("Binary files ")
+                or line == "GIT binary patch"
+            ):
+                # Nothing in a binary patch is a line of the file.
+                z.binary = True
+                continue
+
             if self.should_skip_line(line):
                 continue
 
@@ -115,14 +208,18 @@ class DiffContextParser:
 
                 # added line
                 elif line.startswith("+"):
-                    z.new_added(Line(after_line_number, position, line[1:]))
-                    z.new_result(Line(after_line_number, position, line[1:]))
+                    added = Line(after_line_number, position, line[1:])
+                    z.new_added(added)
+                    z.new_result(added)
+                    z.new_run_line(added, True)
                     after_line_number += 1
 
                 # untouched context line.
                 else:
+                    context = Line(after_line_number, position, line[1:])
                     z.new_origin(Line(before_line_number, position, line[1:]))
-                    z.new_result(Line(after_line_number, position, line[1:]))
+                    z.new_result(context)
+                    z.new_run_line(context, False)
 
                     before_line_number += 1
                     after_line_number += 1
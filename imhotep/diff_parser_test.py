@@ -71,6 +71,47 @@ def test_position_counting():
     assert {x.position for x in entry.added_lines} == valid_positions
 
 
+def test_position_lookups_match_lines():
+    for entry in DiffContextParser(two_block).parse():
+        for line in entry.result_lines:
+            assert entry.position_for(line.number) == line.position
+            assert entry.line_for(line.position) == line.number
+        added = {x.number for x in entry.added_lines}
+        for line in entry.result_lines:
+            assert entry.is_added(line.number) == (line.number in added)
+
+
+def test_position_lookups_outside_diff():
+    entry = DiffContextParser(two_block).parse()[0]
+
+    assert entry.position_for(1000) is None
+    assert entry.line_for(entry.removed_lines[0].position) is None
+    assert entry.line_for(0) is None
+    assert 3 == entry.first_added_position()
+
+
+def test_first_added_in_span():
+    entry = DiffContextParser(two_block).parse()[0]
+    added = sorted(x.number for x in entry.added_lines)
+
+    assert added[0] == entry.first_added_in(1, added[0])
+    assert added[0] == entry.first_added_in(added[0], 1000)
+    assert added[1] == entry.first_added_in(added[0] + 1, 1000)
+    assert entry.first_added_in(1, added[0] - 1) is None
+    assert entry.first_added_in(added[-1] + 1, 1000) is None
+
+
+def test_first_added_in_many_hunks():
+    hunks = "".join(
+        "@@ -%d,1 +%d,2 @@\n context\n+added\n" % (n, n) for n in range(1, 60000, 10)
+    )
+    entry = DiffContextParser("diff --git a/f b/f\n" + hunks).parse()[0]
+
+    assert 6000 == len(entry.added_starts)
+    assert 59992 == entry.first_added_in(59985, 59999)
+    assert entry.first_added_in(59993, 59999) is None
+
+
 def test_two_file():
     dcp = DiffContextParser(two_file)
     results = dcp.parse()
@@ -92,3 +133,27 @@ def test_entry__dirty_result():
     e = Entry("fna", "fnb")
     e.new_origin("line")
     assert e.is_dirty()
+
+
+def test_binary_entry():
+    diff = (
+        "diff --git a/logo.png b/logo.png\n"
+        "index 1111111..2222222 100644\n"
+        "Binary files a/logo.png and b/logo.png differ\n"
+        "diff --git a/font.woff b/font.woff\n"
+        "new file mode 100644\n"
+        "GIT binary patch\n"
+        "literal 10\n"
+        "+zcmZQzVBp~h\n"
+        "\n"
+        "diff --git a/f.py b/f.py\n"
+        "@@ -1,1 +1,2 @@\n"
+        " context\n"
+        "+added\n"
+    )
+    logo, font, source = DiffContextParser(diff).parse()
+
+    assert logo.binary and not logo.is_dirty()
+    assert font.binary and not font.added_lines
+    assert not source.binary
+    assert ["added"] == [line.contents for line in source.added_lines]
@@ -0,0 +1,69 @@
+import logging
+import sys
+from collections import defaultdict
+from typing import Callable, DefaultDict, Dict, Iterable, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+def get_extension(filename: str) -> str:
+    """
+    Returns the extension of `filename` without its leading dot, matching the
+    way `Tool.invoke` filters filenames. Files without one map to "".
+    """
+    basename = filename.rsplit("/", 1)[-1]
+    if "." not in basename:
+        return ""
+    return basename.rsplit(".", 1)[-1]
+
+
+class FileIndex:
+    """
+    The files in a checkout, indexed by extension so that every tool can get
+    its file list without walking the tree itself.
+    """
+
+    def __init__(
+        self, filenames: Iterable[str], blobs: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.filenames: List[str] = list(filenames)
+        # Blob hash of each file, where git told us about it.
+        self.blobs: Dict[str, str] = blobs or {}
+        self.by_extension: DefaultDict[str, List[str]] = defaultdict(list)
+        for filename in self.filenames:
+            self.by_extension[get_extension(filename)].append(filename)
+
+    @classmethod
+    def from_git(cls, dirname: str, executor: Callable) -> Optional["FileIndex"]:
+        """
+        Builds an index from `git ls-files`, which skips anything the repo
+        ignores. Returns None if git didn't give us anything to work with,
+        in which case tools should fall back to finding files themselves.
+        """
+        result = executor(f"cd {dirname} && git ls-files -z --stage")
+        if type(result) is bytes:
+            result = result.decode(sys.getdefaultencoding())
+        filenames = []
+        blobs = {}
+        for record in result.split("\0"):
+            # "<mode> <blob> <stage>\t<path>"
+            info, sep, filename = record.partition("\t")
+            if not sep or filename in blobs:
+                # Conflicted files are listed once per stage.
+                continue
+            filenames.append(filename)
+            blobs[filename] = info.split(" ")[1]
+        if not filenames:
+            log.debug("No files listed by git in %s", dirname)
+            return None
+        log.debug("Indexed %d files in %s", len(filenames), dirname)
+        return cls(filenames, blobs)
+
+    def matching(self, extensions: Iterable[str]) -> List[str]:
+        """
+        Returns the files with any of the given extensions, e.g. ['.py'].
+        """
+        filenames: List[str] = []
+        for ext in set(e.lstrip(".") for e in extensions):
+            filenames.extend(self.by_extension.get(ext, []))
+        return filenames
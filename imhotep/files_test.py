@@ -0,0 +1,38 @@
+from unittest import mock
+
+from .files import FileIndex, get_extension
+
+
+def test_get_extension():
+    assert get_extension("imhotep/app.py") == "py"
+    assert get_extension("a.min.js") == "js"
+    assert get_extension("Makefile") == ""
+    assert get_extension("some.dir/Makefile") == ""
+
+
+def test_index_by_extension():
+    index = FileIndex(["a.py", "b/c.py", "d.js", "Makefile"])
+    assert index.matching([".py"]) == ["a.py", "b/c.py"]
+    assert index.matching(["js"]) == ["d.js"]
+    assert index.matching([".rb"]) == []
+
+
+def test_index_multiple_extensions():
+    index = FileIndex(["a.py", "b.js", "c.rb"])
+    assert sorted(index.matching([".py", ".js"])) == ["a.py", "b.js"]
+
+
+def test_from_git():
+    m = mock.Mock()
+    m.return_value = b"100644 aaa 0\ta.py\0" b"100644 bbb 0\tdir/with space.py\0"
+    index = FileIndex.from_git("/woobie", m)
+
+    m.assert_called_with("cd /woobie && git ls-files -z --stage")
+    assert index.filenames == ["a.py", "dir/with space.py"]
+    assert index.blobs == {"a.py": "aaa", "dir/with space.py": "bbb"}
+
+
+def test_from_git__no_output():
+    m = mock.Mock()
+    m.return_value = b""
+    assert FileIndex.from_git("/woobie", m) is None
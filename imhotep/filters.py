@@ -0,0 +1,384 @@
+"""
+Drops files from a diff which aren't worth linting: binaries, files the repo
+marks as generated or vendored in .gitattributes, and files too big or with
+lines too long to have been written by hand, like minified bundles. We'd
+throw away any comments on them, so linters never see them.
+
+Also holds the include/exclude globs deciding which tools lint which paths.
+"""
+
+import logging
+import os
+import re
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Pattern,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .configs import glob_chars
+from .diff_parser import Entry
+
+log = logging.getLogger(__name__)
+
+GITATTRIBUTES = ".gitattributes"
+
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+DEFAULT_MAX_LINE_LENGTH = 1000
+
+# Attributes marking a file as not worth linting.
+SKIP_ATTRIBUTES = ("binary", "linguist-generated", "linguist-vendored")
+
+Rule = Tuple[Pattern, Dict[str, bool]]
+
+
+def translate_glob(pattern: str, directory: str = "", descend: bool = False) -> str:
+    """
+    Translates a gitignore-style glob into a regex matching the paths it
+    covers, relative to the repo root. Patterns without a slash match a file
+    name at any depth under `directory`; `**` matches across directories.
+
+    With `descend`, a pattern also matches everything under a directory it
+    matches, as in .gitignore, and one ending in a slash only matches
+    directories.
+    """
+    suffix = r"\Z"
+    if descend:
+        suffix = "/" if pattern.endswith("/") else r"(?:/|\Z)"
+        pattern = pattern.rstrip("/")
+    prefix = re.escape(directory + "/") if directory else ""
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+    elif "/" not in pattern.rstrip("/"):
+        prefix += "(?:.*/)?"
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        c = pattern[i]
+        end = pattern.find("]", i + 2) if c == "[" else -1
+        if c == "*":
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif end != -1:
+            chars = pattern[i + 1 : end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            parts.append("[%s]" % chars.replace("\\", "\\\\"))
+            i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return prefix + "".join(parts) + suffix
+
+
+def parse_gitattributes(text: str, directory: str = "") -> List[Rule]:
+    """
+    Parses a .gitattributes file in `directory` into (pattern, attributes)
+    rules, where each attribute is set (True) or unset (False).
+    """
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith('"'):
+            continue
+        pattern, *attrs = line.split()
+        values = {}
+        for attr in attrs:
+            if attr[0] in "-!":
+                values[attr[1:]] = False
+            elif "=" in attr:
+                name, value = attr.split("=", 1)
+                values[name] = value.lower() not in ("false", "0")
+            else:
+                values[attr] = True
+        rules.append((re.compile(translate_glob(pattern, directory)), values))
+    return rules
+
+
+class GitAttributes:
+    """
+    The attributes the .gitattributes files in a checkout give its paths.
+    Files deeper in the tree override those above them, and later lines
+    override earlier ones, as in git. Macros other than `binary` aren't
+    expanded.
+    """
+
+    def __init__(self, dirname: str) -> None:
+        self.dirname = dirname
+        self.rules_by_dir: Dict[str, List[Rule]] = {}
+
+    def rules(self, directory: str) -> List[Rule]:
+        if directory not in self.rules_by_dir:
+            path = os.path.join(self.dirname, directory, GITATTRIBUTES)
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    rules = parse_gitattributes(f.read(), directory)
+            except OSError:
+                rules = []
+            self.rules_by_dir[directory] = rules
+        return self.rules_by_dir[directory]
+
+    def get(self, path: str) -> Dict[str, bool]:
+        parts = path.split("/")[:-1]
+        values: Dict[str, bool] = {}
+        for depth in range(len(parts) + 1):
+            for pattern, attrs in self.rules("/".join(parts[:depth])):
+                if pattern.match(path):
+                    values.update(attrs)
+        return values
+
+
+class FileFilter:
+    """
+    Decides which of a diff's entries to lint, between parsing the diff and
+    running the linters.
+    """
+
+    def __init__(
+        self,
+        dirname: str,
+        max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+        max_line_length: int = DEFAULT_MAX_LINE_LENGTH,
+    ) -> None:
+        self.dirname = dirname
+        self.max_file_size = max_file_size
+        self.max_line_length = max_line_length
+        self.attributes = GitAttributes(dirname)
+
+    def skip_reason(self, entry: Entry) -> Optional[str]:
+        """
+        Returns why `entry` shouldn't be linted, or None if it should be.
+        """
+        if entry.binary:
+            return "binary"
+        attributes = self.attributes.get(entry.result_filename)
+        for name in SKIP_ATTRIBUTES:
+            if attributes.get(name):
+                return f"marked {name} in {GITATTRIBUTES}"
+        try:
+            size = os.path.getsize(os.path.join(self.dirname, entry.result_filename))
+        except OSError:
+            size = 0
+        if size > self.max_file_size:
+            return f"{size} bytes, over the {self.max_file_size} byte limit"
+        longest = max((len(line.contents) for line in entry.added_lines), default=0)
+        if longest > self.max_line_length:
+            return f"has a {longest} character line, probably generated or minified"
+        return None
+
+    def filter(self, entries: List[Entry]) -> List[Entry]:
+        kept = []
+        for entry in entries:
+            reason = self.skip_reason(entry)
+            if reason is None:
+                kept.append(entry)
+            else:
+                log.info("Skipping %s: %s", entry.result_filename, reason)
+        return kept
+
+
+class PathParts:
+    """
+    The pieces of a path which globs are looked up by.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directories = path.split("/")[:-1]
+        self.name = path.rsplit("/", 1)[-1]
+        self.directories = set(directories)
+        self.ancestors = {
+            "/".join(directories[:depth]) for depth in range(1, len(directories) + 1)
+        }
+        # Every ending starting at a dot, e.g. ".min.js" and ".js".
+        self.suffixes = get_suffixes(self.name)
+        self.directory_suffixes = set().union(*map(get_suffixes, directories))
+
+
+def get_suffixes(name: str) -> Set[str]:
+    return {name[i:] for i, c in enumerate(name) if c == "."}
+
+
+class GlobSet:
+    """
+    A rule set's globs. As in .gitignore, a glob matching a directory
+    matches everything under it, and one ending in a slash only matches
+    directories.
+
+    The common shapes are set lookups: a name at any depth ('setup.py',
+    'build', 'docs/'), an ending ('*.min.js', '*.egg-info/'), a path from
+    the root ('src/app.py', '/build') or a directory from the root
+    ('docs/**', 'src/lib/') or at any depth ('**/migrations/**'). Any others
+    are compiled together into one regex.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        # File or directory names, and directory names only.
+        self.names: Set[str] = set()
+        self.directories: Set[str] = set()
+        self.suffixes: Set[str] = set()
+        self.directory_suffixes: Set[str] = set()
+        # Paths of a file or directory, and of a directory only.
+        self.paths: Set[str] = set()
+        self.prefixes: Set[str] = set()
+        others = []
+        for pattern in patterns:
+            directory = pattern.endswith("/")
+            body = pattern.rstrip("/")
+            anchored = "/" in body
+            literal = body.lstrip("/")
+            if not glob_chars(literal):
+                if anchored:
+                    (self.prefixes if directory else self.paths).add(literal)
+                else:
+                    (self.directories if directory else self.names).add(literal)
+            elif (
+                not anchored and literal.startswith("*") and not glob_chars(literal[1:])
+            ):
+                if not literal[1:].startswith("."):
+                    others.append(pattern)
+                elif directory:
+                    self.directory_suffixes.add(literal[1:])
+                else:
+                    self.suffixes.add(literal[1:])
+            elif literal.endswith("/**") and not glob_chars(literal[:-3]):
+                self.prefixes.add(literal[:-3])
+            elif (
+                literal.startswith("**/")
+                and literal.endswith("/**")
+                and not glob_chars(literal[3:-3])
+                and "/" not in literal[3:-3]
+            ):
+                self.directories.add(literal[3:-3])
+            else:
+                others.append(pattern)
+        self.regex: Optional[Pattern] = None
+        if others:
+            self.regex = re.compile(
+                "|".join(f"(?:{translate_glob(p, descend=True)})" for p in others)
+            )
+
+    def matches(self, parts: PathParts) -> bool:
+        return bool(
+            parts.name in self.names
+            or not self.names.isdisjoint(parts.directories)
+            or not self.directories.isdisjoint(parts.directories)
+            or not self.suffixes.isdisjoint(parts.suffixes)
+            or not self.suffixes.isdisjoint(parts.directory_suffixes)
+            or not self.directory_suffixes.isdisjoint(parts.directory_suffixes)
+            or parts.path in self.paths
+            or not self.paths.isdisjoint(parts.ancestors)
+            or not self.prefixes.isdisjoint(parts.ancestors)
+            or (self.regex is not None and self.regex.match(parts.path))
+        )
+
+
+class PathFilter:
+    """
+    Include and exclude globs for the whole repo and for particular tools
+    (keyed like `--linter`, e.g. 'imhotep.tools:PyLint'). A path is linted
+    by a tool if it matches an include of each scope that has any, and no
+    exclude of either scope.
+
+    Each rule set is compiled once into a `GlobSet`, so matching a path
+    costs a few set lookups however many patterns there are. Which rule
+    sets a path matches is worked out once and remembered, so routing it to
+    several tools doesn't match it again.
+    """
+
+    def __init__(
+        self,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        tool_include: Optional[Mapping[str, Sequence[str]]] = None,
+        tool_exclude: Optional[Mapping[str, Sequence[str]]] = None,
+    ) -> None:
+        # (tool, is_include, globs) for each rule set; tool None is the repo.
+        self.rule_sets: List[Tuple[Optional[str], bool, GlobSet]] = []
+        scopes = [(None, include, exclude)] + [
+            (
+                tool,
+                (tool_include or {}).get(tool, ()),
+                (tool_exclude or {}).get(tool, ()),
+            )
+            for tool in sorted(set(tool_include or {}) | set(tool_exclude or {}))
+        ]
+        for tool, includes, excludes in scopes:
+            for is_include, patterns in ((True, includes), (False, excludes)):
+                if patterns:
+                    self.rule_sets.append((tool, is_include, GlobSet(patterns)))
+        self.matched: Dict[str, FrozenSet[int]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.rule_sets)
+
+    def match(self, path: str) -> FrozenSet[int]:
+        """
+        Returns the indexes of the rule sets `path` matches.
+        """
+        if path not in self.matched:
+            parts = PathParts(path)
+            self.matched[path] = frozenset(
+                i
+                for i, (_, _, globs) in enumerate(self.rule_sets)
+                if globs.matches(parts)
+            )
+        return self.matched[path]
+
+    def allows(self, path: str, tool: Optional[str] = None) -> bool:
+        """
+        Returns whether `tool`, or any tool if None, should lint `path`.
+        """
+        if not self.rule_sets:
+            return True
+        matched = self.match(path)
+        for i, (rule_tool, is_include, _) in enumerate(self.rule_sets):
+            if rule_tool is None or rule_tool == tool:
+                if (i in matched) != is_include:
+                    return False
+        return True
+
+    def filter(self, paths: Iterable[str], tool: Optional[str] = None) -> List[str]:
+        return [p for p in paths if self.allows(p, tool)]
+
+
+def parse_tool_globs(
+    values: Union[None, Mapping[str, Sequence[str]], Sequence[str]],
+) -> Dict[str, List[str]]:
+    """
+    Groups 'TOOL=GLOB' arguments by tool. A config file can give a mapping
+    of tool to globs instead.
+    """
+    if not values:
+        return {}
+    if isinstance(values, Mapping):
+        return {tool: list(globs) for tool, globs in values.items()}
+    globs: Dict[str, List[str]] = {}
+    for value in values:
+        tool, pattern = split_tool_glob(value)
+        globs.setdefault(tool, []).append(pattern)
+    return globs
+
+
+def split_tool_glob(value: str) -> Tuple[str, str]:
+    tool, sep, pattern = value.partition("=")
+    if not tool or not sep or not pattern:
+        raise ValueError(f"Expected TOOL=GLOB, got '{value}'")
+    return tool, pattern
@@ -0,0 +1,214 @@
+import re
+
+import pytest
+
+from .diff_parser import DiffContextParser
+from .filters import (
+    FileFilter,
+    GitAttributes,
+    GlobSet,
+    PathFilter,
+    PathParts,
+    parse_gitattributes,
+    parse_tool_globs,
+    translate_glob,
+)
+
+
+def matches(pattern, path, directory="", descend=False):
+    return re.match(translate_glob(pattern, directory, descend), path) is not None
+
+
+def test_translate_glob():
+    assert matches("*.min.js", "static/js/app.min.js")
+    assert not matches("/*.min.js", "static/js/app.min.js")
+    assert matches("/*.min.js", "app.min.js")
+    assert matches("docs/**", "docs/a/b.md")
+    assert not matches("docs/**", "src/docs/a.md")
+    assert matches("**/migrations/**", "app/migrations/0001.py")
+    assert matches("**/migrations/**", "migrations/0001.py")
+    assert not matches("**/migrations/**", "app/migrations.py")
+    assert matches("src/*.py", "src/a.py")
+    assert not matches("src/*.py", "src/sub/a.py")
+    assert matches("file[0-9].txt", "file1.txt")
+    assert not matches("file[!0-9].txt", "file1.txt")
+    assert matches("*.pb.go", "api/x.pb.go", directory="api")
+    assert not matches("*.pb.go", "x.pb.go", directory="api")
+
+
+def test_translate_glob__descend():
+    assert not matches("build", "build/a.py")
+    assert matches("build", "build/a.py", descend=True)
+    assert matches("build", "src/build/a.py", descend=True)
+    assert matches("build", "build", descend=True)
+    assert not matches("build", "builds/a.py", descend=True)
+    assert matches("docs/", "src/docs/a.md", descend=True)
+    assert not matches("docs/", "docs", descend=True)
+    assert matches("src/gen*", "src/gen1/a.py", descend=True)
+    assert not matches("src/gen*", "lib/src/gen1/a.py", descend=True)
+
+
+def test_parse_gitattributes():
+    (pattern, attrs), (_, unset) = parse_gitattributes(
+        "# comment\n"
+        "\n"
+        "vendor/** linguist-vendored text=auto\n"
+        "vendor/ours/** -linguist-vendored linguist-generated=false\n"
+    )
+    assert pattern.match("vendor/lib/a.js")
+    assert {"linguist-vendored": True, "text": True} == attrs
+    assert {"linguist-vendored": False, "linguist-generated": False} == unset
+
+
+def test_nested_gitattributes_override(tmp_path):
+    (tmp_path / ".gitattributes").write_text("*.js linguist-generated\n")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / ".gitattributes").write_text("app.js -linguist-generated\n")
+    attributes = GitAttributes(str(tmp_path))
+
+    assert attributes.get("bundle.js")["linguist-generated"]
+    assert attributes.get("lib/bundle.js")["linguist-generated"]
+    assert not attributes.get("src/app.js")["linguist-generated"]
+    assert {} == attributes.get("src/app.py")
+
+
+def test_file_filter(tmp_path):
+    (tmp_path / ".gitattributes").write_text(
+        "vendor/** linguist-vendored\n*.pb.py linguist-generated\n"
+    )
+    (tmp_path / "big.py").write_text("x = 1\n" * 100)
+    diff = "".join(
+        "diff --git a/{0} b/{0}\n@@ -1,1 +1,2 @@\n context\n+{1}\n".format(name, line)
+        for name, line in [
+            ("vendor/lib.py", "x = 1"),
+            ("api_pb2.pb.py", "x = 1"),
+            ("big.py", "x = 1"),
+            ("bundle.py", "x" * 200),
+            ("app.py", "x = 1"),
+        ]
+    )
+    diff += "diff --git a/a.png b/a.png\nBinary files a/a.png and b/a.png differ\n"
+    entries = DiffContextParser(diff).parse()
+    file_filter = FileFilter(str(tmp_path), max_file_size=500, max_line_length=100)
+
+    assert [
+        "marked linguist-vendored in .gitattributes",
+        "marked linguist-generated in .gitattributes",
+        "600 bytes, over the 500 byte limit",
+        "has a 200 character line, probably generated or minified",
+        None,
+        "binary",
+    ] == [file_filter.skip_reason(e) for e in entries]
+    assert ["app.py"] == [e.result_filename for e in file_filter.filter(entries)]
+
+
+def test_path_filter():
+    path_filter = PathFilter(
+        include=["src/**", "setup.py"],
+        exclude=["**/migrations/**"],
+        tool_include={"t:Docs": ["**/*.md"]},
+        tool_exclude={"t:Lint": ["**/*_pb2.py"]},
+    )
+
+    assert path_filter.allows("src/app.py")
+    assert path_filter.allows("setup.py")
+    assert not path_filter.allows("docs/index.md")
+    assert not path_filter.allows("src/app/migrations/0001.py")
+    assert path_filter.allows("src/api_pb2.py", "t:Other")
+    assert not path_filter.allows("src/api_pb2.py", "t:Lint")
+    assert path_filter.allows("src/README.md", "t:Docs")
+    assert not path_filter.allows("src/app.py", "t:Docs")
+    assert ["src/a.py"] == path_filter.filter(["src/a.py", "lib/b.py"], "t:Lint")
+
+
+def test_path_filter__directories():
+    path_filter = PathFilter(exclude=["build", "docs/", "/src/gen", "*.egg-info"])
+
+    assert not path_filter.allows("build/a.py")
+    assert not path_filter.allows("lib/build/a.py")
+    assert not path_filter.allows("build")
+    assert not path_filter.allows("docs/a.md")
+    assert not path_filter.allows("pkg/docs/a.md")
+    assert path_filter.allows("docs")
+    assert not path_filter.allows("src/gen/api.py")
+    assert path_filter.allows("lib/src/gen/api.py")
+    assert not path_filter.allows("imhotep.egg-info/PKG-INFO")
+    assert path_filter.allows("builds/a.py")
+    assert path_filter.allows("src/app.py")
+
+
+def test_path_filter__empty():
+    path_filter = PathFilter()
+    assert not path_filter
+    assert path_filter.allows("anything.py", "t:Lint")
+
+
+def test_path_filter__matches_each_path_once():
+    path_filter = PathFilter(exclude=[f"dir{n}/**" for n in range(500)])
+    paths = [f"dir{n}/file{n}.py" for n in range(1000)]
+
+    assert paths[500:] == path_filter.filter(paths)
+    assert paths[500:] == path_filter.filter(paths, "t:Lint")
+    assert 1000 == len(path_filter.matched)
+
+
+def test_parse_tool_globs():
+    assert {"a:A": ["*.py", "*.pyi"], "b:B": ["docs/**"]} == parse_tool_globs(
+        ["a:A=*.py", "b:B=docs/**", "a:A=*.pyi"]
+    )
+    assert {"a:A": ["*.py"]} == parse_tool_globs({"a:A": ("*.py",)})
+    assert {} == parse_tool_globs(None)
+    with pytest.raises(ValueError):
+        parse_tool_globs(["a:A"])
+
+
+def test_glob_set_agrees_with_translate_glob():
+    patterns = [
+        "setup.py",
+        "*.min.js",
+        "src/app.py",
+        "docs/**",
+        "/build/**",
+        "**/migrations/**",
+        "**/*_pb2.py",
+        "test_*.py",
+        "vendor",
+        "node_modules/",
+        "*.egg-info/",
+        "src/lib/",
+        "/out",
+        "gen*/",
+    ]
+    paths = [
+        "setup.py",
+        "pkg/setup.py",
+        "static/app.min.js",
+        "static/app.js",
+        "src/app.py",
+        "lib/src/app.py",
+        "docs/a/b.md",
+        "src/docs/a.md",
+        "build/out.py",
+        "app/migrations/0001.py",
+        "app/migrations.py",
+        "api/x_pb2.py",
+        "tests/test_app.py",
+        "vendor/a.py",
+        "pkg/vendor/b/c.py",
+        "vendors/a.py",
+        "web/node_modules/x.js",
+        "node_modules",
+        "pkg.egg-info/PKG-INFO",
+        "src/lib/a.py",
+        "src/lib",
+        "out",
+        "out/a.py",
+        "pkg/out/a.py",
+        "gen1/a.py",
+        "gen1",
+    ]
+    globs = GlobSet(patterns)
+    assert not globs.suffixes.isdisjoint({".min.js"}) and globs.regex is not None
+    for path in paths:
+        expected = any(matches(p, path, descend=True) for p in patterns)
+        assert expected == globs.matches(PathParts(path)), path
@@ -0,0 +1,216 @@
+"""
+Fetches everything imhotep needs to know about a pull request from GitHub's
+GraphQL API: its base and head, the files it changes and the review
+comments we've already left on it, paging through each list as needed.
+"""
+
+import logging
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from imhotep.http_client import BasicAuthRequester
+
+from .shas import PRInfo
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+PullRequestData = namedtuple("PullRequestData", ("pr_info", "comments"))
+
+
+class GraphQLError(Exception):
+    pass
+
+
+PULL_REQUEST_QUERY = """
+query(
+  $owner: String!, $name: String!, $number: Int!, $author: String!,
+  $filesCursor: String, $reviewsCursor: String,
+  $withFiles: Boolean!, $withReviews: Boolean!
+) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      baseRefName
+      baseRefOid
+      headRefName
+      headRefOid
+      baseRepository { owner { login } url }
+      headRepository { owner { login } url }
+      files(first: %(page)d, after: $filesCursor) @include(if: $withFiles) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path additions deletions changeType }
+      }
+      reviews(first: %(page)d, after: $reviewsCursor, author: $author)
+        @include(if: $withReviews) {
+        pageInfo { hasNextPage endCursor }
+        nodes {
+          id
+          comments(first: %(page)d) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              path position line originalLine subjectType diffHunk body
+              author { login }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+""" % {"page": PAGE_SIZE}
+
+REVIEW_COMMENTS_QUERY = """
+query($id: ID!, $cursor: String) {
+  node(id: $id) {
+    ... on PullRequestReview {
+      comments(first: %(page)d, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes {
+          path position line originalLine subjectType diffHunk body
+          author { login }
+        }
+      }
+    }
+  }
+}
+""" % {"page": PAGE_SIZE}
+
+
+def get_graphql_url(domain: str) -> str:
+    # GitHub Enterprise serves GraphQL at a different path to github.com.
+    if domain == "github.com":
+        return "https://api.github.com/graphql"
+    return f"https://{domain}/api/graphql"
+
+
+class GraphQLClient:
+    def __init__(self, requester: BasicAuthRequester, url: str) -> None:
+        self.requester = requester
+        self.url = url
+
+    def query(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.requester.post(
+            self.url, {"query": query, "variables": variables}
+        )
+        if response.status_code >= 400:
+            raise GraphQLError(f"GraphQL request failed: {response.status_code}")
+        body = response.json()
+        if body.get("errors"):
+            raise GraphQLError("; ".join(e.get("message", "") for e in body["errors"]))
+        return body["data"]
+
+    def get_pull_request(self, repo_name: str, number: int) -> PullRequestData:
+        """
+        Returns the pull request's info, with its changed files under
+        "files", and the review comments our user has left on it.
+        """
+        owner, name = repo_name.split("/", 1)
+        variables: Dict[str, Any] = {
+            "owner": owner,
+            "name": name,
+            "number": int(number),
+            "author": self.requester.username or "",
+            "filesCursor": None,
+            "reviewsCursor": None,
+            "withFiles": True,
+            "withReviews": bool(self.requester.username),
+        }
+        pr: Optional[Dict[str, Any]] = None
+        files: List[Dict[str, Any]] = []
+        comments: List[Dict[str, Any]] = []
+        while variables["withFiles"] or variables["withReviews"]:
+            data = self.query(PULL_REQUEST_QUERY, variables)
+            page = (data.get("repository") or {}).get("pullRequest")
+            if page is None:
+                raise GraphQLError(f"No pull request {repo_name}#{number}")
+            if pr is None:
+                pr = page
+            if variables["withFiles"]:
+                files.extend(page["files"]["nodes"])
+                variables["withFiles"] = next_page(
+                    variables, "filesCursor", page["files"]["pageInfo"]
+                )
+            if variables["withReviews"]:
+                for review in page["reviews"]["nodes"]:
+                    comments.extend(self.get_review_comments(review))
+                variables["withReviews"] = next_page(
+                    variables, "reviewsCursor", page["reviews"]["pageInfo"]
+                )
+        assert pr is not None
+        return PullRequestData(to_pr_info(pr, files), comments)
+
+    def get_review_comments(self, review: Dict[str, Any]) -> List[Dict[str, Any]]:
+        connection = review["comments"]
+        comments = [to_rest_comment(c) for c in connection["nodes"]]
+        while connection["pageInfo"]["hasNextPage"]:
+            data = self.query(
+                REVIEW_COMMENTS_QUERY,
+                {"id": review["id"], "cursor": connection["pageInfo"]["endCursor"]},
+            )
+            connection = data["node"]["comments"]
+            comments.extend(to_rest_comment(c) for c in connection["nodes"])
+        return comments
+
+
+def next_page(
+    variables: Dict[str, Any], cursor: str, page_info: Dict[str, Any]
+) -> bool:
+    """
+    Moves `cursor` on to the next page, returning whether there is one.
+    """
+    variables[cursor] = page_info["endCursor"]
+    return page_info["hasNextPage"]
+
+
+def to_rest_comment(comment: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reshapes a review comment into the REST API's form, which the reporters
+    compare against.
+    """
+    return {
+        "path": comment["path"],
+        "position": comment["position"],
+        "line": comment.get("line"),
+        "original_line": comment.get("originalLine"),
+        "subject_type": (comment.get("subjectType") or "line").lower(),
+        "diff_hunk": comment.get("diffHunk") or "",
+        "body": comment["body"],
+        "user": {"login": (comment.get("author") or {}).get("login")},
+    }
+
+
+def to_rest_repo(repo: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if repo is None:
+        # The head repository is gone, e.g. a deleted fork.
+        return {"owner": {"login": None}, "clone_url": None}
+    return {"owner": repo["owner"], "clone_url": repo["url"] + ".git"}
+
+
+def to_pr_info(pr: Dict[str, Any], files: List[Dict[str, Any]]) -> PRInfo:
+    base_repo = to_rest_repo(pr["baseRepository"])
+    head_repo = to_rest_repo(pr["headRepository"])
+    if head_repo["owner"]["login"] is None:
+        head_repo = base_repo
+    return PRInfo(
+        {
+            "base": {
+                "sha": pr["baseRefOid"],
+                "ref": pr["baseRefName"],
+                "repo": base_repo,
+            },
+            "head": {
+                "sha": pr["headRefOid"],
+                "ref": pr["headRefName"],
+                "repo": head_repo,
+            },
+            "files": files,
+        }
+    )
+
+
+def get_pull_request(
+    requester: BasicAuthRequester, reponame: str, number: str, domain: str
+) -> PullRequestData:
+    client = GraphQLClient(requester, get_graphql_url(domain))
+    return client.get_pull_request(reponame, int(number))
@@ -0,0 +1,143 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from imhotep.http_client import BasicAuthRequester
+
+from .graphql import GraphQLClient, GraphQLError, get_graphql_url
+
+
+def comment(path, position, login="me"):
+    return {
+        "path": path,
+        "position": position,
+        "body": "* Bad\n",
+        "author": {"login": login},
+    }
+
+
+def pull_request_page(variables):
+    files_page = {
+        None: (
+            [{"path": "a.py", "additions": 3, "deletions": 0, "changeType": "ADDED"}],
+            "f1",
+        ),
+        "f1": (
+            [
+                {
+                    "path": "b.py",
+                    "additions": 1,
+                    "deletions": 2,
+                    "changeType": "MODIFIED",
+                }
+            ],
+            None,
+        ),
+    }
+    reviews_page = {
+        None: (
+            [{"id": "r1", "comments": connection([comment("a.py", 1)], "c1")}],
+            None,
+        ),
+    }
+    pr = {
+        "baseRefName": "main",
+        "baseRefOid": "base",
+        "headRefName": "feature",
+        "headRefOid": "head",
+        "baseRepository": {
+            "owner": {"login": "owner"},
+            "url": "https://github.com/owner/repo",
+        },
+        "headRepository": {
+            "owner": {"login": "forker"},
+            "url": "https://github.com/forker/repo",
+        },
+    }
+    if variables["withFiles"]:
+        pr["files"] = connection(*files_page[variables["filesCursor"]])
+    if variables["withReviews"]:
+        pr["reviews"] = connection(*reviews_page[variables["reviewsCursor"]])
+    return {"repository": {"pullRequest": pr}}
+
+
+def connection(nodes, cursor):
+    return {
+        "nodes": nodes,
+        "pageInfo": {"hasNextPage": cursor is not None, "endCursor": cursor},
+    }
+
+
+class GitHubStandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        variables = body["variables"]
+        if "number" not in variables:
+            data = {"node": {"comments": connection([comment("b.py", 4)], None)}}
+        elif variables["number"] == 404:
+            data = {"repository": {"pullRequest": None}}
+        else:
+            data = pull_request_page(variables)
+        payload = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), GitHubStandIn)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get_client(server):
+    url = "http://127.0.0.1:%d/graphql" % server.server_address[1]
+    return GraphQLClient(BasicAuthRequester("me", "secret"), url)
+
+
+def test_graphql_url():
+    assert "https://api.github.com/graphql" == get_graphql_url("github.com")
+    assert "https://ghe.example.com/api/graphql" == get_graphql_url("ghe.example.com")
+
+
+def test_get_pull_request_info(server):
+    pr_info, _ = get_client(server).get_pull_request("owner/repo", 3)
+
+    assert "base" == pr_info.base_sha
+    assert "head" == pr_info.head_sha
+    assert "feature" == pr_info.head_ref
+    assert ("forker", "https://github.com/forker/repo.git") == pr_info.remote_repo
+
+
+def test_get_pull_request_pages_files(server):
+    pr_info, _ = get_client(server).get_pull_request("owner/repo", 3)
+
+    assert ["a.py", "b.py"] == [f["path"] for f in pr_info.changed_files]
+    assert 3 == pr_info.changed_files[0]["additions"]
+    # Reviews only had one page, so the second query only asks for files.
+    assert not server.requests[-1]["variables"]["withReviews"]
+
+
+def test_get_pull_request_comments(server):
+    _, comments = get_client(server).get_pull_request("owner/repo", 3)
+
+    assert [("a.py", 1), ("b.py", 4)] == [(c["path"], c["position"]) for c in comments]
+    assert {"login": "me"} == comments[0]["user"]
+    assert "me" == server.requests[0]["variables"]["author"]
+
+
+def test_get_pull_request_missing(server):
+    with pytest.raises(GraphQLError):
+        get_client(server).get_pull_request("owner/repo", 404)
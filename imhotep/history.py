@@ -0,0 +1,139 @@
+import logging
+import os
+from typing import Dict, List, Optional, Sequence
+
+from .cache import load_json, save_json
+
+log = logging.getLogger(__name__)
+
+# One file per repo, since the files runtimes are kept for are only
+# meaningful within it.
+HISTORY_FILENAME = "imhotep-history-{}.json"
+
+# Per-file runtimes kept for each tool; the least recently run go first.
+MAX_FILES_PER_TOOL = 20000
+
+# Guess for tools we've never seen, so the first run still packs biggest
+# files first.
+DEFAULT_SECONDS_PER_BYTE = 1e-6
+
+# Weight given to the newest measurement when updating an estimate.
+SMOOTHING = 0.5
+
+
+def smooth(old: Optional[float], new: float) -> float:
+    if old is None:
+        return new
+    return old + SMOOTHING * (new - old)
+
+
+class RuntimeHistory:
+    """
+    How long each tool took on each file in previous runs, used to predict
+    how long a batch of files will take. Files we haven't seen are estimated
+    from their size, using the tool's average time per byte. Also remembers
+    how much memory each tool's invocations peaked at.
+
+    Kept for each repo, as JSON in the cache directory, if there is one.
+    """
+
+    def __init__(
+        self, cache_directory: Optional[str] = None, repo_name: str = ""
+    ) -> None:
+        self.cache_directory = cache_directory
+        self.repo_name = repo_name
+        self.tools: Dict[str, Dict] = {}
+        self.load()
+
+    @property
+    def path(self) -> Optional[str]:
+        if not self.cache_directory:
+            return None
+        filename = HISTORY_FILENAME.format(self.repo_name.replace("/", "__"))
+        return os.path.join(self.cache_directory, filename)
+
+    def get_tool(self, tool_key: str) -> Dict:
+        return self.tools.setdefault(
+            tool_key, {"files": {}, "per_byte": None, "whole_run": None}
+        )
+
+    def predict(
+        self, tool_key: str, filenames: Sequence[str], sizes: Sequence[int]
+    ) -> float:
+        """
+        Returns the expected seconds for `tool_key` to lint `filenames`,
+        whose sizes in bytes are `sizes`. An empty list means the tool finds
+        its own files.
+        """
+        tool = self.tools.get(tool_key)
+        if not filenames:
+            return (tool or {}).get("whole_run") or 0.0
+        per_byte = DEFAULT_SECONDS_PER_BYTE
+        files: Dict[str, float] = {}
+        if tool is not None:
+            per_byte = tool["per_byte"] or per_byte
+            files = tool["files"]
+        total = 0.0
+        for filename, size in zip(filenames, sizes):
+            seconds = files.get(filename)
+            total += seconds if seconds is not None else size * per_byte
+        return total
+
+    def record(
+        self,
+        tool_key: str,
+        filenames: Sequence[str],
+        sizes: Sequence[int],
+        seconds: float,
+    ) -> None:
+        tool = self.get_tool(tool_key)
+        if not filenames:
+            tool["whole_run"] = smooth(tool["whole_run"], seconds)
+            return
+        total_size = sum(sizes)
+        if total_size:
+            tool["per_byte"] = smooth(tool["per_byte"], seconds / total_size)
+        files = tool["files"]
+        for filename, size in zip(filenames, sizes):
+            if total_size:
+                share = seconds * size / total_size
+            else:
+                share = seconds / len(filenames)
+            # Re-insert so the dict stays ordered by when files were last run.
+            files[filename] = smooth(files.pop(filename, None), share)
+        for stale in list(files)[: max(0, len(files) - MAX_FILES_PER_TOOL)]:
+            del files[stale]
+
+    def record_memory(self, tool_key: str, peak: int) -> None:
+        tool = self.get_tool(tool_key)
+        tool["peak_memory"] = int(smooth(tool.get("peak_memory"), peak))
+
+    def get_peak_memory(self) -> Dict[str, int]:
+        """
+        Returns the memory each tool has been seen to use, in bytes.
+        """
+        return {
+            key: tool["peak_memory"]
+            for key, tool in self.tools.items()
+            if tool.get("peak_memory")
+        }
+
+    def load(self) -> None:
+        path = self.path
+        if path is not None:
+            self.tools = load_json(path, "runtime history") or {}
+
+    def save(self) -> None:
+        path = self.path
+        if path is not None:
+            save_json(path, self.tools, "runtime history")
+
+
+def get_sizes(dirname: str, filenames: Sequence[str]) -> List[int]:
+    sizes = []
+    for filename in filenames:
+        try:
+            sizes.append(os.path.getsize(os.path.join(dirname, filename)))
+        except OSError:
+            sizes.append(0)
+    return sizes
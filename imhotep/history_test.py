@@ -0,0 +1,84 @@
+import os
+
+from .history import (
+    DEFAULT_SECONDS_PER_BYTE,
+    HISTORY_FILENAME,
+    RuntimeHistory,
+    get_sizes,
+)
+
+
+def test_predict_unknown_tool_uses_size():
+    history = RuntimeHistory()
+    predicted = history.predict("t", ["a", "b"], [100, 300])
+    assert predicted == 400 * DEFAULT_SECONDS_PER_BYTE
+
+
+def test_predict_known_files():
+    history = RuntimeHistory()
+    history.record("t", ["a", "b"], [100, 300], 4.0)
+    assert history.predict("t", ["a"], [100]) == 1.0
+    assert history.predict("t", ["b"], [300]) == 3.0
+
+
+def test_predict_new_file_from_tool_rate():
+    history = RuntimeHistory()
+    history.record("t", ["a"], [100], 2.0)
+    assert history.predict("t", ["c"], [50]) == 1.0
+
+
+def test_predict_whole_run():
+    history = RuntimeHistory()
+    assert history.predict("t", [], []) == 0.0
+    history.record("t", [], [], 8.0)
+    assert history.predict("t", [], []) == 8.0
+
+
+def test_record_smooths():
+    history = RuntimeHistory()
+    history.record("t", ["a"], [100], 2.0)
+    history.record("t", ["a"], [100], 4.0)
+    assert history.predict("t", ["a"], [100]) == 3.0
+
+
+def test_round_trip(tmpdir):
+    history = RuntimeHistory(str(tmpdir), "a/b")
+    history.record("t", ["a"], [100], 2.0)
+    history.save()
+    assert os.path.exists(str(tmpdir.join(HISTORY_FILENAME.format("a__b"))))
+
+    assert RuntimeHistory(str(tmpdir), "a/b").predict("t", ["a"], [100]) == 2.0
+
+
+def test_kept_per_repo(tmpdir):
+    history = RuntimeHistory(str(tmpdir), "a/b")
+    history.record("t", ["setup.py"], [100], 2.0)
+    history.save()
+    other = RuntimeHistory(str(tmpdir), "c/d")
+    other.record("t", ["setup.py"], [100], 8.0)
+    other.save()
+
+    assert RuntimeHistory(str(tmpdir), "a/b").predict("t", ["setup.py"], [100]) == 2.0
+
+
+def test_no_cache_directory_doesnt_save():
+    history = RuntimeHistory()
+    history.record("t", ["a"], [100], 2.0)
+    history.save()
+
+
+def test_get_sizes(tmpdir):
+    tmpdir.join("a.py").write("12345")
+    assert get_sizes(str(tmpdir), ["a.py", "missing.py"]) == [5, 0]
+
+
+def test_peak_memory_round_trip(tmpdir):
+    history = RuntimeHistory(str(tmpdir), "a/b")
+    history.record("t", ["a"], [10], 1.0)
+    history.record_memory("t", 1000)
+    history.save()
+
+    loaded = RuntimeHistory(str(tmpdir), "a/b")
+    assert {"t": 1000} == loaded.get_peak_memory()
+    loaded.record_memory("t", 2000)
+    assert {"t": 1500} == loaded.get_peak_memory()
@@ -1,47 +1,199 @@
 import json
 import logging
+import os
+import time
 from typing import Dict, Optional
 
 import requests
 from requests.auth import HTTPBasicAuth
 from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from . import metrics
+from .cache import load_json, save_json
 
 log = logging.getLogger(__name__)
 
+HTTP_CACHE_FILENAME = "imhotep-http.json"
+
+# Bounds on the response cache; the least recently used responses go first.
+MAX_CACHED_RESPONSES = 1000
+MAX_CACHED_BYTES = 50 * 1024 * 1024
+
 
 class NoGithubCredentials(Exception):
     pass
 
 
+class ResponseCache:
+    """
+    Remembers JSON responses along with their ETag and Last-Modified
+    headers, so that GETs can be made conditional. GitHub answers those with
+    a 304 when nothing changed, which doesn't count against the rate limit.
+
+    Stored as JSON in the cache directory.
+    """
+
+    def __init__(
+        self,
+        cache_directory: str,
+        max_entries: int = MAX_CACHED_RESPONSES,
+        max_bytes: int = MAX_CACHED_BYTES,
+    ) -> None:
+        self.path = os.path.join(cache_directory, HTTP_CACHE_FILENAME)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.load()
+
+    def get_headers(self, key: str) -> Dict[str, str]:
+        """
+        Returns the headers making a GET of `key` conditional.
+        """
+        entry = self.entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get_response(self, key: str, url: str) -> Optional[Response]:
+        """
+        Rebuilds the response cached for `key`, after a 304.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        # Re-insert so the dict stays ordered by when entries were last used.
+        self.entries[key] = entry
+        self.dirty = True
+        self.hits += 1
+        metrics.cache_requests.inc(cache="http", result="hit")
+        response = Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        return response
+
+    def store(self, key: str, response: Response) -> None:
+        self.misses += 1
+        metrics.cache_requests.inc(cache="http", result="miss")
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        content_type = response.headers.get("Content-Type", "")
+        if not (etag or last_modified) or "json" not in content_type:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "status": response.status_code,
+            "headers": {"Content-Type": content_type},
+            "body": response.content.decode("utf-8", "replace"),
+        }
+        self.dirty = True
+        self.evict()
+
+    def evict(self) -> None:
+        total = sum(len(e["body"]) for e in self.entries.values())
+        for key in list(self.entries):
+            if len(self.entries) <= self.max_entries and total <= self.max_bytes:
+                break
+            total -= len(self.entries.pop(key)["body"])
+
+    def load(self) -> None:
+        self.entries = load_json(self.path, "HTTP cache") or {}
+
+    def save(self) -> None:
+        log.info("HTTP cache: %d hits, %d misses", self.hits, self.misses)
+        if self.dirty and save_json(self.path, self.entries, "HTTP cache"):
+            self.dirty = False
+
+
 class BasicAuthRequester:
     """
     Object used for issuing authenticated API calls.
     """
 
-    def __init__(self, username: str, password: str) -> None:
+    def __init__(
+        self, username: str, password: str, cache: Optional[ResponseCache] = None
+    ) -> None:
         self.username = username
         self.password = password
+        self.cache = cache
 
     def get_auth(self) -> Optional[HTTPBasicAuth]:
         if self.username and self.password:
             return HTTPBasicAuth(self.username, self.password)
         return None
 
-    def get(self, url: str) -> Response:
+    def get(self, url: str, accept: Optional[str] = None) -> Response:
+        """
+        GETs `url`, asking for the `accept` media type if given, e.g. a
+        pull request as a diff.
+        """
         log.debug("Fetching %s", url)
+        kwargs: Dict = {}
+        if accept is not None:
+            kwargs["headers"] = {"Accept": accept}
 
-        response = requests.get(url, auth=self.get_auth())
+        if self.cache is None:
+            response = self.request(
+                "GET", url, requests.get, auth=self.get_auth(), **kwargs
+            )
+        else:
+            # Users can see different things, so they don't share responses,
+            # and nor do the media types of a URL.
+            key = f"{self.username}:{url}"
+            if accept is not None:
+                key += f":{accept}"
+            headers = dict(kwargs.get("headers", {}), **self.cache.get_headers(key))
+            response = self.request(
+                "GET", url, requests.get, auth=self.get_auth(), headers=headers
+            )
+            if response.status_code == 304:
+                cached = self.cache.get_response(key, url)
+                if cached is not None:
+                    return cached
+            elif response.status_code < 300:
+                self.cache.store(key, response)
         if response.status_code > 400:
             log.warning("Error on GET to %s. Response: %s", url, response.content)
         return response
 
     def delete(self, url):
         log.debug("Deleting %s", url)
-        return requests.delete(url, auth=self.get_auth())
+        return self.request("DELETE", url, requests.delete, auth=self.get_auth())
 
     def post(self, url: str, payload: Dict) -> Response:
         log.debug("Posting %s to %s", payload, url)
-        response = requests.post(url, data=json.dumps(payload), auth=self.get_auth())
+        response = self.request(
+            "POST", url, requests.post, data=json.dumps(payload), auth=self.get_auth()
+        )
         if response.status_code > 400:
             log.warning("Error on POST to %s. Response: %s", url, response.content)
         return response
+
+    def request(self, method: str, url: str, send, **kwargs) -> Response:
+        """
+        Sends a request with `send`, counting it per endpoint and status.
+        """
+        start = time.monotonic()
+        response = send(url, **kwargs)
+        endpoint = metrics.get_endpoint(url)
+        metrics.github_requests.inc(
+            method=method,
+            endpoint=endpoint,
+            status=getattr(response, "status_code", ""),
+        )
+        metrics.github_request_seconds.observe(
+            time.monotonic() - start, method=method, endpoint=endpoint
+        )
+        return response
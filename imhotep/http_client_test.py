@@ -1,7 +1,10 @@
 import json
 from unittest import mock
 
-from imhotep.http_client import BasicAuthRequester
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from imhotep.http_client import BasicAuthRequester, ResponseCache
 
 
 def test_auth():
@@ -39,3 +42,72 @@ def test_post():
         payload = {"a": 2}
         ghr.post("url", payload)
         g.assert_called_with("url", data=json.dumps(payload), auth=mock.ANY)
+
+
+def json_response(status, body=b"", headers=None):
+    response = Response()
+    response.status_code = status
+    response._content = body
+    response.headers = CaseInsensitiveDict(headers or {})
+    return response
+
+
+def test_get_sends_validators_and_uses_cache_on_304(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    ghr = BasicAuthRequester("user", "pass", cache=cache)
+    headers = {"ETag": '"abc"', "Content-Type": "application/json"}
+    with mock.patch("requests.get") as g:
+        g.return_value = json_response(200, b'{"a": 1}', headers)
+        assert {"a": 1} == ghr.get("url").json()
+        g.assert_called_with("url", auth=mock.ANY, headers={})
+
+        g.return_value = json_response(304)
+        response = ghr.get("url")
+        g.assert_called_with("url", auth=mock.ANY, headers={"If-None-Match": '"abc"'})
+    assert 200 == response.status_code
+    assert {"a": 1} == response.json()
+    assert (1, 1) == (cache.hits, cache.misses)
+
+
+def test_response_cache_persists(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    headers = {"Last-Modified": "Mon, 01 Jan 2024", "Content-Type": "application/json"}
+    cache.store("key", json_response(200, b"[]", headers))
+    cache.save()
+
+    cache = ResponseCache(str(tmpdir))
+    assert {"If-Modified-Since": "Mon, 01 Jan 2024"} == cache.get_headers("key")
+    assert [] == cache.get_response("key", "url").json()
+
+
+def test_response_cache_skips_unvalidated_and_non_json(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    cache.store(
+        "plain", json_response(200, b"[]", {"Content-Type": "application/json"})
+    )
+    cache.store("raw", json_response(200, b"\x00", {"ETag": "x"}))
+    assert {} == cache.entries
+
+
+def test_response_cache_evicts_least_recently_used(tmpdir):
+    cache = ResponseCache(str(tmpdir), max_entries=2)
+    headers = {"ETag": "x", "Content-Type": "application/json"}
+    for key in ("a", "b"):
+        cache.store(key, json_response(200, b"[]", headers))
+    cache.get_response("a", "url")
+    cache.store("c", json_response(200, b"[]", headers))
+    assert ["a", "c"] == list(cache.entries)
+
+
+def test_get_caches_media_types_apart(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    ghr = BasicAuthRequester("user", "pass", cache=cache)
+    headers = {"ETag": '"abc"', "Content-Type": "application/json"}
+    with mock.patch("requests.get") as g:
+        g.return_value = json_response(200, b'{"a": 1}', headers)
+        ghr.get("url")
+        g.return_value = json_response(200, b"diff --git", {})
+        assert b"diff --git" == ghr.get("url", accept="application/x-diff").content
+        g.assert_called_with(
+            "url", auth=mock.ANY, headers={"Accept": "application/x-diff"}
+        )
@@ -25,6 +25,19 @@ class MockParserRetval:
         }
 
 
+def test_tool_globs():
+    args = parse_args(
+        ["--repo_name", "r", "--tool-exclude", "a:A=*.pyi", "--exclude", "docs/**"]
+    )
+    assert ["a:A=*.pyi"] == args.tool_exclude
+    assert ["docs/**"] == args.exclude
+    try:
+        parse_args(["--repo_name", "r", "--tool-exclude", "*.pyi"])
+        assert False, "Should raise an error if the tool isn't named"
+    except (SystemExit,):
+        pass
+
+
 def test_repo_required():
     try:
         parse_args([])
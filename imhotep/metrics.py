@@ -0,0 +1,242 @@
+"""
+Counters and histograms describing a run, written out in the OpenMetrics
+text format with `--metrics-file`.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    parts = ['{}="{}"'.format(k, escape(v)) for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{%s}" % ",".join(parts) if parts else ""
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, lock: threading.Lock) -> None:
+        self.name = name
+        self.help = help
+        self.lock = lock
+
+    def key(self, labels: Dict[str, object]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def render(self) -> List[str]:
+        return [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.help}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, lock: threading.Lock) -> None:
+        super().__init__(name, help, lock)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in sorted(self.values.items()):
+            lines.append(
+                f"{self.name}_total{format_labels(labels)} {format_value(value)}"
+            )
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        lock: threading.Lock,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, lock)
+        self.buckets = sorted(buckets)
+        # Per label set: a count per bucket (plus +Inf), then the sum.
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def count(self, **labels) -> int:
+        values = self.values.get(self.key(labels))
+        return values[0][-1] if values else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, (counts, total) in sorted(self.values.items()):
+            bounds = [format_value(b) for b in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                le = format_labels(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {counts[-1]}")
+            lines.append(
+                f"{self.name}_sum{format_labels(labels)} {format_value(total[0])}"
+            )
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        # Set when the metrics will be written, for measurements which cost
+        # something to take.
+        self.enabled = False
+
+    def counter(self, name: str, help: str) -> Counter:
+        counter = Counter(name, help, self.lock)
+        self.metrics[name] = counter
+        return counter
+
+    def histogram(
+        self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        histogram = Histogram(name, help, self.lock, buckets)
+        self.metrics[name] = histogram
+        return histogram
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self.lock:
+            for name in sorted(self.metrics):
+                lines.extend(self.metrics[name].render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        try:
+            with open(path, "w") as f:
+                f.write(self.render())
+        except OSError as e:
+            log.warning("Could not write metrics to %s: %s", path, e)
+
+
+registry = Registry()
+
+diff_files = registry.counter("imhotep_diff_files", "Files in the diff.")
+diff_bytes = registry.counter("imhotep_diff_bytes", "Size of the diff in bytes.")
+tool_violations = registry.counter(
+    "imhotep_tool_violations", "Violations each tool found, on any line."
+)
+matched_violations = registry.counter(
+    "imhotep_matched_violations", "Violations on lines the diff added."
+)
+subprocess_seconds = registry.histogram(
+    "imhotep_subprocess_seconds", "Time taken by each subprocess run."
+)
+git_fetch_seconds = registry.histogram(
+    "imhotep_git_fetch_seconds", "Time taken by each clone or fetch."
+)
+git_fetch_bytes = registry.counter(
+    "imhotep_git_fetch_bytes", "Growth of the object store from clones and fetches."
+)
+github_requests = registry.counter("imhotep_github_requests", "GitHub API requests.")
+github_request_seconds = registry.histogram(
+    "imhotep_github_request_seconds", "Latency of GitHub API requests."
+)
+cache_requests = registry.counter(
+    "imhotep_cache_requests", "Lookups in imhotep's caches, by cache and result."
+)
+
+ENDPOINT_PATTERNS = [
+    (re.compile(r"^(https?://[^/]+)?(/api/v3)?"), ""),
+    (re.compile(r"\?.*$"), ""),
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{owner}/{repo}"),
+    (re.compile(r"/contents/.*$"), "/contents/{path}"),
+    (re.compile(r"/[0-9a-f]{40}(?=/|$)"), "/{sha}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{number}"),
+]
+
+
+def get_endpoint(url: str) -> str:
+    """
+    Reduces an API URL to its endpoint, e.g.
+    /repos/{owner}/{repo}/pulls/{number}/comments, so requests can be
+    counted per endpoint.
+    """
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        url = pattern.sub(replacement, url)
+    return url or "/"
+
+
+def get_object_bytes(executor, dirname: str) -> Optional[int]:
+    """
+    Returns the size of a git object store, from `git count-objects`.
+    """
+    output = executor(f"cd {dirname} && git count-objects -v")
+    if not isinstance(output, bytes):
+        return None
+    sizes = dict(
+        line.split(": ", 1) for line in output.decode().splitlines() if ": " in line
+    )
+    try:
+        return (int(sizes["size"]) + int(sizes["size-pack"])) * 1024
+    except (KeyError, ValueError):
+        return None
+
+
+@contextmanager
+def measure_fetch(executor, dirname: str) -> Iterator[None]:
+    """
+    Times a clone or fetch into `dirname`. When the metrics will be written,
+    also measures how much the object store grew.
+    """
+    before = None
+    if registry.enabled and os.path.isdir(dirname):
+        before = get_object_bytes(executor, dirname)
+    with git_fetch_seconds.time():
+        yield
+    if registry.enabled:
+        after = get_object_bytes(executor, dirname)
+        if after is not None:
+            git_fetch_bytes.inc(max(0, after - (before or 0)))
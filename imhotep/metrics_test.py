@@ -0,0 +1,77 @@
+import subprocess
+
+from .metrics import Registry, get_endpoint, get_object_bytes
+
+
+def test_render_counter():
+    registry = Registry()
+    requests = registry.counter("imhotep_requests", "Requests.")
+    requests.inc(method="GET", status=200)
+    requests.inc(2, method="GET", status=200)
+    requests.inc(method="POST", status=201)
+
+    assert (
+        "# TYPE imhotep_requests counter\n"
+        "# HELP imhotep_requests Requests.\n"
+        'imhotep_requests_total{method="GET",status="200"} 3\n'
+        'imhotep_requests_total{method="POST",status="201"} 1\n'
+        "# EOF\n"
+    ) == registry.render()
+
+
+def test_render_histogram():
+    registry = Registry()
+    seconds = registry.histogram("imhotep_seconds", "Seconds.", buckets=[1, 5])
+    seconds.observe(0.5)
+    seconds.observe(3)
+    seconds.observe(10)
+
+    assert 3 == seconds.count()
+    assert (
+        "# TYPE imhotep_seconds histogram\n"
+        "# HELP imhotep_seconds Seconds.\n"
+        'imhotep_seconds_bucket{le="1"} 1\n'
+        'imhotep_seconds_bucket{le="5"} 2\n'
+        'imhotep_seconds_bucket{le="+Inf"} 3\n'
+        "imhotep_seconds_count 3\n"
+        "imhotep_seconds_sum 13.5\n"
+        "# EOF\n"
+    ) == registry.render()
+
+
+def test_escapes_label_values():
+    registry = Registry()
+    registry.counter("imhotep_things", "Things.").inc(name='a "b"\\c')
+    assert 'imhotep_things_total{name="a \\"b\\"\\\\c"} 1' in registry.render()
+
+
+def test_write(tmp_path):
+    registry = Registry()
+    registry.counter("imhotep_things", "Things.").inc()
+    path = tmp_path / "metrics.txt"
+    registry.write(str(path))
+    assert path.read_text().endswith("imhotep_things_total 1\n# EOF\n")
+
+
+def test_get_endpoint():
+    assert "/repos/{owner}/{repo}/pulls/{number}/comments" == get_endpoint(
+        "https://api.github.com/repos/o/r/pulls/12/comments?per_page=100&page=2"
+    )
+    assert "/repos/{owner}/{repo}/contents/{path}" == get_endpoint(
+        "https://ghe.example.com/api/v3/repos/o/r/contents/a/b.py?ref=abc"
+    )
+    assert "/repos/{owner}/{repo}/commits/{sha}/comments" == get_endpoint(
+        "https://api.github.com/repos/o/r/commits/" + "a" * 40 + "/comments"
+    )
+    assert "/graphql" == get_endpoint("https://api.github.com/graphql")
+
+
+def test_get_object_bytes(tmp_path):
+    def run(cmd):
+        return subprocess.run(cmd, shell=True, capture_output=True).stdout
+
+    run(f"git init -q {tmp_path}")
+    (tmp_path / "a.txt").write_text("hello\n" * 1000)
+    run(f"cd {tmp_path} && git add a.txt")
+    assert get_object_bytes(run, str(tmp_path)) > 0
+    assert get_object_bytes(lambda cmd: None, str(tmp_path)) is None
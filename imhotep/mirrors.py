@@ -0,0 +1,91 @@
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+
+class MirrorStore:
+    """
+    Keeps one bare `--mirror` clone of each repo, so that working clones can
+    be made from local objects instead of fetching everything over the
+    network again.
+
+    Mirrors are refreshed with a single incremental fetch per run. Working
+    clones borrow the mirror's objects through git alternates, so they take
+    almost no disk. A mirror must never drop an object a clone borrows, even
+    once a force-push leaves it unreachable, so mirrors are set to never
+    prune (`gc.pruneExpire=never`). `RepoCache` bounds the growth instead,
+    by evicting a mirror together with the checkout borrowing from it.
+    """
+
+    def __init__(self, directory: str, executor: Callable) -> None:
+        self.directory = os.path.abspath(directory)
+        self.executor = executor
+
+    def mirror_dir(self, repo_name: str) -> str:
+        return os.path.join(self.directory, repo_name.replace("/", "__") + ".git")
+
+    def is_borrowed_by(self, repo_name: str, dirname: str) -> bool:
+        """
+        Whether the checkout in `dirname` borrows objects from the mirror of
+        `repo_name`, i.e. was cloned from it.
+        """
+        objects = os.path.join(self.mirror_dir(repo_name), "objects")
+        alternates = os.path.join(dirname, ".git", "objects", "info", "alternates")
+        try:
+            with open(alternates) as f:
+                return objects in (line.strip() for line in f)
+        except OSError:
+            return False
+
+    def update(self, repo_name: str, url: str) -> str:
+        """
+        Creates or refreshes the mirror of `repo_name`, returning its path.
+        """
+        path = self.mirror_dir(repo_name)
+        self.executor(f"mkdir -p {self.directory}")
+        with self.locked(path):
+            if os.path.isdir(path):
+                log.debug("Refreshing mirror %s", path)
+                metrics.cache_requests.inc(cache="mirror", result="hit")
+                with metrics.measure_fetch(self.executor, path):
+                    self.executor(f"cd {path} && git fetch --prune origin")
+            else:
+                log.debug("Mirroring %s to %s", url, path)
+                metrics.cache_requests.inc(cache="mirror", result="miss")
+                with metrics.measure_fetch(self.executor, path):
+                    self.executor(f"git clone --mirror {url} {path}")
+            # Also applied to mirrors made before this was set.
+            self.executor(f"cd {path} && git config gc.pruneExpire never")
+        return path
+
+    @contextmanager
+    def locked(self, path: str) -> Iterator[None]:
+        """
+        Makes runs sharing the store take turns, so they don't fetch into the
+        same mirror at once. A lock we can't take only costs us that.
+        """
+        try:
+            lock = open(path + ".lock", "w")
+        except OSError as e:
+            log.warning("Could not lock mirror %s: %s", path, e)
+            yield
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def clone(self, mirror: str, url: str, dirname: str) -> None:
+        """
+        Makes a working clone of `mirror` in `dirname` which shares its
+        objects. `origin` points at the mirror, so later fetches are local
+        too, while `upstream` keeps the real URL for reference.
+        """
+        log.debug("Cloning %s from mirror %s", dirname, mirror)
+        self.executor(f"git clone --shared {mirror} {dirname}")
+        self.executor(f"cd {dirname} && git remote add upstream {url}")
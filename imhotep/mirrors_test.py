@@ -0,0 +1,53 @@
+import os
+import subprocess
+
+from .app import run
+from .mirrors import MirrorStore
+
+
+def git(dirname, *args):
+    return subprocess.check_output(["git", "-C", dirname, *args]).decode().strip()
+
+
+def make_upstream(tmp_path):
+    upstream = str(tmp_path / "upstream")
+    os.makedirs(upstream)
+    git(upstream, "init", "-q")
+    git(upstream, "config", "user.email", "test@example.com")
+    git(upstream, "config", "user.name", "test")
+    with open(os.path.join(upstream, "a.py"), "w") as f:
+        f.write("a = 1\n")
+    git(upstream, "add", "a.py")
+    git(upstream, "commit", "-qm", "first")
+    return upstream
+
+
+def test_mirror_dir():
+    store = MirrorStore("/cache/mirrors", run)
+    assert "/cache/mirrors/a__b.git" == store.mirror_dir("a/b")
+
+
+def test_clone_shares_mirror_objects(tmp_path):
+    upstream = make_upstream(tmp_path)
+    store = MirrorStore(str(tmp_path / "mirrors"), run)
+    mirror = store.update("a/b", upstream)
+    assert "true" == git(mirror, "rev-parse", "--is-bare-repository")
+    assert "never" == git(mirror, "config", "gc.pruneExpire")
+
+    clone = str(tmp_path / "clone")
+    store.clone(mirror, upstream, clone)
+    alternates = os.path.join(clone, ".git", "objects", "info", "alternates")
+    with open(alternates) as f:
+        assert os.path.join(mirror, "objects") == f.read().strip()
+    assert git(upstream, "rev-parse", "HEAD") == git(clone, "rev-parse", "HEAD")
+    assert upstream == git(clone, "remote", "get-url", "upstream")
+
+
+def test_update_fetches_new_commits(tmp_path):
+    upstream = make_upstream(tmp_path)
+    store = MirrorStore(str(tmp_path / "mirrors"), run)
+    mirror = store.update("a/b", upstream)
+    git(upstream, "commit", "-q", "--allow-empty", "-m", "second")
+
+    assert mirror == store.update("a/b", upstream)
+    assert git(upstream, "rev-parse", "HEAD") == git(mirror, "rev-parse", "HEAD")
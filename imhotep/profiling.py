@@ -0,0 +1,107 @@
+"""
+Profiles each phase of a run with cProfile and tracemalloc, for when a big
+job is slow or uses too much memory. Turned on with `--profile-cpu` and
+`--profile-memory`.
+"""
+
+import cProfile
+import logging
+import os
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = "imhotep-profile"
+
+# How many of the biggest allocation sites to list per phase.
+TOP_ALLOCATIONS = 25
+
+
+class Profiler:
+    """
+    Writes `<phase>.pstats` and `<phase>-memory.txt` to `directory` for each
+    phase run under `phase`.
+
+    cProfile only sees the thread that started it, so the analysis phase's
+    profile shows time spent waiting on the linter threads rather than in
+    them. tracemalloc sees every thread.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_PROFILE_DIR,
+        cpu: bool = False,
+        memory: bool = False,
+    ) -> None:
+        self.directory = directory
+        self.cpu = cpu
+        self.memory = memory
+        self.started_tracing = False
+        if (cpu or memory) and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @property
+    def enabled(self) -> bool:
+        return self.cpu or self.memory
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile() if self.cpu else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self.path(f"{name}.pstats"))
+            if self.memory:
+                self.write_memory_report(name, before)
+            log.debug("Profiled the %s phase", name)
+
+    def write_memory_report(self, name: str, before: int) -> None:
+        """
+        Lists the biggest allocation sites still live at the end of the
+        phase, with how much it retained and its peak, e.g. the diff's
+        parse results or the merged linter results.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        with open(self.path(f"{name}-memory.txt"), "w") as out:
+            out.write(f"Phase: {name}\n")
+            out.write(f"Peak traced memory: {format_bytes(peak)}\n")
+            out.write(f"Retained by phase: {format_bytes(current - before)}\n")
+            out.write(f"Top {TOP_ALLOCATIONS} allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                out.write(f"  {stat}\n")
+
+    def close(self) -> None:
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        if self.enabled:
+            log.info("Wrote profiles to %s", self.directory)
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024  # type: ignore
+    return f"{size:.1f} GiB"
@@ -0,0 +1,42 @@
+import os
+import pstats
+import tracemalloc
+
+from .profiling import Profiler, format_bytes
+
+
+def test_writes_profiles_per_phase(tmp_path):
+    directory = str(tmp_path / "profiles")
+    profiler = Profiler(directory, cpu=True, memory=True)
+
+    with profiler.phase("parse"):
+        kept = [str(i) * 10 for i in range(10000)]
+    profiler.close()
+
+    assert {"parse.pstats", "parse-memory.txt"} == set(os.listdir(directory))
+    stats = pstats.Stats(os.path.join(directory, "parse.pstats"))
+    assert stats.total_calls > 0
+    with open(os.path.join(directory, "parse-memory.txt")) as f:
+        report = f.read()
+    assert "Phase: parse\n" in report
+    assert "Peak traced memory: " in report
+    assert "profiling_test.py" in report
+    assert not tracemalloc.is_tracing()
+    assert kept
+
+
+def test_disabled_writes_nothing(tmp_path):
+    directory = str(tmp_path / "profiles")
+    profiler = Profiler(directory)
+
+    with profiler.phase("parse"):
+        pass
+    profiler.close()
+
+    assert not os.path.exists(directory)
+
+
+def test_format_bytes():
+    assert "512 B" == format_bytes(512)
+    assert "1.5 KiB" == format_bytes(1536)
+    assert "2.0 GiB" == format_bytes(2 * 1024**3)
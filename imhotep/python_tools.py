@@ -0,0 +1,181 @@
+"""
+Support for linters with a Python API, run inside a pool of worker processes
+which have already imported them.
+"""
+
+import atexit
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .tools import Tool
+from .zygote import ZygoteClient, ZygoteError
+
+log = logging.getLogger(__name__)
+
+POOL_SIZE = os.cpu_count() or 1
+
+pools: Dict[Tuple[str, ...], ProcessPoolExecutor] = {}
+pools_lock = threading.Lock()
+
+# Set by `use_zygote` to send batches to a zygote rather than our own pool.
+zygote: Optional[ZygoteClient] = None
+
+
+def get_mp_context():
+    # Forking a process which already has threads running can deadlock the
+    # child, so start workers from a clean server process where we can.
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def import_modules(modules: Iterable[str]) -> None:
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            log.warning("Couldn't import %s in worker", module)
+
+
+def use_zygote(socket_path: str) -> bool:
+    """
+    Sends Python API lint batches to the zygote listening on `socket_path`,
+    if there is one. Returns whether it could be reached.
+    """
+    global zygote
+    client = ZygoteClient(socket_path)
+    if not client.is_available():
+        log.warning("No zygote at %s; using a worker pool.", socket_path)
+        return False
+    zygote = client
+    return True
+
+
+def get_pool(modules: Iterable[str]) -> ProcessPoolExecutor:
+    """
+    Returns the pool whose workers have imported `modules`, starting it if
+    need be. Pools are shared between tools which import the same modules.
+    """
+    key = tuple(sorted(modules))
+    with pools_lock:
+        if key not in pools:
+            log.debug("Starting worker pool for %s", key)
+            pools[key] = ProcessPoolExecutor(
+                max_workers=POOL_SIZE,
+                mp_context=get_mp_context(),
+                initializer=import_modules,
+                initargs=(key,),
+            )
+        return pools[key]
+
+
+def noop() -> None:
+    pass
+
+
+def warm_up(tools: Iterable) -> None:
+    """
+    Gets the pools for any Python API tools started, so their imports happen
+    while the rest of the run is being set up.
+    """
+    if zygote is not None:
+        return
+    for tool in tools:
+        if isinstance(tool, PythonApiTool):
+            pool = get_pool(tool.api_modules)
+            for _ in range(POOL_SIZE):
+                pool.submit(noop)
+
+
+def shutdown_pools() -> None:
+    with pools_lock:
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+        pools.clear()
+
+
+atexit.register(shutdown_pools)
+
+
+def run_lint(klass, dirname, filenames, linter_configs):
+    return list(klass.lint(dirname, filenames, linter_configs))
+
+
+class PythonApiTool(Tool):
+    """
+    A tool which calls a linter's Python API rather than running a command.
+
+    Subclasses list the modules to import up front in `api_modules` and
+    implement the `lint` classmethod, which runs in a worker process and
+    yields (filename, line_number, message) tuples. Subclasses must be
+    importable at module level so that workers can find them.
+    """
+
+    api_modules: List[str] = []
+    batch_size = 50
+
+    @classmethod
+    def lint(cls, dirname, filenames, linter_configs):
+        """
+        Lints `filenames`, which are relative to `dirname`, yielding
+        (filename, line_number, message) tuples.
+        """
+        raise NotImplementedError()
+
+    def find_files(self, dirname):
+        extensions = tuple(self.get_file_extensions())
+        found = []
+        for root, dirs, files in os.walk(dirname):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            for f in files:
+                if f.endswith(extensions):
+                    found.append(os.path.relpath(os.path.join(root, f), dirname))
+        return found
+
+    def invoke(self, dirname, filenames=set(), linter_configs=set()):
+        retval = defaultdict(lambda: defaultdict(list))
+        if len(filenames):
+            extensions = [e.lstrip(".") for e in self.get_file_extensions()]
+            filenames = [f for f in filenames if f.split(".")[-1] in extensions]
+        else:
+            filenames = self.find_files(dirname)
+        if not filenames:
+            return {}
+
+        configs = sorted(linter_configs)
+        batches = [
+            filenames[i : i + self.batch_size]
+            for i in range(0, len(filenames), self.batch_size)
+        ]
+        for results in self.run_batches(dirname, batches, configs):
+            for filename, lineno, message in results:
+                if filename.startswith(dirname):
+                    filename = filename[len(dirname) + 1 :]
+                retval[filename][str(lineno)].append(message)
+        return retval
+
+    def run_batches(self, dirname, batches, configs):
+        if zygote is not None:
+            try:
+                with ThreadPoolExecutor(max_workers=POOL_SIZE) as threads:
+                    return list(
+                        threads.map(
+                            lambda b: zygote.lint(self.__class__, dirname, b, configs),
+                            batches,
+                        )
+                    )
+            except ZygoteError as e:
+                log.warning("Zygote failed (%s); using a worker pool.", e)
+
+        pool = get_pool(self.api_modules)
+        futures = [
+            pool.submit(run_lint, self.__class__, dirname, batch, configs)
+            for batch in batches
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,88 @@
+import os
+from unittest import mock
+
+from . import python_tools
+from .python_tools import PythonApiTool, get_pool
+from .zygote import ZygoteError
+
+
+class LengthTool(PythonApiTool):
+    """Complains about every file, reporting the pid it ran in."""
+
+    api_modules = ["json"]
+    file_extensions = [".py"]
+
+    @classmethod
+    def lint(cls, dirname, filenames, linter_configs):
+        import sys
+
+        assert "json" in sys.modules
+        for f in filenames:
+            yield os.path.join(dirname, f), 1, "linted in %d" % os.getpid()
+
+
+def test_invoke_runs_in_worker():
+    t = LengthTool(mock.Mock())
+    retval = t.invoke("/woobie", filenames=["a.py", "b.js", "c/d.py"])
+
+    assert set(retval.keys()) == {"a.py", "c/d.py"}
+    message = retval["a.py"]["1"][0]
+    assert message.startswith("linted in ")
+    assert message != "linted in %d" % os.getpid()
+    assert not t.executor.called
+
+
+def test_invoke_batches_files():
+    t = LengthTool(mock.Mock())
+    t.batch_size = 2
+    filenames = ["f%d.py" % i for i in range(5)]
+    retval = t.invoke("/woobie", filenames=filenames)
+
+    assert sorted(retval.keys()) == filenames
+
+
+def test_invoke_finds_files_without_filenames(tmpdir):
+    tmpdir.join("a.py").write("")
+    tmpdir.mkdir("sub").join("b.py").write("")
+    tmpdir.join("c.txt").write("")
+    tmpdir.mkdir(".git").join("d.py").write("")
+    t = LengthTool(mock.Mock())
+    retval = t.invoke(str(tmpdir))
+
+    assert sorted(retval.keys()) == ["a.py", "sub/b.py"]
+
+
+def test_pools_shared_by_modules():
+    assert get_pool(["json"]) is get_pool(["json"])
+
+
+def test_warm_up_ignores_other_tools():
+    with mock.patch.object(python_tools, "get_pool") as pool:
+        python_tools.warm_up([mock.Mock()])
+    assert not pool.called
+
+
+def test_invoke_uses_zygote():
+    client = mock.Mock()
+    client.lint.return_value = [["/woobie/a.py", 3, "from zygote"]]
+    t = LengthTool(mock.Mock())
+    with mock.patch.object(python_tools, "zygote", client):
+        retval = t.invoke("/woobie", filenames=["a.py"])
+
+    assert retval["a.py"]["3"] == ["from zygote"]
+    client.lint.assert_called_with(LengthTool, "/woobie", ["a.py"], [])
+
+
+def test_invoke_falls_back_when_zygote_fails():
+    client = mock.Mock()
+    client.lint.side_effect = ZygoteError("gone")
+    t = LengthTool(mock.Mock())
+    with mock.patch.object(python_tools, "zygote", client):
+        retval = t.invoke("/woobie", filenames=["a.py"])
+
+    assert retval["a.py"]["1"][0].startswith("linted in ")
+
+
+def test_use_zygote__unavailable(tmpdir):
+    assert not python_tools.use_zygote(str(tmpdir.join("missing.sock")))
+    assert python_tools.zygote is None
@@ -0,0 +1,251 @@
+"""
+Lints a pull request without cloning the repository, by fetching just the
+files it changes (and the config and .gitattributes files near them) through
+GitHub's API into a temporary tree. The diff is put together from the
+patches the API returns, and the file index from the paths fetched.
+"""
+
+import base64
+import fnmatch
+import logging
+import os
+from tempfile import mkdtemp
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, cast
+from urllib.parse import quote
+
+from imhotep.http_client import BasicAuthRequester
+
+from .configs import parent_dir
+from .files import FileIndex
+from .filters import GITATTRIBUTES
+from .repomanagers import RepoManager
+from .repositories import Repository
+from .shas import get_api_url
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+DIFF_MEDIA_TYPE = "application/vnd.github.diff"
+
+
+def can_lint_without_clone(tools: Iterable[Any]) -> bool:
+    return all(not getattr(t, "requires_full_tree", True) for t in tools)
+
+
+def build_diff(files: List[Dict[str, Any]]) -> str:
+    """
+    Turns the pull request files API's patches back into a unified diff.
+    """
+    lines = []
+    for f in files:
+        patch = f.get("patch")
+        if patch is None:
+            # Binary, or too big for the API to diff.
+            continue
+        origin = f.get("previous_filename", f["filename"])
+        lines.append(f"diff --git a/{origin} b/{f['filename']}")
+        lines.append(f"--- a/{origin}")
+        lines.append(f"+++ b/{f['filename']}")
+        lines.append(patch)
+    return "\n".join(lines) + "\n"
+
+
+class RemoteTreeRepository(Repository):
+    """
+    A temporary tree holding only the files under review, at the PR's head.
+    It isn't a git repo, so the diff and file index are filled in by the
+    manager.
+    """
+
+    diff = b""
+    file_index: Optional[FileIndex] = None
+    # Set by the manager, for asking GitHub about history we don't have.
+    requester: Optional[BasicAuthRequester] = None
+    api_url = ""
+
+    def apply_commit(self, commit: str) -> None:
+        # The tree is only ever at the head commit.
+        pass
+
+    def diff_commit(self, commit: str, compare_point: Optional[str] = None) -> bytes:
+        return self.diff
+
+    def is_ancestor(self, ancestor: str, commit: str) -> bool:
+        if self.requester is None:
+            return False
+        url = "{}/repos/{}/compare/{}...{}?per_page=1".format(
+            self.api_url, self.name, ancestor, commit
+        )
+        response = self.requester.get(url)
+        if response.status_code >= 400:
+            return False
+        return response.json().get("status") in ("ahead", "identical")
+
+    def get_file_index(self) -> Optional[FileIndex]:
+        return self.file_index
+
+
+class RemoteTreeManager(RepoManager):
+    """
+    Builds a `RemoteTreeRepository` for a pull request instead of cloning.
+    Only usable when every tool lints files on their own; see
+    `can_lint_without_clone`.
+    """
+
+    def __init__(self, requester: BasicAuthRequester, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.requester = requester
+        self.api_url = get_api_url(self.domain or "github.com")
+        # The partial tree mustn't be mistaken for a clone, so it never goes
+        # in the cache directory.
+        self.should_cleanup = self.dir_override is None
+        self.cache = None
+        self.mirrors = None
+        # The PR's changed files, when GraphQL has already listed them, as
+        # `PRInfo.changed_files`. Then only the diff needs fetching.
+        self.changed_files: Optional[List[Dict[str, Any]]] = None
+
+    def get_repo_class(self):
+        return RemoteTreeRepository
+
+    def clone_dir(self, repo_name: str) -> str:
+        return mkdtemp(suffix=repo_name.replace("/", "__"))
+
+    def clone_repo(
+        self,
+        repo_name: str,
+        remote_repo,
+        ref: str,
+        commits: Sequence[str] = (),
+        pr_number: Optional[str] = None,
+    ) -> Repository:
+        if pr_number is None or not commits or not commits[0]:
+            raise RuntimeError("A clone-free run needs a pull request's head commit")
+        head = commits[0]
+        self.shallow_clone = True
+        dirname, repo = self.set_up_clone(repo_name, remote_repo)
+
+        if self.changed_files is not None:
+            changed = [f["path"] for f in self.changed_files]
+            paths = [
+                f["path"]
+                for f in self.changed_files
+                if f.get("changeType") != "DELETED"
+            ]
+            diff = self.get_pr_diff(repo_name, pr_number)
+        else:
+            files = self.get_pr_files(repo_name, pr_number)
+            changed = [f["filename"] for f in files]
+            paths = [f["filename"] for f in files if f["status"] != "removed"]
+            diff = build_diff(files).encode("utf-8")
+        log.debug("Fetching %d changed files at %s", len(paths), head)
+        paths += self.find_configs(repo_name, head, changed)
+        blobs = {}
+        for path in dict.fromkeys(paths):
+            blob = self.write_file(repo_name, head, path, dirname)
+            if blob is not None:
+                blobs[path] = blob
+        tree = cast(RemoteTreeRepository, repo)
+        tree.diff = diff
+        tree.file_index = FileIndex(list(blobs), blobs)
+        tree.requester = self.requester
+        tree.api_url = self.api_url
+        return repo
+
+    def get_pr_files(self, repo_name: str, pr_number: str) -> List[Dict[str, Any]]:
+        files: List[Dict[str, Any]] = []
+        page = 1
+        while True:
+            url = "{}/repos/{}/pulls/{}/files?per_page={}&page={}".format(
+                self.api_url, repo_name, pr_number, PAGE_SIZE, page
+            )
+            response = self.requester.get(url)
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f"Couldn't list the files of {repo_name}#{pr_number}"
+                )
+            batch = response.json()
+            files.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                return files
+            page += 1
+
+    def get_pr_diff(self, repo_name: str, pr_number: str) -> bytes:
+        """
+        Fetches the whole diff of a pull request in one request.
+        """
+        url = f"{self.api_url}/repos/{repo_name}/pulls/{pr_number}"
+        response = self.requester.get(url, accept=DIFF_MEDIA_TYPE)
+        if response.status_code >= 400:
+            raise RuntimeError(f"Couldn't get the diff of {repo_name}#{pr_number}")
+        return response.content
+
+    def get_contents(self, repo_name: str, ref: str, path: str):
+        url = "{}/repos/{}/contents{}?ref={}".format(
+            self.api_url, repo_name, "/" + quote(path) if path else "", ref
+        )
+        response = self.requester.get(url)
+        if response.status_code >= 400:
+            return None
+        return response.json()
+
+    def write_file(
+        self, repo_name: str, ref: str, path: str, dirname: str
+    ) -> Optional[str]:
+        """
+        Writes `path` at `ref` into `dirname`, returning its blob hash, or
+        None if it couldn't be fetched.
+        """
+        contents = self.get_contents(repo_name, ref, path)
+        if not isinstance(contents, dict) or contents.get("type") != "file":
+            log.warning("Couldn't fetch %s at %s", path, ref)
+            return None
+        if contents.get("encoding") == "base64":
+            data = base64.b64decode(contents["content"])
+        else:
+            # Files over 1MB have to be downloaded separately.
+            data = self.requester.get(contents["download_url"]).content
+        target = os.path.join(dirname, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as out:
+            out.write(data)
+        return contents.get("sha", "")
+
+    def get_config_patterns(self) -> Set[str]:
+        # FileFilter reads these to skip generated and vendored files.
+        patterns = {GITATTRIBUTES}
+        for tool in self.tools:
+            patterns.update(tool.get_configs() or [])
+        return patterns
+
+    def find_configs(
+        self, repo_name: str, ref: str, filenames: Sequence[str]
+    ) -> List[str]:
+        """
+        Returns the paths of config and .gitattributes files in the
+        directories containing `filenames` and their parents, listing each
+        directory once. Config patterns are matched against file names, so
+        ones naming a file in a subdirectory aren't found.
+        """
+        patterns = self.get_config_patterns()
+        directories: Set[str] = set()
+        for filename in filenames:
+            directory = parent_dir(filename)
+            while directory not in directories:
+                directories.add(directory)
+                if not directory:
+                    break
+                directory = parent_dir(directory)
+
+        found = []
+        for directory in sorted(directories):
+            listing = self.get_contents(repo_name, ref, directory)
+            if not isinstance(listing, list):
+                continue
+            for entry in listing:
+                if entry["type"] != "file":
+                    continue
+                if any(fnmatch.fnmatch(entry["name"], p) for p in patterns):
+                    found.append(entry["path"])
+        return found
@@ -0,0 +1,191 @@
+import base64
+import os
+import shutil
+from unittest import mock
+
+import pytest
+
+from .app import use_clone_free
+from .diff_parser import DiffContextParser
+from .remote_tree import (
+    DIFF_MEDIA_TYPE,
+    RemoteTreeManager,
+    build_diff,
+    can_lint_without_clone,
+)
+from .testing_utils import JsonWrapper
+from .tools import Tool
+
+API = "https://api.github.com/repos/a/b"
+
+PATCH = "@@ -1,1 +1,2 @@\n import os\n+import sys"
+
+
+class SingleFileTool(Tool):
+    requires_full_tree = False
+
+    def get_configs(self):
+        return {".lintrc"}
+
+
+class FakeRequester:
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+
+    def get(self, url, accept=None):
+        self.urls.append(url)
+        key = url if accept is None else (url, accept)
+        if key not in self.responses:
+            return JsonWrapper({"message": "Not Found"}, 404)
+        response = JsonWrapper(self.responses[key], 200)
+        response.content = self.responses[key]
+        return response
+
+
+def blob(text):
+    return {
+        "type": "file",
+        "encoding": "base64",
+        "content": base64.b64encode(text.encode()).decode(),
+        "sha": f"sha-{len(text)}",
+    }
+
+
+@pytest.fixture
+def requester():
+    return FakeRequester(
+        {
+            f"{API}/pulls/3/files?per_page=100&page=1": [
+                {"filename": "pkg/a.py", "status": "modified", "patch": PATCH},
+                {
+                    "filename": "old.py",
+                    "status": "removed",
+                    "patch": "@@ -1,1 +0,0 @@\n-x",
+                },
+            ],
+            f"{API}/contents/pkg/a.py?ref=head": blob("import os\nimport sys\n"),
+            f"{API}/contents?ref=head": [
+                {"type": "file", "name": ".lintrc", "path": ".lintrc"},
+                {"type": "file", "name": "setup.py", "path": "setup.py"},
+            ],
+            f"{API}/contents/pkg?ref=head": [
+                {"type": "file", "name": "a.py", "path": "pkg/a.py"},
+                {
+                    "type": "file",
+                    "name": ".gitattributes",
+                    "path": "pkg/.gitattributes",
+                },
+            ],
+            f"{API}/contents/.lintrc?ref=head": blob("[lint]\n"),
+            f"{API}/contents/pkg/.gitattributes?ref=head": blob("*.pb.py binary\n"),
+        }
+    )
+
+
+def test_can_lint_without_clone():
+    assert can_lint_without_clone([SingleFileTool(None)])
+    assert not can_lint_without_clone([SingleFileTool(None), Tool(None)])
+
+
+def test_use_clone_free_needs_pr():
+    assert use_clone_free("3", [SingleFileTool(None)])
+    assert not use_clone_free(None, [SingleFileTool(None)])
+    assert not use_clone_free("3", [Tool(None)])
+
+
+def test_build_diff_parses():
+    diff = build_diff(
+        [
+            {"filename": "a.py", "patch": PATCH},
+            {"filename": "logo.png"},
+        ]
+    )
+    (entry,) = DiffContextParser(diff).parse()
+    assert "a.py" == entry.result_filename
+    assert [(2, 2)] == [(l.number, l.position) for l in entry.added_lines]
+
+
+def test_clone_repo_fetches_changed_files_and_configs(requester):
+    manager = RemoteTreeManager(
+        requester, executor=mock.Mock(), tools=[SingleFileTool(None)]
+    )
+    repo = manager.clone_repo("a/b", None, "x", commits=["head", "base"], pr_number="3")
+    try:
+        with open(os.path.join(repo.dirname, "pkg/a.py")) as f:
+            assert "import os\nimport sys\n" == f.read()
+        assert os.path.exists(os.path.join(repo.dirname, ".lintrc"))
+        assert not os.path.exists(os.path.join(repo.dirname, "setup.py"))
+        assert not os.path.exists(os.path.join(repo.dirname, "old.py"))
+        assert b"+import sys" in repo.diff_commit("base", compare_point="head")
+        assert manager.should_cleanup
+    finally:
+        shutil.rmtree(repo.dirname)
+
+
+def test_clone_repo_indexes_fetched_files(requester):
+    manager = RemoteTreeManager(
+        requester, executor=mock.Mock(), tools=[SingleFileTool(None)]
+    )
+    repo = manager.clone_repo("a/b", None, "x", commits=["head", "base"], pr_number="3")
+    try:
+        assert os.path.exists(os.path.join(repo.dirname, "pkg/.gitattributes"))
+        file_index = repo.get_file_index()
+        assert {"pkg/a.py", ".lintrc", "pkg/.gitattributes"} == set(
+            file_index.filenames
+        )
+        assert "sha-7" == file_index.blobs[".lintrc"]
+        assert not manager.executor.called
+    finally:
+        shutil.rmtree(repo.dirname)
+
+
+def test_clone_repo_uses_changed_files_from_graphql(requester):
+    requester.responses[(f"{API}/pulls/3", DIFF_MEDIA_TYPE)] = (
+        "diff --git a/pkg/a.py b/pkg/a.py\n"
+        "index 1111111..2222222 100644\n"
+        "--- a/pkg/a.py\n"
+        "+++ b/pkg/a.py\n" + PATCH + "\n"
+    ).encode()
+    manager = RemoteTreeManager(
+        requester, executor=mock.Mock(), tools=[SingleFileTool(None)]
+    )
+    manager.changed_files = [
+        {"path": "pkg/a.py", "changeType": "MODIFIED"},
+        {"path": "old.py", "changeType": "DELETED"},
+    ]
+    repo = manager.clone_repo("a/b", None, "x", commits=["head", "base"], pr_number="3")
+    try:
+        assert not any("/files?" in url for url in requester.urls)
+        assert f"{API}/contents/old.py?ref=head" not in requester.urls
+        assert os.path.exists(os.path.join(repo.dirname, "pkg/a.py"))
+        (entry,) = DiffContextParser(repo.diff_commit("base")).parse()
+        assert "pkg/a.py" == entry.result_filename
+        assert [2] == [line.number for line in entry.added_lines]
+    finally:
+        shutil.rmtree(repo.dirname)
+
+
+def test_clone_repo_needs_pr(requester):
+    manager = RemoteTreeManager(
+        requester, executor=mock.Mock(), tools=[SingleFileTool(None)]
+    )
+    with pytest.raises(RuntimeError):
+        manager.clone_repo("a/b", None, None, commits=["abc"])
+
+
+def test_is_ancestor_asks_github(requester):
+    requester.responses[f"{API}/compare/old...head?per_page=1"] = {"status": "ahead"}
+    requester.responses[f"{API}/compare/gone...head?per_page=1"] = {
+        "status": "diverged"
+    }
+    manager = RemoteTreeManager(
+        requester, executor=mock.Mock(), tools=[SingleFileTool(None)]
+    )
+    repo = manager.clone_repo("a/b", None, "x", commits=["head", "base"], pr_number="3")
+    try:
+        assert repo.is_ancestor("old", "head")
+        assert not repo.is_ancestor("gone", "head")
+        assert not repo.is_ancestor("missing", "head")
+    finally:
+        shutil.rmtree(repo.dirname)
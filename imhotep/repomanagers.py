@@ -1,11 +1,14 @@
 import logging
 import os
 from tempfile import mkdtemp
-from typing import Callable, Dict, List, Optional, Tuple, Type
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Type
 
 from imhotep.repositories import Repository
 from imhotep.tools import Tool
 
+from . import metrics
+from .cache import MIRRORS_DIRNAME, RepoCache, remove_in_background
+from .mirrors import MirrorStore
 from .repositories import AuthenticatedRepository, Repository
 
 log = logging.getLogger(__name__)
@@ -27,6 +30,7 @@ class RepoManager:
         shallow_clone: bool = False,
         domain: Optional[str] = None,
         dir_override: Optional[str] = None,
+        cache_max_size: Optional[int] = None,
     ) -> None:
         self.should_cleanup = cache_directory is None and dir_override is None
         self.authenticated = authenticated
@@ -36,6 +40,14 @@ class RepoManager:
         self.executor = executor
         self.shallow = shallow_clone
         self.domain = domain
+        self.cache: Optional[RepoCache] = None
+        self.mirrors: Optional[MirrorStore] = None
+        if cache_directory and dir_override is None:
+            self.cache = RepoCache(cache_directory, cache_max_size)
+        if cache_directory and dir_override is None and executor is not None:
+            self.mirrors = MirrorStore(
+                os.path.join(cache_directory, MIRRORS_DIRNAME), executor
+            )
 
     def get_repo_class(self) -> Type[Repository]:
         if self.authenticated:
@@ -51,13 +63,34 @@ class RepoManager:
             dirname = os.path.abspath(f"{self.cache_directory}/{dired_repo_name}")
         return dirname
 
-    def fetch(self, dirname, remote_name, ref):
-        log.debug("Fetching %s %s", remote_name, ref)
-        self.executor(f"cd {dirname} && git fetch --depth=1 {remote_name} {ref}")
-
-    def pull(self, dirname):
-        log.debug("Pulling all %s", dirname)
-        self.executor("cd %s && git pull --all" % dirname)
+    def fetch_refs(self, dirname, remote_name, refs, shallow=False):
+        """
+        Fetches just `refs` from `remote_name` in one negotiation, then
+        detaches HEAD at the first of them.
+        """
+        log.debug("Fetching %s %s", remote_name, " ".join(refs))
+        depth = " --depth=1" if shallow else ""
+        with metrics.measure_fetch(self.executor, dirname):
+            self.executor(
+                f"cd {dirname} && git fetch --no-tags{depth} {remote_name} {' '.join(refs)}"
+            )
+        self.executor(f"cd {dirname} && git switch --detach FETCH_HEAD")
+
+    def get_wanted_refs(
+        self, commits: Sequence[str], pr_number: Optional[str]
+    ) -> List[str]:
+        """
+        Returns the refs to fetch from origin for `commits`, which are the
+        commit to check out followed by the one to compare it to.
+        """
+        refs = [c for c in commits if c]
+        if len(refs) < 2:
+            # Nothing to compare against, so diff against the default branch.
+            refs.insert(0, "HEAD")
+        if pr_number is not None:
+            # PR heads from forks are reachable from origin through this.
+            refs.append(f"refs/pull/{pr_number}/head")
+        return refs
 
     def add_remote(self, dirname, name, url):
         log.debug("Adding remote %s url: %s", name, url)
@@ -91,8 +124,13 @@ class RepoManager:
         repo_name: str,
         remote_repo,
         ref: str,
+        commits: Sequence[str] = (),
+        pr_number: Optional[str] = None,
     ) -> Repository:
-        """Clones the given repo and returns the Repository object."""
+        """
+        Clones the given repo, fetches the commits we need and returns the
+        Repository object.
+        """
         self.shallow_clone = False
         dirname, repo = self.set_up_clone(
             repo_name,
@@ -102,38 +140,53 @@ class RepoManager:
         if self.executor is None:
             log.error("Executor does not exist.")
             raise RuntimeError
-        if os.path.isdir("%s/.git" % dirname):
+        if self.cache is not None:
+            # Before anything's written, so other runs don't evict it meanwhile.
+            self.cache.lease(os.path.basename(dirname))
+        mirrors = self.mirrors
+        cached = os.path.isdir("%s/.git" % dirname)
+        if self.cache is not None:
+            metrics.cache_requests.inc(cache="repo", result="hit" if cached else "miss")
+        if cached:
             log.debug("Updating %s to %s", repo.download_location, dirname)
-            self.executor("cd %s && git switch master" % dirname)
-            self.pull(dirname)
+            if mirrors is not None and mirrors.is_borrowed_by(repo_name, dirname):
+                # Its origin is the mirror, so that's what needs fetching.
+                mirrors.update(repo_name, repo.download_location)
+        elif mirrors is not None:
+            mirror = mirrors.update(repo_name, repo.download_location)
+            mirrors.clone(mirror, repo.download_location, dirname)
         else:
             log.debug("Cloning %s to %s", repo.download_location, dirname)
-            self.executor(f"git clone {repo.download_location} {dirname}")
+            with metrics.measure_fetch(self.executor, dirname):
+                self.executor(f"git clone {repo.download_location} {dirname}")
 
-        if remote_repo is not None:
-            log.debug("Pulling remote branch from %s", remote_repo.url)
+        self.fetch_refs(dirname, "origin", self.get_wanted_refs(commits, pr_number))
+        if remote_repo is not None and pr_number is None:
+            log.debug("Fetching remote branch from %s", remote_repo.url)
             self.add_remote(dirname, remote_repo.name, remote_repo.url)
-            self.pull(dirname)
+            if ref:
+                self.fetch_refs(dirname, remote_repo.name, [ref])
+        if self.cache is not None:
+            self.cache.touch(dirname)
         return repo
 
     def cleanup(self) -> None:
         if self.should_cleanup:
             for repo_dir in self.to_cleanup.values():
                 log.debug("Cleaning up %s", repo_dir)
-                if self.executor is None:
-                    log.error("Executor does not exist.")
-                    raise RuntimeError
-                self.executor("rm -rf %s" % repo_dir)
+                remove_in_background(repo_dir)
+        elif self.cache is not None:
+            for repo_dir in self.to_cleanup.values():
+                self.cache.release(repo_dir)
 
 
 class ShallowRepoManager(RepoManager):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def clone_repo(self, repo_name, remote_repo, ref):
+    def clone_repo(self, repo_name, remote_repo, ref, commits=(), pr_number=None):
         self.shallow_clone = True
         dirname, repo = self.set_up_clone(repo_name, remote_repo)
-        remote_name = "origin"
         log.debug("Shallow cloning.")
         download_location = repo.download_location
         log.debug("Creating stub git repo at %s" % (dirname))
@@ -145,9 +198,12 @@ class ShallowRepoManager(RepoManager):
         log.debug("Adding origin repo %s " % (download_location))
         self.add_remote(dirname, "origin", download_location)
 
-        if remote_repo:
+        refs = self.get_wanted_refs(commits, pr_number)
+        self.fetch_refs(dirname, "origin", refs, shallow=True)
+        if remote_repo and pr_number is None:
             self.add_remote(dirname, remote_repo.name, remote_repo.url)
-            remote_name = remote_repo.name
-        self.fetch(dirname, "origin", "HEAD")
-        self.fetch(dirname, remote_name, ref)
+            if ref:
+                self.fetch_refs(dirname, remote_repo.name, [ref], shallow=True)
+        if self.cache is not None:
+            self.cache.touch(dirname)
         return repo
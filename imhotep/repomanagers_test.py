@@ -1,8 +1,10 @@
+import os
 import re
 from unittest import mock
 
 from imhotep.app import find_config
 
+from .cache import RepoCache
 from .repomanagers import RepoManager, ShallowRepoManager
 from .repositories import AuthenticatedRepository, Repository
 from .shas import Remote
@@ -21,13 +23,24 @@ def test_unauthencticated_repo():
     assert Repository == r.get_repo_class()
 
 
-def test_cleanup_calls_rm():
+def test_cleanup_removes_in_background():
     m = mock.Mock()
     r = RepoManager(executor=m, tools=[None])
     r.to_cleanup = {"repo": "/tmp/a_dir"}
+    with mock.patch("imhotep.repomanagers.remove_in_background") as remove:
+        r.cleanup()
+
+    remove.assert_called_with("/tmp/a_dir")
+    assert not m.called
+
+
+def test_cleanup_releases_cached_repos():
+    r = RepoManager(executor=mock.Mock(), tools=[None], cache_directory="/fooz")
+    r.to_cleanup = {"repo": "/fooz/repo"}
+    r.cache = mock.Mock()
     r.cleanup()
 
-    assert m.called_with("rm -rf /tmp/a_dir")
+    r.cache.release.assert_called_with("/fooz/repo")
 
 
 def test_cleanup_doesnt_call_without_clean_files():
@@ -38,11 +51,12 @@ def test_cleanup_doesnt_call_without_clean_files():
     assert not m.called
 
 
-def test_fetch():
-    m = mock.Mock()
+def test_fetch_refs():
+    m = mock.Mock(return_value="")
     r = RepoManager(executor=m, tools=[None])
-    r.fetch("/tmp/a_dir", "foo", "newbranch")
-    assert m.called_with("cd /tmp/a_dir && git fetch --depth=1 foo")
+    r.fetch_refs("/tmp/a_dir", "foo", ["base", "head"], shallow=True)
+    m.assert_any_call("cd /tmp/a_dir && git fetch --no-tags --depth=1 foo base head")
+    m.assert_called_with("cd /tmp/a_dir && git switch --detach FETCH_HEAD")
 
 
 def test_shallow_clone():
@@ -55,13 +69,13 @@ def test_shallow_clone():
     assert m.called_with("cd /tmp/a_dir && git remote add name url")
 
 
-def test_shallow_clone_call():
+def test_shallow_clone_call(tmp_path):
     m = mock.Mock()
     r = RepoManager(
-        cache_directory="/weeble/wobble/", executor=m, tools=[None], shallow_clone=True
+        cache_directory=str(tmp_path), executor=m, tools=[None], shallow_clone=True
     )
     r.clone_repo(repo_name, None, "foo")
-    assert m.called_with("cd /weeble/wobble/justinabrahms__imhotep && git init")
+    assert m.called_with(f"cd {tmp_path}/justinabrahms__imhotep && git init")
 
 
 def test_clone_dir_nocache():
@@ -84,59 +98,157 @@ def test_find_config():
     assert len(find_config(dirname, list())) == 0
 
 
-def test_clone_adds_to_cleanup_dict():
+def test_clone_adds_to_cleanup_dict(tmp_path):
     m = mock.Mock()
-    r = RepoManager(cache_directory="/weeble/wobble/", executor=m, tools=[None])
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
     r.clone_repo(repo_name, None, None)
     directory = r.clone_dir(repo_name)
     assert directory in r.to_cleanup[repo_name]
 
 
-def test_updates_if_existing_repo():
+def test_updates_if_existing_repo(tmp_path):
     finder = re.compile(r"git clone")
     m = mock.Mock()
-    r = RepoManager(cache_directory="/fooz", executor=m, tools=[None])
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
 
     with mock.patch("os.path.isdir") as isdir:
         isdir.return_value = True
         r.clone_repo(repo_name, None, None)
 
     assert len(calls_matching_re(m, finder)) == 0, "Shouldn't git clone"
+    assert not calls_matching_re(m, re.compile("--mirror|--prune")), "Shouldn't mirror"
 
 
-def test_clones_if_no_existing_repo():
-    finder = re.compile(r"git clone")
+def test_updates_mirror_borrowed_by_existing_repo(tmp_path):
+    mirror = tmp_path / "mirrors" / "justinabrahms__imhotep.git"
+    info = tmp_path / "justinabrahms__imhotep" / ".git" / "objects" / "info"
+    info.mkdir(parents=True)
+    (info / "alternates").write_text(f"{mirror}/objects\n")
+    m = mock.Mock()
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
+    r.clone_repo(repo_name, None, None)
+
+    assert calls_matching_re(m, re.compile(r"git clone --mirror")), "Didn't mirror"
+    assert not calls_matching_re(m, re.compile(r"git clone --shared"))
+
+
+def test_no_mirrors_with_dir_override(tmp_path):
+    m = mock.Mock()
+    r = RepoManager(
+        cache_directory=str(tmp_path),
+        dir_override=str(tmp_path / "checkout"),
+        executor=m,
+        tools=[None],
+    )
+    r.clone_repo(repo_name, None, None)
+
+    assert r.mirrors is None
+    assert not calls_matching_re(m, re.compile("--mirror|--shared"))
+
+
+def test_leases_repo_before_cloning(tmp_path):
+    r = RepoManager(cache_directory=str(tmp_path), executor=None, tools=[None])
+    leased = []
+    r.executor = mock.Mock(
+        side_effect=lambda cmd: leased.append(
+            RepoCache(str(tmp_path)).is_leased("justinabrahms__imhotep")
+        )
+    )
+    r.mirrors = None
+    r.clone_repo(repo_name, None, None)
+
+    assert leased and all(leased)
+
+
+def test_clones_if_no_existing_repo(tmp_path):
+    mirror = tmp_path / "mirrors" / "justinabrahms__imhotep.git"
+    finder = re.compile(re.escape(f"git clone --shared {mirror}"))
+    m = mock.Mock()
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
+    r.clone_repo(repo_name, None, None)
+
+    assert len(calls_matching_re(m, finder)) == 1, "Didn't git clone"
+
+
+def test_mirrors_repo_before_cloning(tmp_path):
+    finder = re.compile(r"git clone --mirror https://github.com/justinabrahms/imhotep")
     m = mock.Mock()
-    r = RepoManager(cache_directory="/fooz", executor=m, tools=[None])
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
+    r.clone_repo(repo_name, None, None)
+
+    assert len(calls_matching_re(m, finder)) == 1, "Didn't mirror the repo"
+
+
+def test_clones_directly_without_cache():
+    finder = re.compile(r"git clone https://github.com/justinabrahms/imhotep")
+    m = mock.Mock()
+    r = RepoManager(executor=m, tools=[None])
     r.clone_repo(repo_name, None, None)
 
     assert len(calls_matching_re(m, finder)) == 1, "Didn't git clone"
+    assert r.mirrors is None
+    os.rmdir(r.to_cleanup[repo_name])
 
 
-def test_adds_remote_if_pr_is_remote():
+def test_adds_remote_if_pr_is_remote(tmp_path):
     finder = re.compile(r"git remote add name url")
     m = mock.Mock()
-    r = RepoManager(cache_directory="/fooz", executor=m, tools=[None])
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
     r.clone_repo(repo_name, Remote("name", "url"), None)
 
     assert len(calls_matching_re(m, finder)) == 1, "Remote not added"
 
 
-def test_adds_remote_if_pr_is_remote_and_is_authenticated():
+def test_adds_remote_if_pr_is_remote_and_is_authenticated(tmp_path):
     finder = re.compile(r"git remote add name git@github.com:a/b.git")
     m = mock.Mock()
     r = RepoManager(
-        cache_directory="/fooz", executor=m, tools=[None], authenticated=True
+        cache_directory=str(tmp_path), executor=m, tools=[None], authenticated=True
     )
     r.clone_repo(repo_name, Remote("name", "https://github.com/a/b.git"), None)
 
     assert len(calls_matching_re(m, finder)) == 1, "Remote not added"
 
 
-def test_pulls_remote_changes_if_remote():
-    finder = re.compile(r"git pull --all")
+def test_fetches_remote_branch_if_remote(tmp_path):
+    finder = re.compile(r"git fetch --no-tags name foo")
     m = mock.Mock()
-    r = RepoManager(cache_directory="/fooz", executor=m, tools=[None])
-    r.clone_repo(repo_name, Remote("name", "url"), None)
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
+    r.clone_repo(repo_name, Remote("name", "url"), "foo")
+
+    assert len(calls_matching_re(m, finder)) == 1, "Didn't fetch remote branch"
+
+
+def test_fetches_pr_refs_in_one_fetch(tmp_path):
+    m = mock.Mock()
+    r = RepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
+    with mock.patch("os.path.isdir") as isdir:
+        isdir.return_value = True
+        r.clone_repo(
+            repo_name,
+            Remote("name", "url"),
+            "foo",
+            commits=["head", "base"],
+            pr_number=7,
+        )
+
+    fetches = calls_matching_re(m, re.compile(r"git fetch --no-tags"))
+    assert 1 == len(fetches)
+    assert fetches[0][0][0].endswith("origin head base refs/pull/7/head")
+    assert not calls_matching_re(m, re.compile(r"git (pull|switch master|remote)"))
+
+
+def test_wanted_refs_default_branch_without_compare_point():
+    r = RepoManager(tools=[None])
+    assert ["HEAD", "abc"] == r.get_wanted_refs([None, "abc"], None)
+    assert ["head", "base"] == r.get_wanted_refs(["head", "base"], None)
+
+
+def test_shallow_clone_fetches_once(tmp_path):
+    m = mock.Mock()
+    r = ShallowRepoManager(cache_directory=str(tmp_path), executor=m, tools=[None])
+    r.clone_repo(repo_name, None, "foo", commits=["head", "base"], pr_number=7)
 
-    assert len(calls_matching_re(m, finder)) == 1, "Didn't pull updates"
+    fetches = calls_matching_re(m, re.compile(r"git fetch"))
+    assert 1 == len(fetches)
+    assert "--depth=1 origin head base refs/pull/7/head" in fetches[0][0][0]
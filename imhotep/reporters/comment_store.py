@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+COMMENT_STORE_FILENAME = "imhotep-comments.sqlite3"
+
+# Resync with GitHub at least this often, to notice comments which were
+# edited or deleted there.
+MAX_SYNC_AGE = 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    repo TEXT NOT NULL,
+    pr TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_pr ON fingerprints (repo, pr);
+CREATE TABLE IF NOT EXISTS syncs (
+    repo TEXT NOT NULL,
+    pr TEXT NOT NULL,
+    head TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (repo, pr)
+);
+"""
+
+
+def fingerprint(
+    repo: str, pr: Any, path: str, text: Optional[str], message: str
+) -> str:
+    """
+    Identifies one message posted on a line of a PR reading `text`, or on
+    the whole file if `text` is None. The line's text, unlike its number,
+    stays put when lines are added above it. Linters don't give their rules
+    ids, so the message text stands in for the rule.
+    """
+    message_hash = hashlib.sha1(message.strip().encode("utf-8")).hexdigest()
+    if text is None:
+        anchor = "file"
+    else:
+        anchor = hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+    key = "\0".join([repo, str(pr), path, anchor, message_hash])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def get_anchors(
+    comments: Iterable[Dict[str, Any]], username: Optional[str]
+) -> Iterator[Tuple[str, Optional[str], str]]:
+    """
+    Yields the path, line text and body of each of `comments` which
+    `username` posted. A comment's diff hunk ends with the line it's on.
+    Outdated comments have no line; GitHub hides them, so they're skipped
+    and may be posted again.
+    """
+    for comment in comments:
+        if comment["user"]["login"] != username:
+            continue
+        if comment.get("subject_type") == "file":
+            yield comment["path"], None, comment["body"]
+        elif comment.get("line") is not None and comment.get("diff_hunk"):
+            text = comment["diff_hunk"].splitlines()[-1][1:]
+            yield comment["path"], text, comment["body"]
+
+
+def read_line(filename: str, number: int) -> Optional[str]:
+    """
+    Returns line `number` of `filename`, counting from 1, or None if there's
+    no such line.
+    """
+    try:
+        with open(filename, encoding="utf-8", errors="replace") as f:
+            for i, line in enumerate(f, 1):
+                if i == number:
+                    return line.rstrip("\r\n")
+    except OSError:
+        pass
+    return None
+
+
+def split_body(body: str) -> List[str]:
+    """
+    Returns the messages in a comment body, which imhotep formats as a
+    bulleted list.
+    """
+    messages = [l[2:] for l in body.splitlines() if l.startswith("* ")]
+    return messages or [body]
+
+
+class CommentStore:
+    """
+    Fingerprints of the comments we've posted, in SQLite, so checking for
+    duplicates is an indexed lookup rather than an API call.
+
+    The store is rebuilt from GitHub's comments when it looks stale: the
+    first time it sees a PR, when the PR's head was force-pushed (and GitHub
+    may have outdated our comments), and after `MAX_SYNC_AGE` in case
+    comments were edited. New commits on top of the synced head don't need
+    a resync: we saw everything we posted on them, and fingerprints don't
+    depend on line numbers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        with self.db:
+            self.db.executescript(SCHEMA)
+
+    def is_stale(
+        self,
+        repo: str,
+        pr: Any,
+        head: str,
+        is_ancestor: Optional[Callable[[str, str], bool]] = None,
+    ) -> bool:
+        """
+        Whether to resync before checking `head`. `is_ancestor(old, new)`
+        tells a push from a force-push; without it, any new head is stale.
+        After a push, `head` is recorded so it's only checked once.
+        """
+        row = self.db.execute(
+            "SELECT head, synced_at FROM syncs WHERE repo = ? AND pr = ?",
+            (repo, str(pr)),
+        ).fetchone()
+        if row is None:
+            return True
+        synced_head, synced_at = row
+        if time.time() - synced_at > MAX_SYNC_AGE:
+            return True
+        if synced_head == head:
+            return False
+        if is_ancestor is None or not is_ancestor(synced_head, head):
+            return True
+        with self.db:
+            self.db.execute(
+                "UPDATE syncs SET head = ? WHERE repo = ? AND pr = ?",
+                (head, repo, str(pr)),
+            )
+        return False
+
+    def sync(
+        self,
+        repo: str,
+        pr: Any,
+        head: str,
+        comments: Iterable[Dict[str, Any]],
+        username: Optional[str],
+    ) -> None:
+        """
+        Replaces the fingerprints for a PR with those of `comments` which
+        `username` posted.
+        """
+        rows = [
+            (fingerprint(repo, pr, path, text, m), repo, str(pr))
+            for path, text, body in get_anchors(comments, username)
+            for m in split_body(body)
+        ]
+        with self.db:
+            self.db.execute(
+                "DELETE FROM fingerprints WHERE repo = ? AND pr = ?", (repo, str(pr))
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO fingerprints VALUES (?, ?, ?)", rows
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?)",
+                (repo, str(pr), head, time.time()),
+            )
+        log.debug("Synced %d comment fingerprints for %s#%s", len(rows), repo, pr)
+
+    def contains(self, fingerprint: str) -> bool:
+        row = self.db.execute(
+            "SELECT 1 FROM fingerprints WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        return row is not None
+
+    def add(self, repo: str, pr: Any, fingerprints: Iterable[str]) -> None:
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO fingerprints VALUES (?, ?, ?)",
+                [(f, repo, str(pr)) for f in fingerprints],
+            )
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def open_comment_store(cache_directory: str) -> Optional[CommentStore]:
+    """
+    Opens the comment store in the cache directory. Without one, reporters
+    fall back to checking GitHub's comments, so failing here isn't fatal.
+    """
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        return CommentStore(os.path.join(cache_directory, COMMENT_STORE_FILENAME))
+    except (OSError, sqlite3.Error) as e:
+        log.warning("Could not open the comment store: %s", e)
+        return None
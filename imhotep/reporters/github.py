@@ -1,11 +1,13 @@
 import logging
-from typing import Any, Dict, List, Optional, Union
+import os
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from requests.models import Response
 from six import string_types
 
 from imhotep.http_client import BasicAuthRequester
 
+from .comment_store import CommentStore, fingerprint, read_line
 from .reporter import Reporter
 
 log = logging.getLogger(__name__)
@@ -16,6 +18,7 @@ class GitHubReporter(Reporter):
         self, requester: BasicAuthRequester, domain: str, repo_name: str
     ) -> None:
         self._comments: List[Dict[str, Any]] = []
+        self._comments_loaded = False
         self.domain = domain
         self.repo_name = repo_name
         self.requester = requester
@@ -41,14 +44,30 @@ class GitHubReporter(Reporter):
         return message
 
     def get_comments(self, report_url: str) -> List[Dict[str, Any]]:
-        if not self._comments:
+        self.load_comments(report_url)
+        return self._comments
+
+    def load_comments(self, report_url: str) -> bool:
+        """
+        Fetches the existing comments unless we have them already, returning
+        whether we do.
+        """
+        if not self._comments and not self._comments_loaded:
             log.debug("PR Request: %s", report_url)
             result = self.requester.get(report_url)
             if result.status_code >= 400:
                 log.error("Error requesting comments from github. %s", result.json())
-                return self._comments
-            self._comments = result.json()
-        return self._comments
+                return False
+            self.set_comments(result.json())
+        return True
+
+    def set_comments(self, comments: List[Dict[str, Any]]) -> None:
+        """
+        Sets the existing comments to check new ones against, e.g. when they
+        were fetched along with the PR.
+        """
+        self._comments = comments
+        self._comments_loaded = True
 
     def convert_message_to_string(self, message: List[str]) -> str:
         """Convert message from list to string for GitHub API."""
@@ -81,11 +100,61 @@ class CommitReporter(GitHubReporter):
 
 class PRReporter(GitHubReporter):
     def __init__(
-        self, requester: BasicAuthRequester, domain: str, repo_name: str, pr_number: str
+        self,
+        requester: BasicAuthRequester,
+        domain: str,
+        repo_name: str,
+        pr_number: str,
+        store: Optional[CommentStore] = None,
+        line_comments: bool = False,
+        is_ancestor: Optional[Callable[[str, str], bool]] = None,
+        dirname: Optional[str] = None,
     ) -> None:
         self.pr_number = pr_number
+        self.store = store
+        # Tells the store whether the head was force-pushed since it synced.
+        self.is_ancestor = is_ancestor
+        # A tree at the PR's head, to read the lines we comment on from.
+        self.dirname = dirname
+        # Address comments by file line and side, rather than diff position.
+        self.line_comments = line_comments
         super().__init__(requester, domain, repo_name)
 
+    def remove_stored(
+        self, report_url: str, commit: str, file_name: str, line_number: int, message
+    ) -> List[str]:
+        """
+        Drops the messages the comment store says we've already posted,
+        syncing it from GitHub first if it looks stale.
+        """
+        assert self.store is not None
+        if self.store.is_stale(
+            self.repo_name, self.pr_number, commit, self.is_ancestor
+        ) and self.load_comments(report_url):
+            # If the comments couldn't be listed, what's stored is still our
+            # best guess, and stays stale so the next report tries again.
+            self.store.sync(
+                self.repo_name,
+                self.pr_number,
+                commit,
+                self._comments,
+                self.requester.username,
+            )
+        return [
+            m
+            for m in message
+            if not self.store.contains(self.fingerprint(file_name, line_number, m))
+        ]
+
+    def fingerprint(self, file_name: str, line_number: int, message: str) -> str:
+        text: Optional[str] = None
+        if line_number:
+            text = ""
+            if self.dirname is not None:
+                path = os.path.join(self.dirname, file_name)
+                text = read_line(path, line_number) or ""
+        return fingerprint(self.repo_name, self.pr_number, file_name, text, message)
+
     def report_line(
         self,
         commit: str,
@@ -99,10 +168,17 @@ class PRReporter(GitHubReporter):
             self.repo_name,
             self.pr_number,
         )
-        comments = self.get_comments(report_url)
         if isinstance(message, str):
             message = [message]
-        message = self.clean_already_reported(comments, file_name, position, message)
+        if self.store is not None:
+            message = self.remove_stored(
+                report_url, commit, file_name, line_number, message
+            )
+        else:
+            comments = self.get_comments(report_url)
+            message = self.clean_already_reported(
+                comments, file_name, position, message
+            )
         if not message:
             log.debug("Message already reported")
             return None
@@ -112,13 +188,31 @@ class PRReporter(GitHubReporter):
             "path": file_name,  # relative file path
             "position": position,  # line index into the diff
         }
+        if self.line_comments:
+            del payload["position"]
+            if line_number:
+                payload["line"] = line_number
+                payload["side"] = "RIGHT"  # the line is in the new version
+            else:
+                payload["subject_type"] = "file"
         log.debug("PR Request: %s", report_url)
         log.debug("PR Payload: %s", payload)
         result = self.requester.post(report_url, payload)
         if result.status_code >= 400:
             log.error("Error posting line to github. %s", result.json())
+        elif self.store is not None:
+            self.store.add(
+                self.repo_name,
+                self.pr_number,
+                [self.fingerprint(file_name, line_number, m) for m in message],
+            )
         return result
 
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
     def post_comment(self, message):
         """
         Comments on an issue, not on a particular line.
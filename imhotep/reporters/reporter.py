@@ -13,3 +13,9 @@ class Reporter:
 
     def report_line(self, commit, file_name, line_number, position, message):
         raise NotImplementedError()
+
+    def close(self):
+        """
+        Called once reporting is done, e.g. to flush output.
+        """
+        pass
@@ -1,7 +1,15 @@
+import json
+import sqlite3
+import time
 from unittest import mock
 
+import pytest
+
+from imhotep.graphql import to_rest_comment
+from imhotep.reporters.comment_store import MAX_SYNC_AGE, CommentStore, fingerprint
 from imhotep.reporters.github import CommitReporter, GitHubReporter, PRReporter
 from imhotep.reporters.printing import PrintingReporter
+from imhotep.reporters.streaming import JsonLinesReporter, get_streaming_reporter
 from imhotep.testing_utils import Requester
 
 
@@ -133,3 +141,280 @@ def test_printing_reporter_report_line():
         position=1,
         message="message",
     )
+
+
+def test_set_comments_skips_request():
+    requester = mock.MagicMock()
+    pr = GitHubReporter(requester, "api.github.com", "test-repo")
+    pr.set_comments([])
+    assert [] == pr.get_comments("example.com")
+    assert not requester.get.called
+
+
+FOO = "import os\nimport sys\nimport re\n"
+
+
+def store_reporter(tmpdir, comments=(), is_ancestor=None, source=FOO):
+    tmpdir.join("tree", "foo.py").write(source, ensure=True)
+    requester = mock.MagicMock()
+    requester.username = "me"
+    requester.get.return_value.status_code = 200
+    requester.get.return_value.json.return_value = list(comments)
+    requester.post.return_value.status_code = 201
+    store = CommentStore(str(tmpdir.join("comments.sqlite3")))
+    pr = PRReporter(
+        requester,
+        "github.com",
+        "a/b",
+        10,
+        store=store,
+        is_ancestor=is_ancestor,
+        dirname=str(tmpdir.join("tree")),
+    )
+    return requester, pr
+
+
+def test_store_syncs_once_per_head(tmpdir):
+    existing = {
+        "path": "foo.py",
+        "position": 5,
+        "line": 7,
+        "diff_hunk": "@@ -1,1 +1,2 @@\n import os\n+import sys",
+        "body": "* Get that out\n",
+        "user": {"login": "me"},
+    }
+    requester, pr = store_reporter(tmpdir, [existing])
+
+    # Matched by the line's text, wherever GitHub thinks it is.
+    assert pr.report_line("head", "foo.py", 2, 2, ["Get that out"]) is None
+    pr.report_line("head", "foo.py", 3, 3, ["New"])
+    assert 1 == requester.get.call_count
+    assert 1 == requester.post.call_count
+
+
+def test_store_remembers_posted_comments(tmpdir):
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+
+    # A later run on the same head doesn't need to ask GitHub.
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+    assert not requester.get.called
+    assert not requester.post.called
+
+
+def test_store_resyncs_when_head_moves(tmpdir):
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+
+    # GitHub no longer has the comment, e.g. after a force-push.
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("new-head", "foo.py", 2, 2, ["New"])
+    assert requester.get.called
+    assert requester.post.called
+
+
+def test_store_keeps_comments_after_a_push(tmpdir):
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+
+    # The push adds lines above the one we commented on.
+    is_ancestor = mock.Mock(return_value=True)
+    requester, pr = store_reporter(
+        tmpdir, is_ancestor=is_ancestor, source="import io\nimport json\n" + FOO
+    )
+    pr.report_line("new-head", "foo.py", 4, 6, ["New"])
+    pr.report_line("new-head", "foo.py", 4, 6, ["New"])
+    is_ancestor.assert_called_once_with("head", "new-head")
+    assert not requester.get.called
+    assert not requester.post.called
+
+    # A message on a line that's new to this push is still posted.
+    pr.report_line("new-head", "foo.py", 1, 1, ["New"])
+    assert requester.post.called
+
+
+def test_store_resyncs_after_a_force_push(tmpdir):
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+
+    requester, pr = store_reporter(tmpdir, is_ancestor=lambda old, new: False)
+    pr.report_line("new-head", "foo.py", 2, 2, ["New"])
+    assert requester.get.called
+    assert requester.post.called
+
+
+def test_store_resyncs_when_old(tmpdir):
+    requester, pr = store_reporter(tmpdir, is_ancestor=lambda old, new: True)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+    with mock.patch("time.time", return_value=time.time() + MAX_SYNC_AGE + 1):
+        assert pr.store.is_stale("a/b", 10, "head")
+
+
+def test_store_kept_when_comments_cant_be_listed(tmpdir):
+    requester, pr = store_reporter(tmpdir)
+    pr.report_line("head", "foo.py", 2, 2, ["New"])
+
+    requester, pr = store_reporter(tmpdir)
+    requester.get.return_value.status_code = 502
+    pr.report_line("new-head", "foo.py", 2, 2, ["New"])
+    assert not requester.post.called
+    # Still stale, so the next report tries the listing again.
+    assert pr.store.is_stale("a/b", 10, "new-head")
+
+
+def test_store_skips_outdated_comments(tmpdir):
+    store = CommentStore(str(tmpdir.join("comments.sqlite3")))
+    outdated = {
+        "path": "a.py",
+        "line": None,
+        "diff_hunk": "@@ -1 +1 @@\n+x = 1",
+        "body": "x",
+        "user": {"login": "me"},
+    }
+    whole_file = dict(outdated, subject_type="file", body="y")
+    store.sync("a/b", 1, "head", [outdated, whole_file], "me")
+    assert not store.contains(fingerprint("a/b", 1, "a.py", "x = 1", "x"))
+    assert store.contains(fingerprint("a/b", 1, "a.py", None, "y"))
+
+
+def test_store_syncs_graphql_comments(tmpdir):
+    store = CommentStore(str(tmpdir.join("comments.sqlite3")))
+    comments = [
+        to_rest_comment(
+            {
+                "path": "a.py",
+                "position": 3,
+                "line": 2,
+                "originalLine": 2,
+                "subjectType": "LINE",
+                "diffHunk": "@@ -1,1 +1,2 @@\n x = 1\n+y = 2",
+                "body": "* Bad\n",
+                "author": {"login": "me"},
+            }
+        ),
+        to_rest_comment(
+            {
+                "path": "b.py",
+                "position": None,
+                "line": None,
+                "originalLine": None,
+                "subjectType": "FILE",
+                "diffHunk": "",
+                "body": "* Whole\n",
+                "author": {"login": "me"},
+            }
+        ),
+    ]
+    store.sync("a/b", 1, "head", comments, "me")
+    assert store.contains(fingerprint("a/b", 1, "a.py", "y = 2", "Bad"))
+    assert store.contains(fingerprint("a/b", 1, "b.py", None, "Whole"))
+
+
+def test_close_closes_store(tmpdir):
+    requester, pr = store_reporter(tmpdir)
+    store = pr.store
+    pr.close()
+    assert pr.store is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        store.contains("x")
+
+
+def test_store_ignores_other_users(tmpdir):
+    store = CommentStore(str(tmpdir.join("comments.sqlite3")))
+    comment = {
+        "path": "a.py",
+        "line": 1,
+        "diff_hunk": "@@ -0,0 +1 @@\n+x",
+        "body": "x",
+        "user": {"login": "you"},
+    }
+    store.sync("a/b", 1, "head", [comment], "me")
+    assert not store.contains(fingerprint("a/b", 1, "a.py", "x", "x"))
+    assert not store.is_stale("a/b", 1, "head")
+
+
+def test_pr_line_comments():
+    requester = mock.MagicMock()
+    requester.username = "me"
+    requester.post.return_value.status_code = 201
+    pr = PRReporter(requester, "github.com", "a/b", 10, line_comments=True)
+    pr._comments = [{"path": "x", "position": 1, "body": "", "user": {"login": "me"}}]
+    pr.report_line("sha", "foo.py", 12, 5, ["Bad"])
+    pr.report_line("sha", "foo.py", 0, 1, ["Bad file"])
+
+    line, file_level = [c[0][1] for c in requester.post.call_args_list]
+    assert (12, "RIGHT") == (line["line"], line["side"])
+    assert "position" not in line
+    assert "file" == file_level["subject_type"]
+
+
+def test_jsonl_reporter(tmpdir):
+    path = str(tmpdir.join("report.jsonl"))
+    reporter = get_streaming_reporter("jsonl", path)
+    reporter.report_line("sha", "a.py", 3, 7, "E501 line too long")
+    reporter.report_line("sha", "b.py", 1, 2, ["bad", "worse"])
+    reporter.close()
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert ["a.py", "b.py"] == [r["path"] for r in records]
+    assert ["E501 line too long"] == records[0]["messages"]
+
+
+def test_sarif_reporter(tmpdir):
+    path = str(tmpdir.join("report.sarif"))
+    reporter = get_streaming_reporter("sarif", path)
+    reporter.report_line("sha", "a.py", 3, 7, ["E501 line too long"])
+    reporter.report_line("sha", "a.py", 0, 1, ["file-level note"])
+    reporter.close()
+
+    with open(path) as f:
+        log = json.loads(f.read())
+    results = log["runs"][0]["results"]
+    assert ["error", "note"] == [r["level"] for r in results]
+    assert 3 == results[0]["locations"][0]["physicalLocation"]["region"]["startLine"]
+    assert "region" not in results[1]["locations"][0]["physicalLocation"]
+
+
+def sarif_fingerprints(tmpdir, source, line):
+    tmpdir.join("tree", "a.py").write(source, ensure=True)
+    path = str(tmpdir.join("report.sarif"))
+    reporter = get_streaming_reporter("sarif", path)
+    reporter.dirname = str(tmpdir.join("tree"))
+    reporter.repository_uri = "https://github.com/a/b"
+    reporter.report_line("sha", "a.py", line, line, ["E501 line too long"])
+    reporter.close()
+    with open(path) as f:
+        (run,) = json.loads(f.read())["runs"]
+    assert [{"repositoryUri": "https://github.com/a/b", "revisionId": "sha"}] == run[
+        "versionControlProvenance"
+    ]
+    return run["results"][0]["partialFingerprints"]
+
+
+def test_sarif_fingerprints_survive_moved_lines(tmpdir):
+    before = sarif_fingerprints(tmpdir, "x = 1\ny = 2\n", 2)
+    after = sarif_fingerprints(tmpdir, "import os\n\nx = 1\ny = 2\n", 4)
+    changed = sarif_fingerprints(tmpdir, "x = 1\ny = 3\n", 2)
+
+    assert before == after
+    assert before != changed
+    assert "sha" not in json.dumps(before)
+
+
+def test_empty_sarif_is_valid(tmpdir):
+    path = str(tmpdir.join("report.sarif"))
+    get_streaming_reporter("sarif", path).close()
+
+    with open(path) as f:
+        assert [] == json.loads(f.read())["runs"][0]["results"]
+
+
+def test_streaming_reporter_flushes_periodically():
+    stream = mock.Mock()
+    reporter = JsonLinesReporter(stream, flush_every=2)
+    for line in range(5):
+        reporter.report_line("sha", "a.py", line, line, ["x"])
+
+    assert 2 == stream.flush.call_count
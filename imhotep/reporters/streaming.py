@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import IO, List, Optional, Union
+
+from imhotep.budget import get_severity
+
+from .comment_store import read_line
+from .reporter import Reporter
+
+log = logging.getLogger(__name__)
+
+REPORT_FORMATS = ("text", "jsonl", "sarif")
+
+# Records written between flushes, so a reader following the output sees
+# progress without every record costing a write.
+FLUSH_EVERY = 100
+
+# Size of the write buffer for report files.
+BUFFER_SIZE = 1 << 16
+
+SARIF_LEVELS = {2: "error", 1: "warning", 0: "note"}
+
+
+def open_report(path: Optional[str]) -> IO[str]:
+    if path is None or path == "-":
+        return sys.stdout
+    return open(path, "w", buffering=BUFFER_SIZE)
+
+
+class StreamingReporter(Reporter):
+    """
+    Writes one record per violation as it's reported, keeping nothing in
+    memory, so output size doesn't depend on how many violations there are.
+    """
+
+    def __init__(self, stream: IO[str], flush_every: int = FLUSH_EVERY) -> None:
+        self.stream = stream
+        self.flush_every = flush_every
+        self.written = 0
+
+    def report_line(self, commit, file_name, line_number, position, message):
+        if isinstance(message, str):
+            message = [message]
+        self.write_record(commit, file_name, line_number, position, message)
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self.stream.flush()
+
+    def write_record(
+        self,
+        commit: str,
+        file_name: str,
+        line_number: int,
+        position: int,
+        message: List[str],
+    ) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        self.stream.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class JsonLinesReporter(StreamingReporter):
+    def write_record(self, commit, file_name, line_number, position, message):
+        record = {
+            "commit": commit,
+            "path": file_name,
+            "line": line_number,
+            "position": position,
+            "messages": message,
+        }
+        self.stream.write(json.dumps(record) + "\n")
+
+
+class SarifReporter(StreamingReporter):
+    """
+    Writes a SARIF 2.1.0 log, one result at a time. The log is only valid
+    JSON once `close` has written its end.
+
+    Results are fingerprinted by their message, path and the text of their
+    line, read from `dirname`, so a result keeps its identity across pushes
+    which move it. The commit goes in the run's version control provenance.
+    """
+
+    def __init__(self, stream: IO[str], flush_every: int = FLUSH_EVERY) -> None:
+        super().__init__(stream, flush_every)
+        # The checkout being reported on, and where it came from.
+        self.dirname: Optional[str] = None
+        self.repository_uri: Optional[str] = None
+        self.revision: Optional[str] = None
+        self.stream.write(
+            '{"version": "2.1.0", '
+            '"$schema": "https://json.schemastore.org/sarif-2.1.0.json", '
+            '"runs": [{"tool": {"driver": {"name": "imhotep"}}, "results": [\n'
+        )
+
+    def write_record(self, commit, file_name, line_number, position, message):
+        location = {"artifactLocation": {"uri": file_name}}
+        if line_number:
+            location["region"] = {"startLine": int(line_number)}
+        result = {
+            "level": SARIF_LEVELS[get_severity(message)],
+            "message": {"text": "\n".join(message)},
+            "locations": [{"physicalLocation": location}],
+            "partialFingerprints": {
+                "imhotepLineHash/v1": self.fingerprint(file_name, line_number, message)
+            },
+        }
+        self.revision = self.revision or commit
+        separator = ",\n" if self.written else ""
+        self.stream.write(separator + json.dumps(result))
+
+    def fingerprint(self, file_name: str, line_number: int, message: List[str]) -> str:
+        text = ""
+        if line_number and self.dirname is not None:
+            path = os.path.join(self.dirname, file_name)
+            text = (read_line(path, int(line_number)) or "").strip()
+        key = "\0".join([file_name, text] + [m.strip() for m in message])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def close(self) -> None:
+        self.stream.write("\n]")
+        if self.repository_uri and self.revision:
+            provenance = [
+                {"repositoryUri": self.repository_uri, "revisionId": self.revision}
+            ]
+            self.stream.write(', "versionControlProvenance": ' + json.dumps(provenance))
+        self.stream.write("}]}\n")
+        super().close()
+
+
+def get_streaming_reporter(
+    report_format: str, path: Optional[str]
+) -> Union[JsonLinesReporter, SarifReporter]:
+    stream = open_report(path)
+    if report_format == "sarif":
+        return SarifReporter(stream)
+    return JsonLinesReporter(stream)
@@ -3,6 +3,8 @@ from typing import Callable, List, Optional
 
 from imhotep.tools import Tool
 
+from .files import FileIndex
+
 log = logging.getLogger(__name__)
 
 
@@ -63,6 +65,28 @@ class Repository:
             raise RuntimeError
         return self.executor(f"cd {self.dirname} && git diff {commit}")
 
+    def is_ancestor(self, ancestor: str, commit: str) -> bool:
+        """
+        Whether `commit` descends from `ancestor`, i.e. it wasn't reached by
+        rewriting history. False if we can't tell, e.g. when `ancestor` was
+        never fetched.
+        """
+        if self.executor is None:
+            return False
+        output = self.executor(
+            f"cd {self.dirname} && git merge-base --is-ancestor {ancestor} {commit}"
+            " && echo yes"
+        )
+        return output.strip() == b"yes"
+
+    def get_file_index(self) -> Optional[FileIndex]:
+        """
+        Lists the files in the checkout, or returns None if we can't.
+        """
+        if self.executor is None:
+            return None
+        return FileIndex.from_git(self.dirname, self.executor)
+
     def __unicode__(self):
         return self.name
 
@@ -40,3 +40,18 @@ def test_apply_commit():
     uar = Repository(repo_name, "/loc/", [None], executor)
     uar.apply_commit("base")
     executor.assert_called_with("cd /loc/ && git switch --detach base")
+
+
+def test_is_ancestor():
+    executor = mock.Mock(return_value=b"yes\n")
+    uar = Repository(repo_name, "/loc/", [None], executor)
+    assert uar.is_ancestor("old", "new")
+    executor.assert_called_with(
+        "cd /loc/ && git merge-base --is-ancestor old new && echo yes"
+    )
+
+
+def test_is_ancestor__rewritten():
+    executor = mock.Mock(return_value=b"")
+    uar = Repository(repo_name, "/loc/", [None], executor)
+    assert not uar.is_ancestor("old", "new")
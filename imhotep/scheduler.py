@@ -0,0 +1,187 @@
+"""
+Admission control for linter invocations, so that running many of them at
+once doesn't exhaust the machine's CPUs or memory.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from .tools import ToolCost
+
+log = logging.getLogger(__name__)
+
+# Limits for the invocation running on the current thread, read by `run`.
+local = threading.local()
+
+SIZE_SUFFIXES = {"k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses sizes like "512M" or "8G" into bytes.
+    """
+    size = size.strip().lower().rstrip("b")
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def available_memory() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_tool_key(tool) -> str:
+    return f"{tool.__class__.__module__}:{tool.__class__.__name__}"
+
+
+def current_limits() -> Optional[ToolCost]:
+    return getattr(local, "cost", None)
+
+
+class ResourceScheduler:
+    """
+    Admits linter invocations only while their declared (or learned) CPU
+    and memory costs fit in the budget, making the rest wait. An invocation
+    bigger than the whole budget is still run, but only on its own.
+
+    Memory use is learned from the peak RSS of the subprocesses each tool
+    runs, and the larger of that and the tool's declared cost is used. The
+    peaks seen in earlier runs, kept in `RuntimeHistory`, are the starting
+    estimates.
+    """
+
+    def __init__(
+        self, cpus: Optional[int] = None, memory: Optional[int] = None
+    ) -> None:
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory = memory or available_memory()
+        self.cpus_used = 0
+        self.memory_used = 0
+        self.running = 0
+        # Memory estimates per tool key, and the peaks seen in this run.
+        self.learned: Dict[str, int] = {}
+        self.observed: Dict[str, int] = {}
+        self.condition = threading.Condition()
+
+    def expect(self, peaks: Dict[str, int]) -> None:
+        """
+        Starts from the peak memory tools used in earlier runs.
+        """
+        with self.condition:
+            for key, peak in peaks.items():
+                self.learned[key] = max(self.learned.get(key, 0), peak)
+
+    def get_cost(self, tool) -> ToolCost:
+        cost = None
+        try:
+            cost = tool.get_cost()
+        except AttributeError:
+            pass
+        if not isinstance(cost, ToolCost):
+            cost = ToolCost()
+        learned = self.learned.get(get_tool_key(tool), 0)
+        if learned > cost.memory:
+            cost = cost._replace(memory=learned)
+        return cost
+
+    def fits(self, cpus: int, memory: int) -> bool:
+        if self.running == 0:
+            return True
+        if self.cpus_used + cpus > self.cpus:
+            return False
+        if self.memory is not None and self.memory_used + memory > self.memory:
+            return False
+        return True
+
+    @contextmanager
+    def admit(self, tool) -> Iterator[ToolCost]:
+        """
+        Blocks until `tool` can run within the budget, then applies its
+        limits to any `run` calls made on this thread until exit.
+        """
+        cost = self.get_cost(tool)
+        with self.condition:
+            if not self.fits(cost.cpus, cost.memory):
+                log.debug("Waiting for resources to run %s", get_tool_key(tool))
+            self.condition.wait_for(lambda: self.fits(cost.cpus, cost.memory))
+            self.cpus_used += cost.cpus
+            self.memory_used += cost.memory
+            self.running += 1
+        local.cost = cost
+        local.peak_memory = 0
+        try:
+            yield cost
+        finally:
+            peak = local.peak_memory
+            local.cost = None
+            with self.condition:
+                self.cpus_used -= cost.cpus
+                self.memory_used -= cost.memory
+                self.running -= 1
+                key = get_tool_key(tool)
+                if peak > self.observed.get(key, 0):
+                    self.observed[key] = peak
+                if peak > self.learned.get(key, 0):
+                    self.learned[key] = peak
+                self.condition.notify_all()
+
+
+def kill_group(process: subprocess.Popen) -> None:
+    log.warning("Killing %s after it timed out", process.args)
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def run_limited(cmd: str, cwd: str, cost: ToolCost) -> bytes:
+    """
+    Runs `cmd` in its own process group under the cost's memory limit,
+    killing the group if it outlives the timeout. Whatever it printed before
+    then is returned.
+    """
+    if cost.memory_limit:
+        # Set by the shell rather than a preexec_fn, which isn't safe to use
+        # from the threads jobs run on.
+        cmd = f"ulimit -v {max(1, cost.memory_limit // 1024)}; {cmd}"
+    process = subprocess.Popen(
+        [cmd],
+        stdout=subprocess.PIPE,
+        shell=True,
+        cwd=cwd,
+        start_new_session=True,
+    )
+    timer = None
+    if cost.timeout:
+        timer = threading.Timer(cost.timeout, kill_group, [process])
+        timer.start()
+    try:
+        assert process.stdout is not None
+        output = process.stdout.read()
+        process.stdout.close()
+        # wait4 rather than wait, to find out how much memory it used.
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    # ru_maxrss is in bytes on macOS but kilobytes elsewhere.
+    peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    local.peak_memory = max(getattr(local, "peak_memory", 0), peak)
+    return output
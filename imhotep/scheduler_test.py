@@ -0,0 +1,108 @@
+import threading
+import time
+from unittest import mock
+
+from .scheduler import (
+    ResourceScheduler,
+    current_limits,
+    get_tool_key,
+    parse_size,
+    run_limited,
+)
+from .tools import Tool, ToolCost
+
+
+class HungryTool(Tool):
+    def get_cost(self):
+        return ToolCost(cpus=1, memory=parse_size("6G"))
+
+
+def test_parse_size():
+    assert parse_size("100") == 100
+    assert parse_size("2k") == 2048
+    assert parse_size("1.5G") == int(1.5 * 1024**3)
+    assert parse_size("512MB") == 512 * 1024**2
+
+
+def test_default_cost():
+    scheduler = ResourceScheduler(cpus=4, memory=1024)
+    assert scheduler.get_cost(Tool(None)) == ToolCost(1, 0, None, None)
+    assert scheduler.get_cost(mock.Mock()) == ToolCost()
+
+
+def test_admit_sets_thread_limits():
+    scheduler = ResourceScheduler(cpus=4, memory=parse_size("8G"))
+    tool = HungryTool(None)
+    assert current_limits() is None
+    with scheduler.admit(tool) as cost:
+        assert current_limits() == cost
+        assert scheduler.memory_used == parse_size("6G")
+    assert current_limits() is None
+    assert scheduler.memory_used == 0
+
+
+def test_admit_waits_for_memory():
+    scheduler = ResourceScheduler(cpus=4, memory=parse_size("8G"))
+    running = []
+    overlap = []
+
+    def work():
+        with scheduler.admit(HungryTool(None)):
+            overlap.append(len(running))
+            running.append(1)
+            time.sleep(0.05)
+            running.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert overlap == [0, 0, 0]
+
+
+def test_oversized_job_still_runs_alone():
+    scheduler = ResourceScheduler(cpus=1, memory=1024)
+    with scheduler.admit(HungryTool(None)):
+        assert scheduler.running == 1
+
+
+def test_learns_peak_memory():
+    scheduler = ResourceScheduler(cpus=4, memory=parse_size("8G"))
+    tool = Tool(None)
+    with scheduler.admit(tool) as cost:
+        run_limited("python3 -c 'x = bytearray(50 * 1024 * 1024)'", ".", cost)
+    learned = scheduler.learned[get_tool_key(tool)]
+    assert learned > 50 * 1024 * 1024
+    assert scheduler.get_cost(tool).memory == learned
+
+
+def test_starts_from_expected_memory():
+    scheduler = ResourceScheduler(cpus=4, memory=parse_size("8G"))
+    tool = Tool(None)
+    scheduler.expect({get_tool_key(tool): parse_size("1G")})
+    assert scheduler.get_cost(tool).memory == parse_size("1G")
+    with scheduler.admit(tool) as cost:
+        run_limited("true", ".", cost)
+    assert scheduler.learned[get_tool_key(tool)] == parse_size("1G")
+    assert scheduler.observed[get_tool_key(tool)] < parse_size("1G")
+
+
+def test_run_limited_output():
+    assert run_limited("echo hi", ".", ToolCost()) == b"hi\n"
+
+
+def test_run_limited_timeout():
+    start = time.time()
+    output = run_limited("echo early; sleep 10; echo late", ".", ToolCost(timeout=0.2))
+    assert output == b"early\n"
+    assert time.time() - start < 5
+
+
+def test_run_limited_memory_limit():
+    cost = ToolCost(memory_limit=parse_size("200M"))
+    output = run_limited(
+        "python3 -c 'x = bytearray(500 * 1024 * 1024)' || echo failed", ".", cost
+    )
+    assert output == b"failed\n"
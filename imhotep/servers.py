@@ -0,0 +1,326 @@
+"""
+Support for linters which run as long-lived servers.
+
+Servers speak newline-delimited JSON-RPC 2.0 over stdin/stdout. imhotep sends
+requests like:
+
+  {"jsonrpc": "2.0", "id": 1, "method": "lint",
+   "params": {"root": "/path/to/repo", "files": ["a.py"], "configs": []}}
+
+and expects a response of:
+
+  {"jsonrpc": "2.0", "id": 1, "result": {"diagnostics": [
+    {"filename": "a.py", "line": 3, "message": "line too long"}]}}
+
+A diagnostic spanning several lines may also give an "end_line". An empty
+file list means "lint everything under root". Servers must also
+answer `ping` (with any result) and should exit when sent a `shutdown`
+notification.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import subprocess
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .tools import Tool
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait on a server before treating it as unhealthy.
+DEFAULT_TIMEOUT = 300
+PING_TIMEOUT = 10
+
+# Times a crashed or wedged server is restarted before giving up on it.
+MAX_RESTARTS = 3
+
+
+class ServerError(Exception):
+    pass
+
+
+class ServerProtocolError(ServerError):
+    """
+    The server answered with something other than the protocol allows.
+    """
+
+
+class ServerUnavailable(ServerError):
+    """
+    The server died, hung or couldn't be reached, as opposed to answering a
+    request with an error.
+    """
+
+
+class ServerProcess:
+    """
+    A single running linter server.
+    """
+
+    def __init__(self, command: List[str], cwd: Optional[str] = None) -> None:
+        self.command = command
+        log.debug("Starting server: %s", command)
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=cwd,
+            text=True,
+            bufsize=1,
+        )
+        self.responses: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.closed = False
+        reader = threading.Thread(target=self.read_responses, daemon=True)
+        reader.start()
+
+    def read_responses(self) -> None:
+        assert self.process.stdout is not None
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                self.responses.put(json.loads(line))
+            except ValueError:
+                log.warning("Ignoring non-JSON server output: %s", line)
+        # EOF; wake up anyone waiting on a response.
+        self.closed = True
+        self.responses.put(None)
+
+    def is_alive(self) -> bool:
+        return not self.closed and self.process.poll() is None
+
+    def send(self, message: Dict[str, Any]) -> None:
+        assert self.process.stdin is not None
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def request(
+        self,
+        method: str,
+        params: Optional[Dict] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> Any:
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            try:
+                self.send(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "method": method,
+                        "params": params or {},
+                    }
+                )
+            except (BrokenPipeError, ValueError) as e:
+                raise ServerUnavailable(f"Couldn't send {method} to server: {e}")
+            while True:
+                try:
+                    response = self.responses.get(timeout=timeout)
+                except queue.Empty:
+                    raise ServerUnavailable(f"Timed out waiting on {method}")
+                if response is None:
+                    # Leave the marker for whoever asks next.
+                    self.responses.put(None)
+                    raise ServerUnavailable(f"Server exited during {method}")
+                # Skip responses to requests we've already given up on.
+                if response.get("id") == request_id:
+                    break
+            if "error" in response:
+                raise ServerError(response["error"])
+            return response.get("result")
+
+    def ping(self) -> bool:
+        if not self.is_alive():
+            return False
+        try:
+            self.request("ping", timeout=PING_TIMEOUT)
+        except ServerError:
+            return False
+        return True
+
+    def stop(self) -> None:
+        if self.is_alive():
+            try:
+                self.send({"jsonrpc": "2.0", "method": "shutdown"})
+                self.process.wait(timeout=PING_TIMEOUT)
+            except (BrokenPipeError, ValueError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            if stream is not None:
+                stream.close()
+
+
+class ServerManager:
+    """
+    Starts servers on first use, checks they are healthy before handing them
+    out, and restarts them when they die or stop answering.
+
+    Servers live either for one run (see `shutdown`) or for the life of the
+    process, as chosen by each tool's `server_lifetime`.
+    """
+
+    def __init__(self) -> None:
+        self.servers: Dict[Tuple, ServerProcess] = {}
+        self.lifetimes: Dict[Tuple, str] = {}
+        self.restarts: Dict[Tuple, int] = defaultdict(int)
+        # Guards the dicts above. Anything slow, like pinging, starting or
+        # stopping a server, holds just that server's lock instead, so one
+        # slow server doesn't hold up the others.
+        self.lock = threading.Lock()
+        self.server_locks: Dict[Tuple, threading.Lock] = {}
+
+    def server_lock(self, key: Tuple) -> threading.Lock:
+        with self.lock:
+            return self.server_locks.setdefault(key, threading.Lock())
+
+    def get(self, tool: "ServerTool", dirname: str) -> ServerProcess:
+        key = tool.get_server_key(dirname)
+        with self.server_lock(key):
+            with self.lock:
+                server = self.servers.get(key)
+            if server is not None and server.ping():
+                with self.lock:
+                    self.restarts.pop(key, None)
+                return server
+            if server is not None:
+                log.warning("Restarting unhealthy server %s", server.command)
+                with self.lock:
+                    self.servers.pop(key, None)
+                server.stop()
+                with self.lock:
+                    self.restart_count(key)
+            server = ServerProcess(tool.get_server_command(dirname), cwd=dirname)
+            with self.lock:
+                self.servers[key] = server
+                self.lifetimes[key] = tool.server_lifetime
+            return server
+
+    def restart_count(self, key: Tuple) -> None:
+        """
+        Counts a restart of the server for `key`, giving up after too many
+        in a row without it answering a request.
+        """
+        self.restarts[key] += 1
+        if self.restarts[key] > MAX_RESTARTS:
+            raise ServerError(f"Server {key} keeps failing; giving up")
+
+    def succeeded(self, tool: "ServerTool", dirname: str) -> None:
+        """
+        Records that a server answered a request, so earlier restarts don't
+        count against it.
+        """
+        key = tool.get_server_key(dirname)
+        with self.lock:
+            self.restarts.pop(key, None)
+
+    def discard(self, tool: "ServerTool", dirname: str) -> None:
+        key = tool.get_server_key(dirname)
+        with self.server_lock(key):
+            with self.lock:
+                server = self.servers.pop(key, None)
+            if server is not None:
+                server.stop()
+                with self.lock:
+                    self.restart_count(key)
+
+    def shutdown(self, lifetime: Optional[str] = "run") -> None:
+        """
+        Stops servers with the given lifetime, or all of them if None.
+        """
+        with self.lock:
+            for key in list(self.servers):
+                if lifetime is None or self.lifetimes[key] == lifetime:
+                    self.servers.pop(key).stop()
+                    self.restarts.pop(key, None)
+
+
+servers = ServerManager()
+atexit.register(servers.shutdown, None)
+
+
+class ServerTool(Tool):
+    """
+    A tool which runs as a long-lived server, so it only pays its start-up
+    cost once. Override `get_server_command` rather than `get_command`.
+
+    `server_lifetime` is "run" to stop the server once a run finishes, or
+    "daemon" to keep it for as long as the imhotep process lives.
+    """
+
+    server_lifetime = "run"
+    batch_size = 500
+
+    def __init__(self, command_executor, filenames=set(), manager=None):
+        super().__init__(command_executor, filenames)
+        self.manager = manager or servers
+
+    def get_server_command(self, dirname):
+        """
+        Returns the argv list which starts the server.
+        """
+        raise NotImplementedError()
+
+    def get_server_key(self, dirname):
+        """
+        Returns what identifies a server which can be shared. By default,
+        one server per tool and directory.
+        """
+        return (self.__class__.__module__, self.__class__.__name__, dirname)
+
+    def invoke(self, dirname, filenames=set(), linter_configs=set()):
+        retval = defaultdict(lambda: defaultdict(list))
+        if len(filenames):
+            extensions = [e.lstrip(".") for e in self.get_file_extensions()]
+            filenames = [f for f in filenames if f.split(".")[-1] in extensions]
+            if not filenames:
+                return {}
+            batches = [
+                filenames[i : i + self.batch_size]
+                for i in range(0, len(filenames), self.batch_size)
+            ]
+        else:
+            batches = [[]]
+
+        for batch in batches:
+            params = {
+                "root": dirname,
+                "files": list(batch),
+                "configs": sorted(linter_configs),
+            }
+            for diagnostic in self.lint(dirname, params):
+                filename = diagnostic["filename"]
+                if filename.startswith(dirname):
+                    filename = filename[len(dirname) + 1 :]
+                lineno = str(diagnostic.get("line", 0))
+                end_line = diagnostic.get("end_line")
+                if end_line is not None and end_line > int(lineno):
+                    lineno = f"{lineno}-{end_line}"
+                retval[filename][lineno].append(diagnostic["message"])
+        return retval
+
+    def lint(self, dirname, params):
+        """
+        Sends one batch to the server, retrying on a fresh server if the
+        current one falls over mid-request.
+        """
+        while True:
+            server = self.manager.get(self, dirname)
+            try:
+                result = server.request("lint", params)
+            except ServerUnavailable as e:
+                log.warning("Server failed during lint: %s", e)
+                self.manager.discard(self, dirname)
+                continue
+            self.manager.succeeded(self, dirname)
+            if not isinstance(result, dict):
+                raise ServerProtocolError(f"Expected a lint result, got {result!r}")
+            return result.get("diagnostics", [])
@@ -0,0 +1,187 @@
+import sys
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from .servers import (
+    MAX_RESTARTS,
+    ServerError,
+    ServerManager,
+    ServerProcess,
+    ServerProtocolError,
+    ServerTool,
+)
+
+# Answers lint requests with one violation on line 1 of each file.
+ECHO_SERVER = """
+import json, sys
+for line in sys.stdin:
+    msg = json.loads(line)
+    if msg["method"] == "shutdown":
+        break
+    if msg["method"] == "crash":
+        sys.exit(1)
+    if msg["method"] == "lint":
+        files = msg["params"]["files"]
+        result = {"diagnostics": [
+            {"filename": msg["params"]["root"] + "/" + f, "line": 1,
+             "message": "bad " + f}
+            for f in files
+        ]}
+    elif msg["method"] == "fail":
+        print(json.dumps({"id": msg["id"], "error": "nope"}), flush=True)
+        continue
+    else:
+        result = {}
+    print(json.dumps({"id": msg["id"], "result": result}), flush=True)
+"""
+
+
+class EchoTool(ServerTool):
+    file_extensions = [".py"]
+
+    def get_server_command(self, dirname):
+        return [sys.executable, "-c", ECHO_SERVER]
+
+
+def test_server_process_request():
+    server = ServerProcess([sys.executable, "-c", ECHO_SERVER])
+    try:
+        assert server.ping()
+        result = server.request("lint", {"root": "/r", "files": ["a.py"]})
+        assert result["diagnostics"][0]["message"] == "bad a.py"
+    finally:
+        server.stop()
+    assert not server.is_alive()
+
+
+def test_server_process_error_response():
+    server = ServerProcess([sys.executable, "-c", ECHO_SERVER])
+    try:
+        with pytest.raises(ServerError):
+            server.request("fail")
+    finally:
+        server.stop()
+
+
+def test_server_tool_invoke(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    try:
+        retval = tool.invoke(str(tmpdir), filenames=["a.py", "b.js", "c/d.py"])
+    finally:
+        manager.shutdown()
+    assert retval["a.py"]["1"] == ["bad a.py"]
+    assert retval["c/d.py"]["1"] == ["bad c/d.py"]
+    assert "b.js" not in retval
+
+
+def test_server_is_reused(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    try:
+        first = manager.get(tool, str(tmpdir))
+        assert manager.get(tool, str(tmpdir)) is first
+    finally:
+        manager.shutdown()
+
+
+def test_server_restarted_after_crash(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    try:
+        first = manager.get(tool, str(tmpdir))
+        with pytest.raises(ServerError):
+            first.request("crash")
+        retval = tool.invoke(str(tmpdir), filenames=["a.py"])
+        assert manager.get(tool, str(tmpdir)) is not first
+        assert retval["a.py"]["1"] == ["bad a.py"]
+    finally:
+        manager.shutdown()
+
+
+def test_restarts_forgotten_after_success(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    key = tool.get_server_key(str(tmpdir))
+    try:
+        # More crashes than MAX_RESTARTS, but each followed by a good run.
+        for _ in range(MAX_RESTARTS + 2):
+            manager.get(tool, str(tmpdir)).stop()
+            retval = tool.invoke(str(tmpdir), filenames=["a.py"])
+            assert retval["a.py"]["1"] == ["bad a.py"]
+            assert key not in manager.restarts
+    finally:
+        manager.shutdown()
+
+
+def test_shutdown_keeps_daemon_servers(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    tool.server_lifetime = "daemon"
+    try:
+        server = manager.get(tool, str(tmpdir))
+        manager.shutdown()
+        assert server.is_alive()
+    finally:
+        manager.shutdown(None)
+    assert not server.is_alive()
+
+
+def test_server_tool_reads_end_lines(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    server = manager.get(tool, str(tmpdir))
+    diagnostics = [
+        {"filename": "a.py", "line": 2, "end_line": 4, "message": "long"},
+        {"filename": "a.py", "line": 5, "end_line": 5, "message": "short"},
+    ]
+    try:
+        with mock.patch.object(
+            server, "request", return_value={"diagnostics": diagnostics}
+        ):
+            retval = tool.invoke(str(tmpdir), filenames=["a.py"])
+    finally:
+        manager.shutdown()
+    assert retval["a.py"]["2-4"] == ["long"]
+    assert retval["a.py"]["5"] == ["short"]
+
+
+def test_server_tool_rejects_null_result(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    server = manager.get(tool, str(tmpdir))
+    try:
+        with mock.patch.object(server, "request", return_value=None):
+            with pytest.raises(ServerProtocolError):
+                tool.invoke(str(tmpdir), filenames=["a.py"])
+    finally:
+        manager.shutdown()
+
+
+def test_slow_ping_doesnt_block_other_servers(tmpdir):
+    manager = ServerManager()
+    tool = EchoTool(mock.Mock(), manager=manager)
+    slow = manager.get(tool, str(tmpdir.mkdir("slow")))
+    pinging = threading.Event()
+
+    def slow_ping():
+        pinging.set()
+        time.sleep(1)
+        return True
+
+    try:
+        with mock.patch.object(slow, "ping", side_effect=slow_ping):
+            thread = threading.Thread(
+                target=manager.get, args=(tool, str(tmpdir.join("slow")))
+            )
+            thread.start()
+            pinging.wait()
+            start = time.monotonic()
+            manager.get(tool, str(tmpdir.mkdir("fast")))
+            assert time.monotonic() - start < 1
+            thread.join()
+    finally:
+        manager.shutdown()
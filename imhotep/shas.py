@@ -1,5 +1,5 @@
 from collections import namedtuple
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from imhotep.http_client import BasicAuthRequester
 
@@ -27,6 +27,13 @@ class PRInfo:
     def head_ref(self) -> str:
         return self.json["head"]["ref"]
 
+    @property
+    def changed_files(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        The files the PR changes, when the API that fetched it says.
+        """
+        return self.json.get("files")
+
     @property
     def has_remote_repo(self) -> bool:
         return (
@@ -52,12 +59,13 @@ def get_pr_info(
     requester: BasicAuthRequester, reponame: str, number: str, domain: str
 ) -> PRInfo:
     "Returns the PullRequest as a PRInfo object"
-    # API locations are different for non-github.com locales. https://docs.github.com/en/enterprise-server@3.2/rest/guides/getting-started-with-the-rest-api
+    api_url = get_api_url(domain)
+    resp = requester.get(f"{api_url}/repos/{reponame}/pulls/{number}")
+    return PRInfo(resp.json())
 
-    if domain == "github.com":
-        api_url = "api.%s" % domain
-    else:
-        api_url = "%s/api/v3" % domain
 
-    resp = requester.get(f"https://{api_url}/repos/{reponame}/pulls/{number}")
-    return PRInfo(resp.json())
+def get_api_url(domain: str) -> str:
+    # API locations are different for non-github.com locales. https://docs.github.com/en/enterprise-server@3.2/rest/guides/getting-started-with-the-rest-api
+    if domain == "github.com":
+        return "https://api.%s" % domain
+    return "https://%s/api/v3" % domain
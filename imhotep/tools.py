@@ -1,10 +1,62 @@
 import logging
+import os
+import shlex
 import sys
-from collections import defaultdict
-from typing import Any, Callable, Set
+from collections import defaultdict, namedtuple
+from typing import Any, Callable, Iterator, List, Set
 
 log = logging.getLogger(__name__)
 
+# Linux caps any single argument (and `sh -c` receives the whole command line
+# as one argument) at 32 pages, regardless of ARG_MAX.
+MAX_ARG_STRLEN = 128 * 1024
+
+# Room left for the environment and anything the shell adds.
+ARG_HEADROOM = 4096
+
+
+def get_arg_max() -> int:
+    """
+    Returns the longest command line we're willing to hand to the shell.
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = -1
+    if arg_max <= 0:
+        arg_max = MAX_ARG_STRLEN
+    env_size = sum(len(k) + len(v) + 2 for k, v in os.environ.items())
+    return min(arg_max - env_size, MAX_ARG_STRLEN) - ARG_HEADROOM
+
+
+def batch_arguments(arguments: List[str], max_length: int) -> Iterator[List[str]]:
+    """
+    Splits `arguments` into batches whose space-joined length stays within
+    `max_length`. An argument which is too long on its own gets a batch to
+    itself rather than being dropped.
+    """
+    batch: List[str] = []
+    length = 0
+    for arg in arguments:
+        needed = len(arg) + 1
+        if batch and length + needed > max_length:
+            yield batch
+            batch, length = [], 0
+        batch.append(arg)
+        length += needed
+    if batch:
+        yield batch
+
+
+# What one invocation of a tool needs: CPUs it keeps busy, the memory it's
+# expected to use and, optionally, a hard address-space limit (both in bytes)
+# and a timeout in seconds.
+ToolCost = namedtuple(
+    "ToolCost",
+    ("cpus", "memory", "memory_limit", "timeout"),
+    defaults=(1, 0, None, None),
+)
+
 
 class Tool:
     """
@@ -15,9 +67,15 @@ class Tool:
       eg: {'imhotep/app.py': {'103': ['line too long']}}
 
     Line numbers are indexed from 1, with the value 0 signifying a file-level
-    linting violation.
+    linting violation. A violation spanning several lines can be given as a
+    range, eg: '10-14', and is reported if any of those lines were added.
     """
 
+    # Whether the tool needs the whole repository checked out, e.g. to follow
+    # imports. Tools which only look at the files they're given can set this
+    # to False, letting --clone-free lint a PR without cloning it.
+    requires_full_tree = True
+
     def __init__(self, command_executor: Callable, filenames: Set[Any] = set()) -> None:
         self.executor = command_executor
         self.filenames = filenames
@@ -25,6 +83,13 @@ class Tool:
     def get_configs(self):
         return list()
 
+    def get_cost(self):
+        """
+        Returns a `ToolCost` describing the resources one invocation needs,
+        which is used to decide how many invocations can run at once.
+        """
+        return ToolCost()
+
     def invoke(self, dirname, filenames=set(), linter_configs=set()):
         """
         Main entrypoint for all plugins.
@@ -50,18 +115,32 @@ class Tool:
                 # extension. Different from the else-case below.
                 return {}
 
-            to_find = " -o ".join(['-samefile "%s"' % f for f in filenames])
-        else:
-            to_find = " -o ".join(
-                ['-name "*%s"' % ext for ext in self.get_file_extensions()]
-            )
-
+            command = self.get_command(dirname, linter_configs=linter_configs)
+            # We already know which files to lint, so hand them straight to
+            # the linter rather than walking the tree to find them again.
+            paths = [shlex.quote(os.path.join(dirname, f)) for f in filenames]
+            max_length = get_arg_max() - len(command) - 1
+            for batch in batch_arguments(paths, max_length):
+                cmd = "{} {}".format(command, " ".join(batch))
+                self.parse_output(dirname, self.executor(cmd), retval)
+            return retval
+
+        to_find = " -o ".join(
+            ['-name "*%s"' % ext for ext in self.get_file_extensions()]
+        )
         cmd = 'find {} -path "*/{}" | xargs {}'.format(
             dirname,
             to_find,
             self.get_command(dirname, linter_configs=linter_configs),
         )
-        result = self.executor(cmd)
+        self.parse_output(dirname, self.executor(cmd), retval)
+        return retval
+
+    def parse_output(self, dirname, result, retval):
+        """
+        Feeds each line of a linter's output through `process_line`, adding
+        any violations found to `retval`.
+        """
         if type(result) is bytes:
             result = result.decode(sys.getdefaultencoding())
         for line in result.split("\n"):
@@ -71,7 +150,6 @@ class Tool:
                 if filename.startswith(dirname):
                     filename = filename[len(dirname) + 1 :]
                 retval[filename][lineno].append(messages)
-        return retval
 
     def process_line(self, dirname, line):
         """
@@ -107,7 +185,7 @@ class Tool:
 
     def get_command(self, dirname, linter_configs=set()):
         """
-        Returns the command to run for linting. It is piped a list of files to
-        run on over stdin.
+        Returns the command to run for linting. The files to run on are
+        appended to it as arguments.
         """
         raise NotImplementedError()
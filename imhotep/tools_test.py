@@ -4,7 +4,7 @@ from unittest import mock
 import pytest
 
 from .testing_utils import calls_matching_re
-from .tools import Tool
+from .tools import Tool, batch_arguments
 
 
 class ExampleTool(Tool):
@@ -116,13 +116,58 @@ def test_process_line_no_response_format():
         t.process_line(dirname="/my/full/path", line="my line")
 
 
-def test_invoke_finds_named_files():
+def test_invoke_passes_named_files_to_command():
     m = mock.Mock()
     m.return_value = ""
     t = ExampleTool(m)
-    t.invoke("/woobie/", filenames=["foo.exe"])
+    t.invoke("/woobie", filenames=["foo.exe", "bar/baz.exe"])
 
-    assert len(calls_matching_re(m, re.compile(r'-samefile "foo\.exe"'))) > 0
+    m.assert_called_once_with("example-cmd /woobie/foo.exe /woobie/bar/baz.exe")
+
+
+def test_invoke_named_files_doesnt_walk_tree():
+    m = mock.Mock()
+    m.return_value = ""
+    t = ExampleTool(m)
+    t.invoke("/woobie", filenames=["foo.exe"])
+
+    assert len(calls_matching_re(m, re.compile(r"find "))) == 0
+
+
+def test_invoke_quotes_named_files():
+    m = mock.Mock()
+    m.return_value = ""
+    t = ExampleTool(m)
+    t.invoke("/woobie", filenames=["has space.exe"])
+
+    m.assert_called_once_with("example-cmd '/woobie/has space.exe'")
+
+
+def test_invoke_batches_named_files():
+    m = mock.Mock()
+    m.return_value = ""
+    t = ExampleTool(m)
+    filenames = ["file%d.exe" % i for i in range(10)]
+    with mock.patch("imhotep.tools.get_arg_max") as arg_max:
+        arg_max.return_value = 60
+        t.invoke("/woobie", filenames=filenames)
+
+    assert m.call_count > 1
+    passed = []
+    for call in m.call_args_list:
+        assert len(call[0][0]) <= 60
+        passed += call[0][0].split()[1:]
+    assert passed == ["/woobie/%s" % f for f in filenames]
+
+
+def test_batch_arguments():
+    batches = list(batch_arguments(["aa", "bb", "cc"], 6))
+    assert batches == [["aa", "bb"], ["cc"]]
+
+
+def test_batch_arguments__oversized_argument():
+    batches = list(batch_arguments(["a", "toolong", "b"], 4))
+    assert batches == [["a"], ["toolong"], ["b"]]
 
 
 def test_invoke_bails_out_fast_if_no_filename_matches():
@@ -0,0 +1,248 @@
+"""
+A pre-forked "zygote" server for Python API linters.
+
+The zygote imports the installed imhotep plugins, and the modules they
+declare, once. It then forks a child for each lint batch it's sent over a
+Unix socket, so the child starts with all of that already in memory, shared
+copy-on-write with the zygote. Short-lived `imhotep` runs on the same host
+can use it with `--zygote-socket`.
+
+Only the installed plugins which are `PythonApiTool`s, and any others named
+with `--tool`, are run; other paths sent over the socket are refused.
+
+Start one with:
+
+  python -m imhotep.zygote --socket /tmp/imhotep.sock
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+import pkg_resources
+
+log = logging.getLogger(__name__)
+
+# Seconds a client waits on a batch before giving up on the zygote.
+CLIENT_TIMEOUT = 600
+
+
+class ZygoteError(Exception):
+    pass
+
+
+def get_tool_path(klass) -> str:
+    return f"{klass.__module__}:{klass.__qualname__}"
+
+
+def load_tool_class(path: str):
+    module_name, _, name = path.partition(":")
+    obj: Any = importlib.import_module(module_name)
+    for attr in name.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def preload(modules: Iterable[str] = ()) -> List[str]:
+    """
+    Imports the installed linter plugins, the modules they declare in
+    `api_modules`, and any extra `modules`. Returns what was imported.
+    """
+    loaded = []
+    to_import = list(modules)
+    for ep in pkg_resources.iter_entry_points(group="imhotep_linters"):
+        try:
+            klass = ep.load()
+        except ImportError:
+            log.warning("Couldn't load plugin %s", ep)
+            continue
+        loaded.append(klass.__module__)
+        to_import.extend(getattr(klass, "api_modules", []))
+    for module in to_import:
+        try:
+            importlib.import_module(module)
+            loaded.append(module)
+        except ImportError:
+            log.warning("Couldn't import %s", module)
+    return loaded
+
+
+def get_allowed_tools(tools: Iterable[str] = ()) -> Set[str]:
+    """
+    Returns the paths of the tools the zygote will run: the installed
+    plugins which lint through the Python API, and any extra `tools`.
+    """
+    from .python_tools import PythonApiTool
+
+    allowed = set(tools)
+    for ep in pkg_resources.iter_entry_points(group="imhotep_linters"):
+        try:
+            klass = ep.load()
+        except ImportError:
+            continue
+        if isinstance(klass, type) and issubclass(klass, PythonApiTool):
+            allowed.add(get_tool_path(klass))
+    return allowed
+
+
+def load_allowed_tool(path: str, allowed: Set[str]):
+    """
+    Loads the tool class at `path`, as long as it's one we were told to run.
+    Anything that can reach the socket can send a path, so it's checked
+    before it's imported.
+    """
+    from .python_tools import PythonApiTool
+
+    if path not in allowed:
+        raise ZygoteError(f"{path} isn't a tool this zygote runs")
+    klass = load_tool_class(path)
+    if not (isinstance(klass, type) and issubclass(klass, PythonApiTool)):
+        raise ZygoteError(f"{path} isn't a PythonApiTool")
+    return klass
+
+
+def handle(conn: socket.socket, allowed: Set[str]) -> None:
+    """
+    Runs one lint batch in the forked child and writes back the results.
+    """
+    from .python_tools import run_lint
+
+    with conn.makefile("rb") as reader:
+        request = json.loads(reader.readline())
+    try:
+        klass = load_allowed_tool(request["tool"], allowed)
+        results = run_lint(
+            klass, request["dirname"], request["filenames"], request["configs"]
+        )
+        response: Dict[str, Any] = {"results": results}
+    except Exception as e:  # report anything back rather than dying silently
+        response = {"error": f"{e.__class__.__name__}: {e}"}
+    conn.sendall(json.dumps(response).encode() + b"\n")
+
+
+def serve(
+    socket_path: str, modules: Iterable[str] = (), tools: Iterable[str] = ()
+) -> None:
+    loaded = preload(modules)
+    log.info("Preloaded %s", ", ".join(loaded))
+    allowed = get_allowed_tools(tools)
+    log.info("Running %s", ", ".join(sorted(allowed)))
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(64)
+    # Let the kernel reap finished children.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    log.info("Listening on %s", socket_path)
+    try:
+        while True:
+            conn, _ = server.accept()
+            if os.fork() == 0:
+                server.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                try:
+                    handle(conn, allowed)
+                finally:
+                    conn.close()
+                    os._exit(0)
+            conn.close()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class ZygoteClient:
+    """
+    Sends lint batches to a running zygote.
+    """
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+
+    def connect(self) -> socket.socket:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(CLIENT_TIMEOUT)
+        try:
+            conn.connect(self.socket_path)
+        except OSError as e:
+            conn.close()
+            raise ZygoteError(f"Couldn't reach zygote at {self.socket_path}: {e}")
+        return conn
+
+    def is_available(self) -> bool:
+        try:
+            self.connect().close()
+        except ZygoteError:
+            return False
+        return True
+
+    def lint(
+        self,
+        klass,
+        dirname: str,
+        filenames: Sequence[str],
+        linter_configs: Sequence[str],
+    ) -> List:
+        request = {
+            "tool": get_tool_path(klass),
+            "dirname": dirname,
+            "filenames": list(filenames),
+            "configs": list(linter_configs),
+        }
+        conn = self.connect()
+        try:
+            conn.sendall(json.dumps(request).encode() + b"\n")
+            with conn.makefile("rb") as reader:
+                line = reader.readline()
+        except OSError as e:
+            raise ZygoteError(f"Zygote connection failed: {e}")
+        finally:
+            conn.close()
+        if not line:
+            raise ZygoteError("Zygote closed the connection without answering")
+        response = json.loads(line)
+        if "error" in response:
+            raise ZygoteError(response["error"])
+        return response["results"]
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="Pre-forked server for imhotep's Python API linters."
+    )
+    arg_parser.add_argument(
+        "--socket", required=True, help="Path of the Unix socket to listen on."
+    )
+    arg_parser.add_argument(
+        "--module",
+        nargs="+",
+        default=[],
+        help="Extra modules to import before forking, e.g. 'astroid'.",
+    )
+    arg_parser.add_argument(
+        "--tool",
+        nargs="+",
+        default=[],
+        help="Extra PythonApiTool classes to run besides the installed plugins,"
+        " e.g. 'mypkg.lint:MyTool'.",
+    )
+    arg_parser.add_argument("--debug", action="store_true")
+    return arg_parser.parse_args(args)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    params = parse_args(sys.argv[1:] if args is None else args)
+    logging.basicConfig(level=logging.DEBUG if params.debug else logging.INFO)
+    serve(params.socket, params.module, params.tool)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from .python_tools import PythonApiTool
+from .python_tools_test import LengthTool
+from .zygote import ZygoteClient, ZygoteError, get_tool_path, load_tool_class
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BrokenTool(PythonApiTool):
+    @classmethod
+    def lint(cls, dirname, filenames, linter_configs):
+        raise ValueError("broken")
+
+
+class Marker:
+    """Not a tool, but leaves a file behind if it's ever run."""
+
+    @classmethod
+    def lint(cls, dirname, filenames, linter_configs):
+        open(os.path.join(dirname, "ran"), "w").close()
+        return []
+
+
+class UnlistedMarker(Marker):
+    pass
+
+
+@pytest.fixture
+def zygote(tmpdir):
+    socket_path = str(tmpdir.join("z.sock"))
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "imhotep.zygote",
+            "--socket",
+            socket_path,
+            "--tool",
+            get_tool_path(LengthTool),
+            get_tool_path(BrokenTool),
+            get_tool_path(Marker),
+        ],
+        cwd=root,
+    )
+    client = ZygoteClient(socket_path)
+    for _ in range(100):
+        if client.is_available():
+            break
+        time.sleep(0.05)
+    try:
+        yield client, process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_tool_path_round_trip():
+    assert get_tool_path(LengthTool) == "imhotep.python_tools_test:LengthTool"
+    assert load_tool_class(get_tool_path(LengthTool)) is LengthTool
+
+
+def test_lint_in_forked_child(zygote):
+    client, process = zygote
+    first = client.lint(LengthTool, "/woobie", ["a.py"], [])
+    second = client.lint(LengthTool, "/woobie", ["a.py"], [])
+
+    assert first[0][:2] == ["/woobie/a.py", 1]
+    pids = {int(r[2].split()[-1]) for r in first + second}
+    assert process.pid not in pids
+    assert len(pids) == 2
+
+
+def test_lint_reports_errors(zygote):
+    client, _ = zygote
+    with pytest.raises(ZygoteError, match="ValueError: broken"):
+        client.lint(BrokenTool, "/woobie", ["a.py"], [])
+
+
+def test_refuses_unlisted_paths(zygote, tmpdir):
+    client, _ = zygote
+    with pytest.raises(ZygoteError, match="isn't a tool this zygote runs"):
+        client.lint(UnlistedMarker, str(tmpdir), ["a.py"], [])
+    assert not tmpdir.join("ran").exists()
+
+
+def test_refuses_listed_non_tools(zygote, tmpdir):
+    client, _ = zygote
+    with pytest.raises(ZygoteError, match="isn't a PythonApiTool"):
+        client.lint(Marker, str(tmpdir), ["a.py"], [])
+    assert not tmpdir.join("ran").exists()
+
+
+def test_unavailable(tmpdir):
+    client = ZygoteClient(str(tmpdir.join("missing.sock")))
+    assert not client.is_available()
+    with pytest.raises(ZygoteError):
+        client.lint(LengthTool, "/woobie", ["a.py"], [])
@@ -18,6 +18,8 @@ setup(
     entry_points={
         "console_scripts": [
             "imhotep = imhotep.main:main",
+            "imhotep-zygote = imhotep.zygote:main",
+            "imhotep-benchmark = imhotep.benchmark:main",
         ],
     },
     classifiers=[